@@ -48,6 +48,28 @@ const FlashcardRes = z.object({
     .optional(),
 });
 
+const FlashcardCard = z.object({
+  concept: z.string(),
+  question: z.string(),
+  answer: z.string(),
+});
+
+const FlashcardBatchReq = z.object({
+  concepts: z.array(z.string()).min(1),
+  user_id: z.number().optional(),
+});
+const FlashcardBatchRes = z.object({
+  cards: z.record(z.string(), FlashcardCard),
+  missing: z.array(z.string()),
+});
+const RelatedFlashcardsRes = z.object({
+  related: z.record(
+    z.string(),
+    z.array(FlashcardCard.extend({ score: z.number() })),
+  ),
+  k: z.number(),
+});
+
 async function http(
   path: string,
   init: RequestInit & { timeoutMs?: number } = {},
@@ -181,4 +203,33 @@ export const pythonApi = {
     const json = await res.json();
     return FlashcardRes.parse(json);
   },
+
+  retrieveFlashcards: async (concepts: string[], user_id?: number) => {
+    const body = FlashcardBatchReq.parse({ concepts, user_id });
+    const res = await withRetries(() =>
+      http("/flashcards/batch", {
+        method: "POST",
+        body: JSON.stringify(body),
+      }),
+    );
+    if (!res.ok) {
+      throw new Error(`flashcards/batch failed: ${res.status}`);
+    }
+    const json = await res.json();
+    return FlashcardBatchRes.parse(json);
+  },
+
+  relatedFlashcards: async (concept: string, k?: number) => {
+    const kParam = k ? `&k=${k}` : "";
+    const res = await withRetries(() =>
+      http(`/flashcards/related?concept=${encodeURIComponent(concept)}${kParam}`, {
+        method: "GET",
+      }),
+    );
+    if (!res.ok) {
+      throw new Error(`flashcards/related failed: ${res.status}`);
+    }
+    const json = await res.json();
+    return RelatedFlashcardsRes.parse(json);
+  },
 };
@@ -2,6 +2,8 @@ import { McpServer } from "@modelcontextprotocol/sdk/server/mcp.js";
 import type * as zod from "zod/v4";
 // import { registerSummarizeDialogueTool } from "./depreciated/summarizeDialogueTool.js";
 import { registerRetrieveFlashcardTool } from "./tools/retrieveFlashcardTool.js";
+import { registerRetrieveFlashcardsTool } from "./tools/retrieveFlashcardsTool.js";
+import { registerRelatedFlashcardsTool } from "./tools/relatedFlashcardsTool.js";
 import { registerStartDialogueSummaryTool } from "./tools/startDialogueSummaryTool.js";
 import { registerQuerySummaryTool } from "./tools/querySummaryTool.js";
 import { registerWaitSummaryTool } from "./tools/waitSummaryTool.js";
@@ -16,6 +18,8 @@ export function createServer(z: typeof zod): McpServer {
   registerQuerySummaryTool(server, z);
   registerWaitSummaryTool(server, z);
   registerRetrieveFlashcardTool(server, z);
+  registerRetrieveFlashcardsTool(server, z);
+  registerRelatedFlashcardsTool(server, z);
 
   return server;
 }
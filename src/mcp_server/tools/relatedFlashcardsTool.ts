@@ -0,0 +1,52 @@
+import { McpServer } from "@modelcontextprotocol/sdk/server/mcp.js";
+import type * as zod from "zod/v4";
+import { pythonApi } from "../clients/pythonApi.js";
+
+export function registerRelatedFlashcardsTool(
+  server: McpServer,
+  z: typeof zod,
+) {
+  server.registerTool(
+    "related_flashcards",
+    {
+      title: "Related flashcards",
+      description:
+        "Find existing flashcards on topics similar to a concept, e.g. to suggest what to study next.",
+      inputSchema: {
+        concept: z.string(),
+        k: z.number().int().min(1).max(100).optional(),
+      },
+      outputSchema: {
+        cards: z.array(
+          z.object({
+            concept: z.string(),
+            question: z.string(),
+            answer: z.string(),
+            score: z.number(),
+          }),
+        ),
+      },
+    },
+    async ({ concept: raw, k }: { concept: string; k?: number }) => {
+      // The API strips concepts and keys its results by the stripped form
+      const concept = raw.trim();
+      const res = await pythonApi.relatedFlashcards(concept, k);
+      const cards = res.related[concept] ?? [];
+
+      const text =
+        cards.length === 0
+          ? `No flashcards related to "${concept}".`
+          : cards
+              .map(
+                (card) =>
+                  `Flashcard for "${card.concept}" (similarity ${card.score.toFixed(2)}):\nQ: ${card.question}\nA: ${card.answer}`,
+              )
+              .join("\n\n");
+
+      return {
+        content: [{ type: "text", text }],
+        structuredContent: { cards },
+      };
+    },
+  );
+}
@@ -0,0 +1,50 @@
+import { McpServer } from "@modelcontextprotocol/sdk/server/mcp.js";
+import type * as zod from "zod/v4";
+import { pythonApi } from "../clients/pythonApi.js";
+
+export function registerRetrieveFlashcardsTool(
+  server: McpServer,
+  z: typeof zod,
+) {
+  server.registerTool(
+    "retrieve_flashcards",
+    {
+      title: "Retrieve flashcards",
+      description:
+        "Retrieve flashcards for several concepts in one request, e.g. a whole study set.",
+      inputSchema: {
+        concepts: z.array(z.string()).min(1),
+        user_id: z.number().optional(),
+      },
+      outputSchema: {
+        cards: z.array(
+          z.object({
+            concept: z.string(),
+            question: z.string(),
+            answer: z.string(),
+          }),
+        ),
+        missing: z.array(z.string()),
+      },
+    },
+    async ({ concepts, user_id }: { concepts: string[]; user_id?: number }) => {
+      const res = await pythonApi.retrieveFlashcards(concepts, user_id);
+      const cards = Object.values(res.cards);
+
+      const lines = cards.map(
+        (card) => `Flashcard for "${card.concept}":\nQ: ${card.question}\nA: ${card.answer}`,
+      );
+      if (res.missing.length > 0) {
+        lines.push(`No flashcard found for: ${res.missing.join(", ")}.`);
+      }
+
+      return {
+        content: [{ type: "text", text: lines.join("\n\n") }],
+        structuredContent: {
+          cards,
+          missing: res.missing,
+        },
+      };
+    },
+  );
+}
@@ -1,9 +1,10 @@
 import atexit
 from flask import Flask
 from .api.v1 import bp as v1_bp
+from .api.admin import bp as admin_bp
 from .config import load_config
 from .logging import configure_logging
-from .domain.summarization.task_manager import task_manager
+from .domain.summarization.task_manager import get_task_manager, shutdown_task_manager
 
 
 def create_app() -> Flask:
@@ -11,12 +12,28 @@ def create_app() -> Flask:
     load_config(app)
     configure_logging(app)
     app.register_blueprint(v1_bp)
+    app.register_blueprint(admin_bp)
 
     @atexit.register
     def cleanup_task_manager():
         try:
-            task_manager.shutdown()
+            shutdown_task_manager()
         except Exception:
             pass
 
     return app
+
+
+def warm_up() -> None:
+    """
+    Import the summarization pipeline (the openai SDK and its pydantic
+    models), the flashcard store and the related-concept index (numpy), and
+    start this process's task manager.
+
+    Importing the app only loads what routing needs; gunicorn calls this in
+    each worker right after fork (see gunicorn.conf.py) so the cost is paid
+    before the first request instead of on it.
+    """
+    from .domain.summarization import cli  # noqa: F401
+    from .domain.flashcard import store, related  # noqa: F401
+    get_task_manager()
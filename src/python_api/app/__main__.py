@@ -0,0 +1,101 @@
+"""
+Development entry point.
+
+    python -m app                    # run the Flask dev server
+    python -m app --import-profile   # report cold-start import and boot time
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+# Runs in a fresh interpreter so nothing is already cached in sys.modules
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app.wsgi
+imported = time.perf_counter()
+heavy = [m for m in ("openai", "pydantic", "numpy") if m in sys.modules]
+from app import warm_up
+warm_up()
+warmed = time.perf_counter()
+sys.stdout.write(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "warm_up_ms": (warmed - imported) * 1000,
+    "heavy_after_import": heavy,
+}))
+"""
+
+
+def _parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """Rows of (module, self_us, cumulative_us, depth) from -X importtime."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def import_profile(top: int = 15) -> int:
+    env = dict(os.environ)
+    # Never replay (and resume) journaled tasks from a profiling run
+    env["TASK_JOURNAL_PATH"] = ""
+    env.setdefault("OPENAI_API_KEY", "import-profile")
+    probe = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env, capture_output=True, text=True,
+    )
+    if probe.returncode != 0:
+        sys.stderr.write(probe.stderr[-4000:])
+        return probe.returncode
+
+    timings = json.loads(probe.stdout.strip().splitlines()[-1])
+    rows = _parse_importtime(probe.stderr)
+
+    by_package: Dict[str, int] = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+
+    print(f"import app.wsgi   {timings['import_ms']:8.1f} ms")
+    print(f"warm_up()         {timings['warm_up_ms']:8.1f} ms")
+    print(f"total boot        {timings['import_ms'] + timings['warm_up_ms']:8.1f} ms")
+    print("heavy modules loaded by the import: "
+          + (", ".join(timings["heavy_after_import"]) or "none"))
+    print()
+    print(f"Top {top} packages by import time:")
+    for package, self_us in sorted(by_package.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"  {self_us / 1000:8.1f} ms  {package}")
+    print()
+    print(f"Top {top} modules by cumulative import time:")
+    for name, _, cumulative_us, depth in sorted(rows, key=lambda r: -r[2])[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {'  ' * depth}{name}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m app")
+    parser.add_argument("--import-profile", action="store_true",
+                        help="measure import and warm-up time in a fresh interpreter")
+    parser.add_argument("--top", type=int, default=15,
+                        help="rows per section of the import profile")
+    args = parser.parse_args()
+
+    if args.import_profile:
+        return import_profile(args.top)
+
+    from . import create_app, warm_up
+    app = create_app()
+    warm_up()
+    app.run(host=app.config["APP_HOST"], port=app.config["APP_PORT"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import hmac
+import math
+import time
+from flask import Blueprint, Response, request, jsonify, current_app
+from .. import profiling
+
+bp = Blueprint("admin", __name__, url_prefix="/api/v1/admin")
+
+
+@bp.before_request
+def _require_admin():
+    # Disabled endpoints look absent rather than forbidden
+    if not current_app.config.get("PROFILING_ENABLED") or not current_app.config.get("ADMIN_TOKEN"):
+        return jsonify({"error": "NotFound", "requestId": request.id}), 404
+    supplied = request.headers.get("X-Admin-Token", "")
+    if not hmac.compare_digest(supplied, current_app.config["ADMIN_TOKEN"]):
+        return jsonify({"error": "Unauthorized", "requestId": request.id}), 401
+    return None
+
+
+def _number_arg(name: str, default, low, high, kind=float):
+    """Query parameter `name` as `kind`, clamped to [low, high]; ValueError if malformed."""
+    raw = request.args.get(name)
+    if raw is None:
+        return default
+    try:
+        value = kind(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be {'an integer' if kind is int else 'a number'}") from None
+    if not math.isfinite(value):
+        raise ValueError(f"{name} must be a finite number")
+    return min(max(value, low), high)
+
+
+def _seconds(default: float):
+    max_seconds = current_app.config.get("PROFILING_MAX_SECONDS", 30)
+    return _number_arg("seconds", min(default, max_seconds), 0.1, max_seconds)
+
+
+def _bad_request(message: str):
+    return (
+        jsonify(
+            {
+                "error": "BadRequest",
+                "message": message,
+                "requestId": request.id,
+            }
+        ),
+        400,
+    )
+
+
+def _busy():
+    return (
+        jsonify(
+            {
+                "error": "Conflict",
+                "message": "another profile is already running",
+                "requestId": request.id,
+            }
+        ),
+        409,
+    )
+
+
+@bp.route("/profile/cpu", methods=["GET"])
+def profile_cpu():
+    """
+    Sample all threads for ?seconds= (default 5) every ?interval_ms= (default 10).
+
+    Returns collapsed stacks as text/plain, ready for flamegraph.pl or speedscope.
+    """
+    print(f'CPU Profile at Time {time.time()}')
+    try:
+        seconds = _seconds(5)
+        interval = _number_arg("interval_ms", 10, 1, 1000) / 1000
+    except ValueError as e:
+        return _bad_request(str(e))
+    if not profiling.profile_lock.acquire(blocking=False):
+        return _busy()
+    try:
+        counts = profiling.sample_stacks(seconds, interval)
+    finally:
+        profiling.profile_lock.release()
+    return Response(profiling.collapsed(counts), mimetype="text/plain")
+
+
+@bp.route("/profile/memory", methods=["GET"])
+def profile_memory():
+    """Top allocation growth over ?seconds= (default 10), ?top= rows, ?frames= deep."""
+    print(f'Memory Profile at Time {time.time()}')
+    try:
+        seconds = _seconds(10)
+        top = _number_arg("top", 25, 1, 200, int)
+        frames = _number_arg("frames", 1, 1, 25, int)
+    except ValueError as e:
+        return _bad_request(str(e))
+    if not profiling.profile_lock.acquire(blocking=False):
+        return _busy()
+    try:
+        report = profiling.allocation_diff(seconds, top, frames)
+    finally:
+        profiling.profile_lock.release()
+    return jsonify(report), 200
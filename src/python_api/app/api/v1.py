@@ -1,8 +1,15 @@
+import math
+import threading
 from uuid import uuid4
-from flask import Blueprint, request, jsonify, current_app
-from ..domain.summarization.cli import summarize_dialogue
-from ..domain.flashcard.cli import retrieve_flashcard
-from ..domain.summarization.task_manager import task_manager
+from flask import Blueprint, Response, g, request, jsonify, current_app, stream_with_context
+from ..domain.history.cli import stream_user_dialogues, stream_user_flashcards
+from ..domain.summarization.task_manager import get_task_manager
+from ..domain.summarization.resilience import llm_caller
+from ..domain.summarization.batching import llm_batcher
+from ..domain.summarization.ratelimit import rate_limiter
+from ..domain.summarization.singleflight import flashcard_flight
+from ..domain.summarization.prefix_cache import prefix_cache
+from ..tracing import tracer
 import time
 bp = Blueprint("v1", __name__, url_prefix="/api/v1")
 
@@ -15,16 +22,97 @@ def _require_auth() -> bool:
     return auth == f"Bearer {token}"
 
 
+_long_poll_lock = threading.Lock()
+
+
+def _long_poll_slots() -> threading.BoundedSemaphore:
+    """Per-app semaphore bounding how many requests may park in long-polls."""
+    with _long_poll_lock:
+        slots = current_app.extensions.get("long_poll_slots")
+        if slots is None:
+            slots = threading.BoundedSemaphore(
+                current_app.config.get("LONG_POLL_MAX_CONCURRENT", 24))
+            current_app.extensions["long_poll_slots"] = slots
+        return slots
+
+
+def _not_modified(etag: str):
+    """304 response when the client already holds this version, else None."""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def _with_etag(response: Response, etag: str) -> Response:
+    # Clients may keep the body but must revalidate it on every use
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
 @bp.before_app_request
 def _inject_request_id() -> None:
     if not hasattr(request, "id"):
         request.id = request.headers.get("X-Request-Id") or str(uuid4())
 
 
+# Polling and introspection endpoints would flush task traces out of the
+# bounded collector without telling us anything new
+_UNTRACED_ENDPOINTS = {
+    "v1.health", "v1.metrics", "v1.query_summary", "v1.wait_summary",
+    "v1.recent_traces", "v1.get_trace",
+}
+
+
+@bp.before_app_request
+def _start_http_span() -> None:
+    if request.endpoint in _UNTRACED_ENDPOINTS:
+        return
+    # The request id doubles as trace id, so tasks started here share it
+    g.http_span = tracer.start_span(
+        f"http {request.method} {request.url_rule.rule if request.url_rule else request.path}",
+        trace_id=request.id, method=request.method, path=request.path)
+
+
+@bp.after_app_request
+def _tag_http_span(response: Response) -> Response:
+    if "http_span" in g:
+        g.http_span[0].set(status_code=response.status_code)
+    response.headers.setdefault("X-Request-Id", request.id)
+    return response
+
+
+@bp.teardown_app_request
+def _end_http_span(error) -> None:
+    # Runs after streamed bodies finish, so the span covers the whole response
+    http_span = g.pop("http_span", None)
+    if http_span is not None:
+        tracer.end_span(*http_span, error=error)
+
+
 @bp.route("/health", methods=["GET"])
 def health():
     return jsonify({"ok": True}), 200
 
+
+@bp.route("/metrics", methods=["GET"])
+def metrics():
+    if not _require_auth():
+        return jsonify({"error": "Unauthorized", "requestId": request.id}), 401
+
+    from ..domain.summarization.neighbors import get_neighbor_stats
+    return jsonify({
+        "llm_calls": llm_caller.get_stats(),
+        "rate_limiter": rate_limiter.get_stats(),
+        "tasks": get_task_manager().get_metrics(),
+        "flashcard_generation": flashcard_flight.get_stats(),
+        "prefix_cache": prefix_cache.get_stats(),
+        "llm_batching": llm_batcher.get_stats(),
+        "latent_neighbors": get_neighbor_stats(),
+    }), 200
+
 # @bp.route("/summarize-dialogue", methods=["POST"])
 # def summarize_dialogue_route():
 #     print(f'Summary Pass at Time {time.time()}')
@@ -40,6 +128,40 @@ def health():
 #     return jsonify({"summary": summary}), 200
 
 
+@bp.route("/traces", methods=["GET"])
+def recent_traces():
+    """Most recent traces held by this worker."""
+    if not _require_auth():
+        return jsonify({"error": "Unauthorized", "requestId": request.id}), 401
+
+    try:
+        limit = min(max(int(request.args.get("limit", 20)), 1), 200)
+    except ValueError:
+        return _bad_request("limit must be an integer")
+    return jsonify({"traces": tracer.collector.recent(limit)}), 200
+
+
+@bp.route("/traces/<trace_id>", methods=["GET"])
+def get_trace(trace_id: str):
+    """Spans and latency breakdown of one trace, by trace (request) id or task id."""
+    if not _require_auth():
+        return jsonify({"error": "Unauthorized", "requestId": request.id}), 401
+
+    trace = tracer.collector.get_trace(trace_id)
+    if trace is None:
+        return (
+            jsonify(
+                {
+                    "error": "NotFound",
+                    "message": f"Trace {trace_id} not found",
+                    "requestId": request.id,
+                }
+            ),
+            404,
+        )
+    return jsonify(trace), 200
+
+
 @bp.route("/start-dialogue-summary", methods=["POST"])
 def start_dialogue_summary():
     """Start asynchronous dialogue summarization and return task_id immediately."""
@@ -51,6 +173,8 @@ def start_dialogue_summary():
     data = request.get_json(force=True) or {}
     dialogue = data.get("dialogue") or []
     user_id = data.get("user_id", 0)
+    latency_budget = data.get(
+        "latency_budget", current_app.config.get("TASK_LATENCY_BUDGET"))
 
     if not dialogue:
         return (
@@ -64,6 +188,14 @@ def start_dialogue_summary():
             400,
         )
 
+    if latency_budget is not None:
+        try:
+            latency_budget = float(latency_budget)
+        except (TypeError, ValueError):
+            return _bad_request("latency_budget must be a number of seconds")
+        if not math.isfinite(latency_budget) or latency_budget <= 0:
+            return _bad_request("latency_budget must be a positive number of seconds")
+
     # Get CSV paths from config
     dialogue_csv = current_app.config.get(
         "DIALOGUES_CSV", "../../data/dialogues.csv")
@@ -71,11 +203,12 @@ def start_dialogue_summary():
         "FLASHCARDS_CSV", "../../data/flashcards.csv")
 
     # Create and start the async task
-    task_id = task_manager.create_task(
+    task_id = get_task_manager().create_task(
         dialogue=dialogue,
         user_id=user_id,
         dialogue_csv_path=dialogue_csv,
-        flashcards_csv_path=flashcards_csv
+        flashcards_csv_path=flashcards_csv,
+        latency_budget=latency_budget
     )
 
     return jsonify({"task_id": task_id, "requestId": request.id}), 202
@@ -83,13 +216,30 @@ def start_dialogue_summary():
 
 @bp.route("/query-summary/<task_id>", methods=["GET"])
 def query_summary(task_id: str):
-    """Query the current status and progress of a summarization task."""
+    """
+    Query the current status and progress of a summarization task.
+
+    Honours If-None-Match against the task's version (304 when unchanged)
+    and ?since=<progress_count> to return only newer progress entries.
+    """
     print(f'Query Summary Task {task_id} at Time {time.time()}')
 
     if not _require_auth():
         return jsonify({"error": "Unauthorized", "requestId": request.id}), 401
 
-    task_status = task_manager.get_task_status(task_id)
+    try:
+        since = max(int(request.args.get("since", 0)), 0)
+    except ValueError:
+        return _bad_request("since must be an integer")
+
+    manager = get_task_manager()
+    version = manager.get_task_version(task_id)
+    if version is not None:
+        not_modified = _not_modified(version)
+        if not_modified is not None:
+            return not_modified
+
+    task_status = manager.get_task_status(task_id, since)
 
     if task_status is None:
         return (
@@ -103,7 +253,7 @@ def query_summary(task_id: str):
             404,
         )
 
-    return jsonify(task_status), 200
+    return _with_etag(jsonify(task_status), task_status["version"]), 200
 
 
 @bp.route("/wait-summary/<task_id>", methods=["GET"])
@@ -115,9 +265,19 @@ def wait_summary(task_id: str):
         return jsonify({"error": "Unauthorized", "requestId": request.id}), 401
 
     # Get timeout from query parameter, default to 300 seconds (5 minutes)
-    timeout = min(int(request.args.get("timeout", 300)), 600)  # Max 10 minutes
-
-    task_status = task_manager.wait_for_completion(task_id, timeout)
+    max_timeout = current_app.config.get("LONG_POLL_MAX_TIMEOUT", 600)
+    timeout = min(int(request.args.get("timeout", 300)), max_timeout)
+
+    # When every long-poll slot is taken, answer with the current status
+    # instead of parking another thread; the client simply polls again.
+    slots = _long_poll_slots()
+    if slots.acquire(blocking=False):
+        try:
+            task_status = get_task_manager().wait_for_completion(task_id, timeout)
+        finally:
+            slots.release()
+    else:
+        task_status = get_task_manager().get_task_status(task_id)
 
     if task_status is None:
         return (
@@ -152,14 +312,227 @@ def retrieve_flashcard_route():
             ),
             400,
         )
-    card = retrieve_flashcard(concept)
+    # numpy-backed store; already loaded by warm_up() in served workers
+    from ..domain.flashcard.cli import retrieve_flashcard, flashcards_etag
+    flashcards_csv = current_app.config["FLASHCARDS_CSV"]
+    etag = flashcards_etag(flashcards_csv)
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
+    card = retrieve_flashcard(concept, flashcards_csv)
     if not card:
-        return jsonify({
+        return _with_etag(jsonify({
             "found": False,
             "card": None,
-        }), 200
+        }), etag), 200
 
-    return jsonify({
+    return _with_etag(jsonify({
         "found": True,
         "card": card,
-    }), 200
+    }), etag), 200
+
+
+@bp.route("/flashcards/batch", methods=["GET", "POST"])
+def retrieve_flashcards_batch_route():
+    """Resolve many concepts at once (repeated ?concept= or JSON body)."""
+    print(f'Flashcard Batch Pass at Time {time.time()}')
+    if not _require_auth():
+        return jsonify({"error": "Unauthorized", "requestId": request.id}), 401
+
+    if request.method == "POST":
+        data = request.get_json(force=True) or {}
+        concepts = data.get("concepts") or []
+        user_id = data.get("user_id")
+    else:
+        concepts = request.args.getlist("concept")
+        user_id = request.args.get("user_id")
+
+    concepts = [c.strip() for c in concepts if isinstance(c, str) and c.strip()]
+    if not concepts:
+        return (
+            jsonify(
+                {
+                    "error": "BadRequest",
+                    "message": "at least one concept is required",
+                    "requestId": request.id,
+                }
+            ),
+            400,
+        )
+
+    max_batch = current_app.config.get("FLASHCARDS_BATCH_MAX", 500)
+    if len(concepts) > max_batch:
+        return (
+            jsonify(
+                {
+                    "error": "BadRequest",
+                    "message": f"at most {max_batch} concepts per request",
+                    "requestId": request.id,
+                }
+            ),
+            400,
+        )
+
+    from ..domain.flashcard.cli import retrieve_flashcards, flashcards_etag
+    flashcards_csv = current_app.config["FLASHCARDS_CSV"]
+    # Only GET is cacheable; the body of a POST is not part of the URL
+    etag = flashcards_etag(flashcards_csv) if request.method == "GET" else None
+    if etag is not None:
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+
+    cards = retrieve_flashcards(concepts, flashcards_csv, user_id)
+
+    response = jsonify({
+        "cards": cards,
+        "missing": [c for c in dict.fromkeys(concepts) if c not in cards],
+    })
+    return (_with_etag(response, etag) if etag else response), 200
+
+
+@bp.route("/flashcards/related", methods=["GET"])
+def related_flashcards_route():
+    """Cards most similar to one or more concepts (repeated ?concept=, ?k=)."""
+    print(f'Related Flashcards Pass at Time {time.time()}')
+    if not _require_auth():
+        return jsonify({"error": "Unauthorized", "requestId": request.id}), 401
+
+    concepts = [c.strip() for c in request.args.getlist("concept") if c.strip()]
+    if not concepts:
+        return _bad_request("concept query parameter is required")
+    max_batch = current_app.config.get("FLASHCARDS_BATCH_MAX", 500)
+    if len(concepts) > max_batch:
+        return _bad_request(f"at most {max_batch} concepts per request")
+    try:
+        k = int(request.args.get("k", 10))
+    except ValueError:
+        return _bad_request("k must be an integer")
+    k = min(max(k, 1), 100)
+
+    from ..domain.flashcard.cli import flashcards_etag
+    from ..domain.flashcard.related import get_related_index
+    flashcards_csv = current_app.config["FLASHCARDS_CSV"]
+    etag = flashcards_etag(flashcards_csv)
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
+    related = get_related_index(flashcards_csv).related(list(dict.fromkeys(concepts)), k)
+    return _with_etag(jsonify({"related": related, "k": k}), etag), 200
+
+
+def _page_args():
+    """Parse cursor/limit/order query params shared by history endpoints."""
+    limit = min(max(int(request.args.get("limit", 50)), 1), 500)
+    descending = request.args.get("order", "desc").lower() != "asc"
+    return request.args.get("cursor"), limit, descending
+
+
+def _bad_request(message: str):
+    return (
+        jsonify(
+            {
+                "error": "BadRequest",
+                "message": message,
+                "requestId": request.id,
+            }
+        ),
+        400,
+    )
+
+
+@bp.route("/users/<user_id>/flashcards", methods=["GET"])
+def user_flashcards(user_id: str):
+    """Page through a user's flashcards, streamed as JSON."""
+    print(f'User Flashcards {user_id} at Time {time.time()}')
+    if not _require_auth():
+        return jsonify({"error": "Unauthorized", "requestId": request.id}), 401
+
+    try:
+        cursor, limit, descending = _page_args()
+        chunks = stream_user_flashcards(
+            user_id, current_app.config["FLASHCARDS_CSV"], cursor, limit, descending)
+    except ValueError as e:
+        return _bad_request(str(e))
+
+    return Response(stream_with_context(chunks), mimetype="application/json")
+
+
+@bp.route("/users/<user_id>/dialogues", methods=["GET"])
+def user_dialogues(user_id: str):
+    """Page through a user's analyzed dialogues, streamed as JSON."""
+    print(f'User Dialogues {user_id} at Time {time.time()}')
+    if not _require_auth():
+        return jsonify({"error": "Unauthorized", "requestId": request.id}), 401
+
+    include_dialogue = request.args.get(
+        "include_dialogue", "true").lower() != "false"
+    try:
+        cursor, limit, descending = _page_args()
+        chunks = stream_user_dialogues(
+            user_id, current_app.config["DIALOGUES_CSV"], cursor, limit, descending,
+            include_dialogue)
+    except ValueError as e:
+        return _bad_request(str(e))
+
+    return Response(stream_with_context(chunks), mimetype="application/json")
+
+
+@bp.route("/users/<user_id>/review/next", methods=["GET"])
+def next_review(user_id: str):
+    """The user's card with the earliest review due date."""
+    print(f'Next Review {user_id} at Time {time.time()}')
+    if not _require_auth():
+        return jsonify({"error": "Unauthorized", "requestId": request.id}), 401
+
+    from ..domain.review.scheduler import get_review_scheduler
+    card = get_review_scheduler(current_app.config["FLASHCARDS_CSV"]).next_card(user_id)
+    return jsonify({"found": card is not None, "card": card}), 200
+
+
+@bp.route("/users/<user_id>/review/<card>", methods=["POST"])
+def record_review(user_id: str, card: str):
+    """Record an answer (JSON {"quality": 0-5}) and reschedule the card."""
+    print(f'Record Review {user_id} at Time {time.time()}')
+    if not _require_auth():
+        return jsonify({"error": "Unauthorized", "requestId": request.id}), 401
+
+    data = request.get_json(silent=True) or {}
+    quality = data.get("quality")
+    if isinstance(quality, bool) or not isinstance(quality, int) or not 0 <= quality <= 5:
+        return _bad_request("quality must be an integer between 0 and 5")
+
+    from ..domain.review.scheduler import get_review_scheduler
+    reviewed = get_review_scheduler(current_app.config["FLASHCARDS_CSV"]).record_answer(
+        user_id, card, quality)
+    if reviewed is None:
+        return (
+            jsonify(
+                {
+                    "error": "NotFound",
+                    "message": f"user {user_id} has no card '{card}'",
+                    "requestId": request.id,
+                }
+            ),
+            404,
+        )
+    return jsonify({"card": reviewed}), 200
+
+
+@bp.route("/users/<user_id>/gaps", methods=["GET"])
+def user_gaps(user_id: str):
+    """A user's most frequently extracted latent concepts (?k=, default 10)."""
+    print(f'User Gaps {user_id} at Time {time.time()}')
+    if not _require_auth():
+        return jsonify({"error": "Unauthorized", "requestId": request.id}), 401
+
+    try:
+        k = min(max(int(request.args.get("k", 10)), 1), 100)
+    except ValueError:
+        return _bad_request("k must be an integer")
+
+    from ..domain.history.gaps import get_latent_aggregates
+    gaps = get_latent_aggregates(current_app.config["DIALOGUES_CSV"]).get_user_gaps(user_id, k)
+    return jsonify(gaps), 200
@@ -15,3 +15,28 @@ def load_config(app: Flask) -> None:
         "FLASHCARDS_CSV", default_flashcards_csv)
     app.config["DIALOGUES_CSV"] = os.getenv(
         "DIALOGUES_CSV", default_dialogues_csv)
+
+    # Long-poll limits: at most LONG_POLL_MAX_CONCURRENT requests may park in
+    # /wait-summary; keep it below GUNICORN_THREADS so short endpoints always
+    # have a free thread.
+    app.config["LONG_POLL_MAX_CONCURRENT"] = int(
+        os.getenv("LONG_POLL_MAX_CONCURRENT", "24"))
+    app.config["LONG_POLL_MAX_TIMEOUT"] = int(
+        os.getenv("LONG_POLL_MAX_TIMEOUT", "600"))
+
+    # Default per-task latency budget (seconds) for the refinement loop;
+    # clients may override it per request with "latency_budget".
+    app.config["TASK_LATENCY_BUDGET"] = float(
+        os.getenv("TASK_LATENCY_BUDGET", "180"))
+
+    # Upper bound on concepts resolved by one /flashcards/batch request
+    app.config["FLASHCARDS_BATCH_MAX"] = int(
+        os.getenv("FLASHCARDS_BATCH_MAX", "500"))
+
+    # Admin profiling endpoints (/api/v1/admin/profile/*). Off unless enabled
+    # and ADMIN_TOKEN is set; callers send it as X-Admin-Token.
+    app.config["PROFILING_ENABLED"] = os.getenv(
+        "PROFILING_ENABLED", "0") == "1"
+    app.config["ADMIN_TOKEN"] = os.getenv("ADMIN_TOKEN")
+    app.config["PROFILING_MAX_SECONDS"] = float(
+        os.getenv("PROFILING_MAX_SECONDS", "30"))
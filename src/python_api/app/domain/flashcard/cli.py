@@ -1,6 +1,8 @@
 from __future__ import annotations
-from typing import Optional, Dict
-import pandas as pd
+from typing import Optional, Dict, Iterable
+
+from .concepts import get_concept_registry
+from .store import get_flashcard_store
 
 
 class FlashCard:
@@ -10,14 +12,47 @@ class FlashCard:
         self.answer = answer
 
 
-def retrieve_flashcard(concept: str, flashcards_csv_path="../../data/flashcards.csv",):
-    flashcards_df = pd.read_csv(flashcards_csv_path)
-    card_row = flashcards_df[flashcards_df["concept"] == concept]
-    if not card_row.empty:
-        row = card_row.iloc[0]
-        return {
-            "concept": row["concept"],
-            "question": row["question"],
-            "answer": row["answer"],
-        }
-    return None
+def retrieve_flashcard(concept: str, flashcards_csv_path="../../data/flashcards.csv",) -> Optional[Dict]:
+    """
+    Card for a concept, falling back to its canonical near-duplicate
+    (e.g. "variance_and_expectation" finds "mean_and_variance").
+    """
+    store = get_flashcard_store(flashcards_csv_path)
+    card = store.get(concept)
+    if card is None:
+        canonical = get_concept_registry(flashcards_csv_path).canonicalize(concept)
+        if canonical != concept:
+            card = store.get(canonical)
+    return card
+
+
+def retrieve_flashcards(
+    concepts: Iterable[str],
+    flashcards_csv_path="../../data/flashcards.csv",
+    user_id=None,
+) -> Dict[str, Dict]:
+    """
+    Resolve many concepts against one snapshot of the card store.
+
+    Returns a {concept: card} dict holding the first card for each concept
+    that was found, directly or through its canonical near-duplicate;
+    concepts without a card are simply absent.
+    """
+    store = get_flashcard_store(flashcards_csv_path)
+    concepts = list(dict.fromkeys(concepts))
+    cards = store.get_many(concepts, user_id)
+    missing = [c for c in concepts if c not in cards]
+    if missing:
+        registry = get_concept_registry(flashcards_csv_path)
+        canonical = {c: registry.canonicalize(c) for c in missing}
+        canonical = {c: k for c, k in canonical.items() if k != c}
+        found = store.get_many(canonical.values(), user_id)
+        for concept, key in canonical.items():
+            if key in found:
+                cards[concept] = found[key]
+    return cards
+
+
+def flashcards_etag(flashcards_csv_path="../../data/flashcards.csv") -> str:
+    """Validator for card responses; changes when any card is added."""
+    return get_flashcard_store(flashcards_csv_path).etag
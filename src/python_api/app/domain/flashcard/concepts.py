@@ -0,0 +1,309 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from ..history.index import get_csv_index
+
+_STOPWORDS = {"a", "an", "and", "the", "of", "in", "on", "for", "to", "with", "vs", "versus"}
+
+# Phrase -> preferred phrase, applied on token boundaries before stemming
+_SYNONYMS = {
+    "expected_value": "mean",
+    "expectation": "mean",
+    "average": "mean",
+    "maximum_likelihood_estimation": "maximum_likelihood",
+    "mle": "maximum_likelihood",
+    "svd": "singular_value_decomposition",
+    "pca": "principal_component_analysis",
+    "back_propagation": "backpropagation",
+    "backprop": "backpropagation",
+    "std": "standard_deviation",
+    "optimisation": "optimization",
+    "eigen_decomposition": "eigendecomposition",
+}
+
+
+def _load_synonyms() -> Dict[str, str]:
+    synonyms = dict(_SYNONYMS)
+    path = os.getenv("CONCEPT_SYNONYMS_PATH")
+    if path:
+        with open(path, "r", encoding="utf-8") as fh:
+            synonyms.update({normalize_text(k): normalize_text(v)
+                            for k, v in json.load(fh).items()})
+    # Longest phrases first so "maximum_likelihood_estimation" wins over parts
+    return dict(sorted(synonyms.items(), key=lambda kv: -len(kv[0])))
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase snake_case with accents folded and punctuation collapsed."""
+    text = str(text)
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(c for c in text if not unicodedata.combining(c))
+    text = text.lower()
+    return re.sub(r"[^a-z0-9]+", "_", text).strip("_")
+
+
+def stem(token: str) -> str:
+    """Fold plurals so "markov_chains" and "markov_chain" agree."""
+    if len(token) <= 3:
+        return token
+    if token.endswith("ices"):
+        return token[:-4] + "ix"
+    if token.endswith("ies"):
+        return token[:-3] + "y"
+    if token.endswith("sses"):
+        return token[:-2]
+    if token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+_synonyms: Optional[Dict[str, str]] = None
+
+
+def concept_key(concept: str) -> str:
+    """
+    Canonical comparison key: normalized, synonyms applied, stopwords
+    dropped, tokens stemmed and sorted.
+
+    "variance_and_expectation", "Mean & variance" and "mean_variances" all
+    map to "mean_variance".
+    """
+    global _synonyms
+    if _synonyms is None:
+        _synonyms = _load_synonyms()
+    text = normalize_text(concept)
+    for phrase, replacement in _synonyms.items():
+        if phrase in text:
+            text = re.sub(rf"(?<![a-z0-9]){re.escape(phrase)}(?![a-z0-9])",
+                          replacement, text)
+    tokens = {stem(t) for t in text.split("_") if t and t not in _STOPWORDS}
+    return "_".join(sorted(tokens))
+
+
+# Roman numerals up to 39 ("type_ii_error", "phase_iv")
+_ROMAN = re.compile(r"^(?=[ivx])x{0,3}(ix|iv|v?i{0,3})$")
+
+
+def _discriminators(tokens: Set[str]) -> Set[str]:
+    """Tokens that tell otherwise similar concepts apart: numbers and numerals."""
+    return {t for t in tokens if any(c.isdigit() for c in t) or _ROMAN.match(t)}
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Insertions, deletions, substitutions and adjacent swaps turning a into b."""
+    if len(a) < len(b):
+        a, b = b, a
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if before is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        before, previous = previous, current
+    return previous[-1]
+
+
+def spelling_similarity(key: str, other: str) -> float:
+    """
+    How alike two concept keys are as spellings, from 0 to 1.
+
+    Tokens are compared joined, so a split or joined word costs nothing
+    ("eigen_vector" vs "eigenvector"); the score is one minus the edit
+    distance over the longer length, so a single typo in "gradient_descent"
+    scores 0.93. Keys whose numbers or roman numerals differ ("l1" vs "l2",
+    "type_i" vs "type_ii") are different concepts and score 0.
+    """
+    if _discriminators(set(key.split("_"))) != _discriminators(set(other.split("_"))):
+        return 0.0
+    a, b = key.replace("_", ""), other.replace("_", "")
+    longest = max(len(a), len(b))
+    return 1.0 - edit_distance(a, b) / longest if longest else 1.0
+
+
+_PRIME = (1 << 31) - 1
+
+
+class MinHasher:
+    """MinHash signatures over character n-grams of a concept key."""
+
+    def __init__(self, num_perm: int = 64, ngram: int = 2, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.ngram = ngram
+        self.a = rng.randint(1, _PRIME, size=num_perm, dtype=np.int64)
+        self.b = rng.randint(0, _PRIME, size=num_perm, dtype=np.int64)
+
+    def shingles(self, key: str) -> Set[str]:
+        # Separators dropped, like spelling_similarity() compares keys
+        padded = f"^{key.replace('_', '')}$"
+        return {padded[i:i + self.ngram] for i in range(max(1, len(padded) - self.ngram + 1))}
+
+    def signature(self, shingles: Set[str]) -> np.ndarray:
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") & _PRIME
+             for s in shingles), dtype=np.int64, count=len(shingles))
+        return ((np.outer(hashes, self.a) + self.b) % _PRIME).min(axis=0)
+
+
+class ConceptRegistry:
+    """
+    Canonical concepts with exact-key and near-duplicate matching.
+
+    Every concept is reduced to a concept_key(); the first concept seen for a
+    key is its canonical form, returned by canonical(). Keys are also indexed
+    by MinHash LSH over character bigrams (bands x rows = num_perm), which
+    match() uses to find candidate misspellings; a candidate is accepted if
+    its spelling_similarity() reaches `threshold`. The default 0.87 lets one
+    typo through in keys of eight or more letters and none in shorter ones.
+
+    Fuzzy matches are a retrieval fallback only: deciding that a concept
+    already has a card, and reusing or skipping it, takes an exact key match.
+
+    When built for a flashcard CSV, the registry follows the file through its
+    offset index and picks up cards written by any process.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.87,
+        num_perm: int = 64,
+        bands: int = 16,
+        flashcards_csv_path: Optional[str] = None
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.flashcards_csv_path = flashcards_csv_path
+        self._hasher = MinHasher(num_perm)
+        self._canonical: Dict[str, str] = {}      # key -> canonical concept
+        self._buckets: Dict[Tuple[int, bytes], Set[str]] = {}
+        self._rows_seen = 0
+        self._lock = threading.RLock()
+        self.lookups = 0
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+
+    def _sync(self) -> None:
+        if self.flashcards_csv_path is None:
+            return
+        index = get_csv_index(self.flashcards_csv_path)
+        total = len(index)
+        with self._lock:
+            if total < self._rows_seen:
+                # File was replaced; start over from its current contents
+                self._canonical.clear()
+                self._buckets.clear()
+                self._rows_seen = 0
+            if total == self._rows_seen:
+                return
+            for row in index.read_range(self._rows_seen, total):
+                if row.get("concept"):
+                    self._add(row["concept"])
+            self._rows_seen = total
+
+    def _add(self, concept: str) -> str:
+        key = concept_key(concept)
+        if not key:
+            return concept
+        existing = self._canonical.get(key)
+        if existing is not None:
+            return existing
+        self._canonical[key] = concept
+        signature = self._hasher.signature(self._hasher.shingles(key))
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            self._buckets.setdefault((band, chunk), set()).add(key)
+        return concept
+
+    def add(self, concept: str) -> str:
+        """Register a concept; returns its canonical form."""
+        self._sync()
+        with self._lock:
+            return self._add(concept)
+
+    def canonical(self, concept: str) -> Optional[str]:
+        """The known concept with the same concept_key(), if any."""
+        self._sync()
+        with self._lock:
+            return self._canonical.get(concept_key(concept))
+
+    def match(self, concept: str) -> Optional[Tuple[str, float]]:
+        """
+        Find the canonical concept for a possibly different spelling.
+
+        Returns:
+            (canonical concept, similarity) or None if nothing is close enough
+        """
+        self._sync()
+        key = concept_key(concept)
+        with self._lock:
+            self.lookups += 1
+            if key in self._canonical:
+                self.exact_hits += 1
+                return self._canonical[key], 1.0
+            if not key:
+                return None
+
+            signature = self._hasher.signature(self._hasher.shingles(key))
+            candidates: Set[str] = set()
+            for band in range(self.bands):
+                chunk = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+                candidates |= self._buckets.get((band, chunk), set())
+
+            length = len(key.replace("_", ""))
+            best, best_score = None, 0.0
+            for candidate in candidates:
+                # Too different in length to reach the threshold: skip the edit distance
+                other_length = len(candidate.replace("_", ""))
+                if abs(length - other_length) > (1 - self.threshold) * max(length, other_length):
+                    continue
+                score = spelling_similarity(key, candidate)
+                if score > best_score:
+                    best, best_score = candidate, score
+            if best is None or best_score < self.threshold:
+                return None
+            self.fuzzy_hits += 1
+            return self._canonical[best], round(best_score, 3)
+
+    def canonicalize(self, concept: str) -> str:
+        """The known concept this one (possibly fuzzily) duplicates, or the concept itself."""
+        found = self.match(concept)
+        return found[0] if found else concept
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "concepts": len(self._canonical),
+                "lookups": self.lookups,
+                "exact_hits": self.exact_hits,
+                "fuzzy_hits": self.fuzzy_hits,
+            }
+
+
+_registries: Dict[str, ConceptRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_concept_registry(flashcards_csv_path: str) -> ConceptRegistry:
+    """Process-wide registry of the concepts that have cards in a CSV."""
+    key = os.path.abspath(flashcards_csv_path)
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = _registries[key] = ConceptRegistry(
+                threshold=float(os.getenv("CONCEPT_MATCH_THRESHOLD", "0.87")),
+                flashcards_csv_path=flashcards_csv_path,
+            )
+        return registry
@@ -0,0 +1,181 @@
+from __future__ import annotations
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ..history.index import get_csv_index
+from ..search.tfidf import HashedTfidf, _Column, add_terms, compact_unlocked, text_words
+from .concepts import concept_key
+
+# Concept terms are kept apart from body terms and weigh more
+_FIELDS = (("concept", "c", 2.0), ("question", "b", 1.0), ("answer", "b", 0.5))
+
+# Rows read from the CSV per indexing batch
+_SYNC_BATCH = 10_000
+
+
+class RelatedIndex:
+    """
+    Hashed TF-IDF over flashcard text for "cards like this one" lookups.
+
+    Each distinct concept (by concept_key()) is one document built from its
+    concept, question and answer words, hashed into n_features buckets and
+    searched through a HashedTfidf inverted index, which keeps lookups in
+    the low milliseconds even with a million cards.
+
+    When built for a flashcard CSV, the index follows the file through its
+    offset index and picks up cards written by any process.
+    """
+
+    def __init__(
+        self,
+        n_features: int = 1 << 20,
+        max_df: float = 0.2,
+        compact_every: int = 50_000,
+        flashcards_csv_path: Optional[str] = None
+    ):
+        self.n_features = n_features
+        self.max_df = max_df
+        self.compact_every = compact_every
+        self.flashcards_csv_path = flashcards_csv_path
+        self._lock = threading.RLock()
+        self._rows_seen = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        self._tfidf = HashedTfidf(self.n_features, self.max_df, self.compact_every)
+        self._row_ids = _Column(np.int64)
+        self._doc_by_key: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        self._sync()
+        return len(self._tfidf)
+
+    # -- indexing ----------------------------------------------------------
+
+    def _terms(self, card: Dict[str, str]) -> Dict[int, float]:
+        """Hashed feature -> field-weighted sublinear term frequency."""
+        weights: Dict[int, float] = {}
+        for field, prefix, boost in _FIELDS:
+            text = card.get(field) or ""
+            if field == "concept":
+                words = [w for w in concept_key(text).split("_") if w]
+            else:
+                words = text_words(text)
+            add_terms(weights, words, prefix, boost, self.n_features)
+        return weights
+
+    def _add_many(self, cards: Iterable[Tuple[int, Dict[str, str]]]) -> int:
+        """Index (row id, card) pairs in one batch; returns how many were new."""
+        documents: List[Dict[int, float]] = []
+        row_ids: List[int] = []
+        doc = len(self._tfidf)
+        for row_id, card in cards:
+            key = concept_key(card.get("concept") or "")
+            if not key or key in self._doc_by_key:
+                continue
+            terms = self._terms(card)
+            if not terms:
+                continue
+            self._doc_by_key[key] = doc + len(documents)
+            documents.append(terms)
+            row_ids.append(row_id)
+        if not row_ids:
+            return 0
+        self._tfidf.add_many(documents)
+        self._row_ids.extend(row_ids)
+        return len(row_ids)
+
+    def _sync(self) -> None:
+        if self.flashcards_csv_path is None:
+            return
+        index = get_csv_index(self.flashcards_csv_path)
+        total = len(index)
+        with self._lock:
+            if total < self._rows_seen:
+                # File was replaced; start over from its current contents
+                self._reset()
+                self._rows_seen = 0
+            if total == self._rows_seen:
+                return
+            for start in range(self._rows_seen, total, _SYNC_BATCH):
+                stop = min(start + _SYNC_BATCH, total)
+                self._add_many(enumerate(index.read_range(start, stop), start))
+            self._rows_seen = total
+            tfidf = self._tfidf
+        compact_unlocked(self._lock, tfidf)
+
+    def add(self, concept: str, question: str = "", answer: str = "", row_id: int = -1) -> bool:
+        """Index one card; returns False if its concept is already indexed."""
+        self._sync()
+        with self._lock:
+            added = self._add_many([(row_id, {"concept": concept, "question": question, "answer": answer})])
+            tfidf = self._tfidf
+        compact_unlocked(self._lock, tfidf)
+        return added == 1
+
+    # -- queries -----------------------------------------------------------
+
+    def related(self, concepts: List[str], k: int = 10) -> Dict[str, List[Dict]]:
+        """
+        Top-k most similar cards for each concept.
+
+        A concept that has a card is matched by its whole card, otherwise
+        by its words alone; the card itself is never among its results.
+
+        Returns:
+            {concept: [{"concept", "question", "answer", "score"}, ...]}
+        """
+        self._sync()
+        index = get_csv_index(self.flashcards_csv_path) if self.flashcards_csv_path else None
+        matches: Dict[str, List[Tuple[int, float]]] = {}
+        with self._lock:
+            own_rows = {}
+            for concept in concepts:
+                doc = self._doc_by_key.get(concept_key(concept))
+                if doc is not None and index is not None:
+                    own_rows[concept] = (doc, int(self._row_ids.view()[doc]))
+            cards = dict(zip(own_rows, index.iter_rows([r for _, r in own_rows.values()]))) if own_rows else {}
+            for concept in concepts:
+                doc = own_rows.get(concept, (None, None))[0]
+                terms = self._terms(cards.get(concept) or {"concept": concept})
+                matches[concept] = self._tfidf.search(terms, k, exclude=doc)
+            row_ids = self._row_ids.view()
+            wanted = sorted({int(row_ids[doc]) for found in matches.values() for doc, _ in found})
+
+        rows = dict(zip(wanted, index.iter_rows(wanted))) if index is not None else {}
+        results: Dict[str, List[Dict]] = {}
+        for concept, found in matches.items():
+            results[concept] = []
+            for doc, score in found:
+                row = rows.get(int(row_ids[doc]), {})
+                results[concept].append({
+                    "concept": row.get("concept", ""),
+                    "question": row.get("question", ""),
+                    "answer": row.get("answer", ""),
+                    "score": round(score, 4),
+                })
+        return results
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return self._tfidf.get_stats()
+
+
+_indexes: Dict[str, RelatedIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_related_index(flashcards_csv_path: str) -> RelatedIndex:
+    """Process-wide related-card index for a flashcard CSV."""
+    key = os.path.abspath(flashcards_csv_path)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = RelatedIndex(
+                max_df=float(os.getenv("RELATED_MAX_DF", "0.2")),
+                flashcards_csv_path=flashcards_csv_path,
+            )
+        return index
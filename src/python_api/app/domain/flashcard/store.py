@@ -0,0 +1,385 @@
+from __future__ import annotations
+import csv
+import hashlib
+import io
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ..history.index import normalize_user_id, _file_lock
+
+# magic, format version, card count, store version, base version, heap offset,
+# first and last source csv byte covered, source csv inode
+_HEADER = struct.Struct("<4sIIQQQQQQ")
+_MAGIC = b"FCS1"
+_FORMAT = 2
+
+# Fixed-width card records, sorted by (concept hash, csv row)
+_RECORD = np.dtype([
+    ("hash", "<u8"),
+    ("row", "<u4"),
+    ("concept_len", "<u4"),
+    ("concept_off", "<u8"),
+    ("question_off", "<u8"),
+    ("answer_off", "<u8"),
+    ("user_off", "<u8"),
+    ("question_len", "<u4"),
+    ("answer_len", "<u4"),
+    ("user_len", "<u4"),
+    ("_pad", "<u4"),
+])
+_OFFSETS = ("concept_off", "question_off", "answer_off", "user_off")
+
+
+def concept_hash(concept: str) -> int:
+    digest = hashlib.blake2b(concept.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _encode(rows: List[Tuple[str, str, str, str]], first_row: int) -> Tuple[np.ndarray, bytearray]:
+    """Sorted records and string heap for csv rows numbered from first_row."""
+    heap = bytearray()
+    interned: Dict[bytes, int] = {}
+
+    def put(text: str) -> Tuple[int, int]:
+        raw = text.encode("utf-8")
+        offset = interned.get(raw)
+        if offset is None:
+            offset = interned[raw] = len(heap)
+            heap.extend(raw)
+        return offset, len(raw)
+
+    records = np.zeros(len(rows), dtype=_RECORD)
+    for i, (concept, question, answer, user) in enumerate(rows):
+        c_off, c_len = put(concept)
+        q_off, q_len = put(question)
+        a_off, a_len = put(answer)
+        u_off, u_len = put(user)
+        records[i] = (concept_hash(concept), first_row + i, c_len, c_off, q_off,
+                      a_off, u_off, q_len, a_len, u_len, 0)
+    return records[np.lexsort((records["row"], records["hash"]))], heap
+
+
+def _merge(
+    records: np.ndarray,
+    heap,
+    later: np.ndarray,
+    later_heap
+) -> Tuple[np.ndarray, bytearray]:
+    """
+    Merge two sorted runs, the second holding only later csv rows.
+
+    The later heap is appended to the first and its offsets shifted, and
+    its records are slotted in by binary search, so nothing is re-read or
+    re-sorted.
+    """
+    later = later.copy()
+    for field in _OFFSETS:
+        later[field] += len(heap)
+    # Later rows sort after earlier rows with the same hash
+    slots = np.searchsorted(records["hash"], later["hash"], side="right")
+    slots += np.arange(len(later))
+    merged = np.empty(len(records) + len(later), dtype=_RECORD)
+    taken = np.zeros(len(merged), dtype=bool)
+    taken[slots] = True
+    merged[slots] = later
+    merged[~taken] = records
+    merged_heap = bytearray(heap)
+    merged_heap.extend(later_heap)
+    return merged, merged_heap
+
+
+class _Segment:
+    """One published store file, mapped read-only."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as fh:
+            stat = os.fstat(fh.fileno())
+            self.mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self.inode = (stat.st_dev, stat.st_ino)
+        (magic, fmt, count, self.version, self.base_version, heap_offset,
+         self.start_size, self.source_size, self.source_ino) = _HEADER.unpack_from(self.mm, 0)
+        if magic != _MAGIC or fmt != _FORMAT:
+            raise ValueError(f"not a flashcard store: {path}")
+        # Views straight onto the mapping: no per-worker copy of the table
+        self.records = np.frombuffer(
+            self.mm, dtype=_RECORD, count=count, offset=_HEADER.size)
+        self.hashes = self.records["hash"]
+        self.heap = memoryview(self.mm)[heap_offset:]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _text(self, offset: int, length: int) -> str:
+        return str(self.heap[offset:offset + length], "utf-8")
+
+    def find_many(self, concepts: List[str], user: Optional[bytes]) -> Dict[str, Dict[str, str]]:
+        """First card per concept, located with one vectorized binary search."""
+        hashes = np.fromiter((concept_hash(c) for c in concepts),
+                             dtype=np.uint64, count=len(concepts))
+        los = np.searchsorted(self.hashes, hashes, side="left")
+        his = np.searchsorted(self.hashes, hashes, side="right")
+        cards = {}
+        for i in np.flatnonzero(his > los).tolist():
+            card = self._first(concepts[i], int(los[i]), int(his[i]), user)
+            if card is not None:
+                cards[concepts[i]] = card
+        return cards
+
+    def _first(self, concept: str, lo: int, hi: int, user: Optional[bytes]) -> Optional[Dict[str, str]]:
+        """First record in [lo, hi) that really is `concept` (hashes may collide)."""
+        key = concept.encode("utf-8")
+        for rec in self.records[lo:hi]:
+            c_off, c_len = int(rec["concept_off"]), int(rec["concept_len"])
+            if self.heap[c_off:c_off + c_len] != key:
+                continue
+            if user is not None:
+                u_off = int(rec["user_off"])
+                if self.heap[u_off:u_off + int(rec["user_len"])] != user:
+                    continue
+            return {
+                "concept": concept,
+                "question": self._text(int(rec["question_off"]), int(rec["question_len"])),
+                "answer": self._text(int(rec["answer_off"]), int(rec["answer_len"])),
+            }
+        return None
+
+
+class _Snapshot:
+    """
+    One published version of the store: a base segment and, if present,
+    the delta segment of rows appended to the csv after it.
+    """
+
+    def __init__(self, base: _Segment, delta: Optional[_Segment]):
+        self.base = base
+        # A delta left over from an earlier base is ignored
+        if delta is not None and (delta.base_version != base.version
+                                  or delta.start_size != base.source_size
+                                  or delta.source_ino != base.source_ino):
+            delta = None
+        self.delta = delta
+        self.segments = [base] if delta is None else [base, delta]
+        self.version = self.segments[-1].version
+        self.source_size = self.segments[-1].source_size
+        self.source_ino = base.source_ino
+
+    def __len__(self) -> int:
+        return sum(len(segment) for segment in self.segments)
+
+    def find(self, concept: str, user_id=None) -> Optional[Dict[str, str]]:
+        """First card (in csv order) for an exact concept, optionally per user."""
+        return self.find_many([concept], user_id).get(concept)
+
+    def find_many(self, concepts: Iterable[str], user_id=None) -> Dict[str, Dict[str, str]]:
+        """{concept: first card} for the concepts that have one."""
+        # user_id cells are compared normalized, so 7, "7" and "7.0" are one user
+        user = None if user_id is None else normalize_user_id(
+            user_id).encode("utf-8")
+        missing = list(dict.fromkeys(concepts))
+        cards: Dict[str, Dict[str, str]] = {}
+        # Delta rows all come after base rows in the csv
+        for segment in self.segments:
+            if not missing:
+                break
+            cards.update(segment.find_many(missing, user))
+            missing = [c for c in missing if c not in cards]
+        return cards
+
+
+class FlashcardStore:
+    """
+    Compact binary copy of the flashcard CSV, memory-mapped read-only.
+
+    Layout: a fixed header, an array of fixed-width records sorted by concept
+    hash, then a UTF-8 string heap. Every worker process maps the same file,
+    so the table lives once in the page cache instead of once per worker as
+    pandas object columns.
+
+    When the CSV grows, only the appended rows are parsed: they are merged
+    into a small delta segment (<store>.delta, same layout) covering the
+    csv past the base. Once the delta outgrows merge_fraction of the base
+    (and merge_min records) it is merged into a new base without re-reading
+    the csv. Files are written next to the old ones and published with
+    os.replace(); readers notice new inodes on their next lookup and remap,
+    while in-flight lookups finish on the old mappings.
+    """
+
+    def __init__(
+        self,
+        csv_path: str,
+        store_path: Optional[str] = None,
+        merge_min: int = 4096,
+        merge_fraction: float = 0.125
+    ):
+        self.csv_path = csv_path
+        self.path = store_path or csv_path + ".cards"
+        self.delta_path = self.path + ".delta"
+        self.lock_path = self.path + ".lock"
+        self.merge_min = merge_min
+        self.merge_fraction = merge_fraction
+        self._lock = threading.Lock()
+        self._segments: Dict[str, _Segment] = {}
+
+    # -- publishing --------------------------------------------------------
+
+    def refresh(self) -> _Snapshot:
+        """Return the current snapshot, updating it if the CSV has changed."""
+        snap = self._current()
+        if snap is not None and (snap.source_size, snap.source_ino) == self._csv_stat():
+            return snap
+        with self._lock, _file_lock(self.lock_path):
+            # Another thread or worker may have published while we waited
+            snap = self._current()
+            size, ino = self._csv_stat()
+            if (snap is None or not snap.source_size or ino != snap.source_ino
+                    or size < snap.source_size):
+                # New, replaced or rewritten csv (e.g. a header extended with os.replace())
+                self.build(snap.version + 1 if snap else 1)
+            elif size != snap.source_size:
+                self._append(snap, size, ino)
+            return self._current()
+
+    def _csv_stat(self) -> Tuple[int, int]:
+        try:
+            stat = os.stat(self.csv_path)
+        except FileNotFoundError:
+            return 0, 0
+        return stat.st_size, stat.st_ino
+
+    def _segment(self, path: str) -> Optional[_Segment]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        segment = self._segments.get(path)
+        if segment is None or segment.inode != (stat.st_dev, stat.st_ino):
+            try:
+                segment = _Segment(path)
+            except (FileNotFoundError, ValueError, struct.error):
+                return None
+            self._segments[path] = segment
+        return segment
+
+    def _current(self) -> Optional[_Snapshot]:
+        base = self._segment(self.path)
+        if base is None:
+            return None
+        return _Snapshot(base, self._segment(self.delta_path))
+
+    def _write(
+        self,
+        path: str,
+        records: np.ndarray,
+        heap,
+        version: int,
+        base_version: int,
+        start_size: int,
+        source_size: int,
+        source_ino: int
+    ) -> None:
+        heap_offset = _HEADER.size + records.nbytes
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(_HEADER.pack(_MAGIC, _FORMAT, len(records), version, base_version,
+                                  heap_offset, start_size, source_size, source_ino))
+            fh.write(records.tobytes())
+            fh.write(heap)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, path)
+
+    def build(self, version: int) -> None:
+        """Write a new base store from the whole CSV and atomically swap it in."""
+        source_size, source_ino = self._csv_stat()
+        records, heap = _encode(self._read_csv(source_size), 0)
+        self._write(self.path, records, heap, version, version, 0, source_size, source_ino)
+        self._drop_delta()
+
+    def _append(self, snap: _Snapshot, size: int, ino: int) -> None:
+        """Publish the csv rows past snap, merging them into the delta or base."""
+        base, delta = snap.base, snap.delta
+        records, heap = _encode(
+            self._read_csv(size, start=snap.source_size), len(snap))
+        if delta is not None:
+            records, heap = _merge(delta.records, delta.heap, records, heap)
+        version = snap.version + 1
+        if len(records) > max(self.merge_min, self.merge_fraction * len(base)):
+            records, heap = _merge(base.records, base.heap, records, heap)
+            self._write(self.path, records, heap, version, version, 0, size, ino)
+            self._drop_delta()
+        else:
+            self._write(self.delta_path, records, heap, version,
+                        base.version, base.source_size, size, ino)
+
+    def _drop_delta(self) -> None:
+        try:
+            os.remove(self.delta_path)
+        except FileNotFoundError:
+            pass
+
+    def _read_csv(self, size: int, start: int = 0) -> List[Tuple[str, str, str, str]]:
+        if size <= start:
+            return []
+        # Only the bytes this version claims to cover, even if the csv grows meanwhile
+        with open(self.csv_path, "rb") as fh:
+            if start:
+                # Appended rows start on a row boundary; the field names come from the header
+                fieldnames = next(csv.reader([fh.readline().decode("utf-8")]))
+                fh.seek(start)
+                text = fh.read(size - start).decode("utf-8")
+                reader = csv.DictReader(io.StringIO(text, newline=""), fieldnames=fieldnames)
+            else:
+                text = fh.read(size).decode("utf-8")
+                reader = csv.DictReader(io.StringIO(text, newline=""))
+            rows = []
+            for row in reader:
+                concept = row.get("concept")
+                if not concept:
+                    continue
+                rows.append((
+                    concept,
+                    row.get("question") or "",
+                    row.get("answer") or "",
+                    normalize_user_id(row.get("user_id")),
+                ))
+        return rows
+
+    # -- lookups -----------------------------------------------------------
+
+    @property
+    def version(self) -> int:
+        return self.refresh().version
+
+    @property
+    def etag(self) -> str:
+        """Changes whenever a new version of the store is published."""
+        snap = self.refresh()
+        return f"{snap.version}-{snap.source_size}"
+
+    def get(self, concept: str, user_id=None) -> Optional[Dict[str, str]]:
+        return self.refresh().find(concept, user_id)
+
+    def get_many(self, concepts: Iterable[str], user_id=None) -> Dict[str, Dict[str, str]]:
+        return self.refresh().find_many(concepts, user_id)
+
+    def __len__(self) -> int:
+        return len(self.refresh())
+
+
+_stores: Dict[str, FlashcardStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_flashcard_store(csv_path: str) -> FlashcardStore:
+    """Process-wide store per flashcard CSV."""
+    key = os.path.abspath(csv_path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = FlashcardStore(csv_path)
+        return store
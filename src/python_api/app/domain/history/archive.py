@@ -0,0 +1,503 @@
+"""
+Compressed, append-only dialogue archive.
+
+Layout of a .dla file:
+
+    file header   "<4sHHI"  magic DLA1, format, zlib level, dictionary length
+    dictionary    preset zlib dictionary shared by every block
+    block*        "<4sIIII" magic BLK1, records, meta length, data length, crc32(data)
+                  meta  JSON [[user_id, timestamp], ...], one pair per record
+                  data  zlib stream (with the preset dictionary) of JSON lines
+
+Records are stored as compact UTF-8 JSON, so math symbols take their real
+few bytes instead of six-character \\u escapes, and the dictionary lets even
+a single-record block compress well. Only block headers and metas are read
+to build the in-memory index; a record is fetched by seeking to its block
+and inflating that block alone.
+
+    python -m app.domain.history.archive migrate data/dialogues.csv data/dialogues.dla
+    python -m app.domain.history.archive compact data/dialogues.dla
+    python -m app.domain.history.archive stats data/dialogues.dla
+"""
+from __future__ import annotations
+import bisect
+import json
+import os
+import re
+import struct
+import threading
+import zlib
+from collections import Counter, OrderedDict
+from contextlib import nullcontext
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .index import CsvOffsetIndex, _file_lock, _to_int, get_csv_index, normalize_user_id, page_keys
+
+ARCHIVE_SUFFIX = ".dla"
+
+_FILE_HEADER = struct.Struct("<4sHHI")
+_FILE_MAGIC = b"DLA1"
+_FORMAT = 1
+_BLOCK_HEADER = struct.Struct("<4sIIII")
+_BLOCK_MAGIC = b"BLK1"
+
+# zlib only looks back 32 KiB, so a longer dictionary is never used
+MAX_DICTIONARY = 32 * 1024
+
+
+def _encode(record: Dict) -> bytes:
+    dialogue = record.get("dialogue")
+    if isinstance(dialogue, str):
+        try:
+            dialogue = json.loads(dialogue)
+        except ValueError:
+            pass
+    return json.dumps({
+        "user_id": normalize_user_id(record.get("user_id")),
+        "timestamp": _to_int(record.get("timestamp")),
+        "dialogue": dialogue,
+        "latent": record.get("latent"),
+    }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def train_dictionary(samples: Iterable[bytes], size: int = MAX_DICTIONARY) -> bytes:
+    """
+    Build a preset dictionary from sample records.
+
+    Word n-grams (1-4 words, with their trailing separators) are ranked by
+    bytes saved (occurrences x length) and packed until `size`; the most
+    valuable go last, where zlib reaches them with the shortest distances.
+    """
+    counts: Counter = Counter()
+    for sample in samples:
+        tokens = re.findall(rb"[^\s\"]+[\s\"]*|[\s\"]+", sample)
+        for n in range(1, 5):
+            for i in range(len(tokens) - n + 1):
+                counts[b"".join(tokens[i:i + n])] += 1
+
+    ranked = sorted(((c * len(g), g) for g, c in counts.items() if c > 1 and len(g) > 3),
+                    reverse=True)
+    chosen: List[bytes] = []
+    used = 0
+    for _, gram in ranked:
+        if used + len(gram) > size:
+            continue
+        if any(gram in other for other in chosen[-64:]):
+            continue
+        chosen.append(gram)
+        used += len(gram)
+    return b"".join(reversed(chosen))
+
+
+def _read_file_header(fh) -> Tuple[int, bytes, int]:
+    """(zlib level, dictionary, offset of the first block)"""
+    raw = fh.read(_FILE_HEADER.size)
+    if len(raw) < _FILE_HEADER.size:
+        raise ValueError("truncated archive header")
+    magic, fmt, level, dict_len = _FILE_HEADER.unpack(raw)
+    if magic != _FILE_MAGIC or fmt != _FORMAT:
+        raise ValueError(f"not a dialogue archive: {fh.name}")
+    dictionary = fh.read(dict_len)
+    return level, dictionary, _FILE_HEADER.size + dict_len
+
+
+class ArchiveWriter:
+    """
+    Streaming writer; buffers records and writes one block per
+    `block_records`. Appending to an existing archive reuses its dictionary.
+
+    Use as a context manager, or call close() to write the final block.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dictionary: bytes = b"",
+        level: int = 9,
+        block_records: int = 256
+    ):
+        self.path = path
+        self.block_records = block_records
+        self._pending: List[Tuple[str, int, bytes]] = []
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, "rb") as fh:
+                self.level, self.dictionary, _ = _read_file_header(fh)
+        else:
+            self.level, self.dictionary = level, dictionary[-MAX_DICTIONARY:]
+            with open(path, "wb") as fh:
+                fh.write(_FILE_HEADER.pack(_FILE_MAGIC, _FORMAT, level, len(self.dictionary)))
+                fh.write(self.dictionary)
+        self.records_written = 0
+
+    def write(self, record: Dict) -> None:
+        self._pending.append((normalize_user_id(record.get("user_id")),
+                              _to_int(record.get("timestamp")), _encode(record)))
+        if len(self._pending) >= self.block_records:
+            self.flush()
+
+    def _block(self) -> bytes:
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 15, 9,
+                                      zlib.Z_DEFAULT_STRATEGY, self.dictionary)
+        data = compressor.compress(b"\n".join(raw for _, _, raw in self._pending))
+        data += compressor.flush()
+        meta = json.dumps([[user, ts] for user, ts, _ in self._pending],
+                          separators=(",", ":")).encode("utf-8")
+        header = _BLOCK_HEADER.pack(_BLOCK_MAGIC, len(self._pending), len(meta),
+                                    len(data), zlib.crc32(data))
+        return header + meta + data
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        block = self._block()
+        with open(self.path, "ab") as fh:
+            fh.write(block)
+        self.records_written += len(self._pending)
+        self._pending = []
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> "ArchiveWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class DialogueArchive:
+    """
+    Random-access reader (and appender) over a .dla archive.
+
+    Mirrors the CsvOffsetIndex interface used for dialogue history (len,
+    read_row, iter_rows, page, count, append_row), so either can back the
+    history endpoints and the summarization writer. Blocks appended by
+    another process are picked up by reading only the headers past the last
+    indexed offset; recently inflated blocks are kept in a small LRU.
+    """
+
+    def __init__(self, path: str, cached_blocks: int = 16):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.cached_blocks = cached_blocks
+        self._lock = threading.RLock()
+        self._writing = False
+        self._cache: "OrderedDict[int, List[bytes]]" = OrderedDict()
+        self._reset()
+
+    def _reset(self) -> None:
+        self.dictionary = b""
+        self.covered = 0
+        self.inode: Optional[int] = None
+        self.block_offsets: List[int] = []
+        self.block_starts: List[int] = []   # first row id of each block
+        self.users: List[str] = []
+        self.timestamps: List[int] = []
+        self._by_user: Dict[str, List[Tuple[int, int]]] = {}
+        self._cache.clear()
+
+    # -- index maintenance -------------------------------------------------
+
+    def _stat(self) -> Tuple[int, Optional[int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return 0, None
+        return st.st_size, st.st_ino
+
+    def _size(self) -> int:
+        return self._stat()[0]
+
+    def _ensure_fresh(self) -> None:
+        with self._lock:
+            if self._stat() == (self.covered, self.inode):
+                return
+            lock = nullcontext() if self._writing else _file_lock(
+                self.lock_path, shared=True)
+            with lock:
+                size, inode = self._stat()
+                if inode != self.inode or size < self.covered:
+                    # Archive was replaced (compacted) underneath us
+                    self._reset()
+                    self.inode = inode
+                if size > self.covered:
+                    self._scan_from(size)
+
+    def _scan_from(self, size: int) -> None:
+        with open(self.path, "rb") as fh:
+            if self.covered == 0:
+                _, self.dictionary, self.covered = _read_file_header(fh)
+            offset = self.covered
+            while offset + _BLOCK_HEADER.size <= size:
+                fh.seek(offset)
+                magic, n, meta_len, data_len, _ = _BLOCK_HEADER.unpack(
+                    fh.read(_BLOCK_HEADER.size))
+                end = offset + _BLOCK_HEADER.size + meta_len + data_len
+                if magic != _BLOCK_MAGIC or end > size:
+                    # Torn block from an interrupted write; the next append truncates it
+                    break
+                self.block_offsets.append(offset)
+                self.block_starts.append(len(self.users))
+                for user, ts in json.loads(fh.read(meta_len)):
+                    self._add_entry(user, ts)
+                offset = self.covered = end
+
+    def _add_entry(self, user: str, ts: int) -> None:
+        row = len(self.users)
+        self.users.append(user)
+        self.timestamps.append(ts)
+        keys = self._by_user.setdefault(user, [])
+        if keys and keys[-1] > (ts, row):
+            bisect.insort(keys, (ts, row))
+        else:
+            keys.append((ts, row))
+
+    # -- writes ------------------------------------------------------------
+
+    def append_row(self, row: Dict) -> int:
+        """Append one record as its own block; returns its row id."""
+        return self.append_rows([row])
+
+    def append_rows(self, rows: List[Dict]) -> int:
+        """Append records as a single block; returns the last row id."""
+        if not rows:
+            return len(self) - 1
+        with self._lock, _file_lock(self.lock_path):
+            self._writing = True
+            try:
+                self._ensure_fresh()
+                if self.covered and self._size() > self.covered:
+                    with open(self.path, "r+b") as fh:
+                        fh.truncate(self.covered)
+                writer = ArchiveWriter(self.path, block_records=len(rows))
+                for row in rows:
+                    writer.write(row)
+                writer.close()
+                self._ensure_fresh()
+                return len(self.users) - 1
+            finally:
+                self._writing = False
+
+    # -- reads -------------------------------------------------------------
+
+    def __len__(self) -> int:
+        self._ensure_fresh()
+        return len(self.users)
+
+    def _read_block(self, fh, block: int) -> List[bytes]:
+        cached = self._cache.get(block)
+        if cached is not None:
+            self._cache.move_to_end(block)
+            return cached
+        fh.seek(self.block_offsets[block])
+        _, _, meta_len, data_len, crc = _BLOCK_HEADER.unpack(fh.read(_BLOCK_HEADER.size))
+        fh.seek(meta_len, os.SEEK_CUR)
+        data = fh.read(data_len)
+        if zlib.crc32(data) != crc:
+            raise ValueError(f"corrupt block {block} in {self.path}")
+        decompressor = zlib.decompressobj(zdict=self.dictionary)
+        records = (decompressor.decompress(data) + decompressor.flush()).split(b"\n")
+        self._cache[block] = records
+        if len(self._cache) > self.cached_blocks:
+            self._cache.popitem(last=False)
+        return records
+
+    def read_row(self, row_id: int) -> Dict:
+        """Random access to a single record by row id."""
+        return next(self.iter_rows([row_id]))
+
+    def iter_rows(self, row_ids: List[int]) -> Iterator[Dict]:
+        """Read the given rows, inflating each block they touch once."""
+        self._ensure_fresh()
+        if not row_ids:
+            return
+        with open(self.path, "rb") as fh:
+            for row in row_ids:
+                with self._lock:
+                    if not 0 <= row < len(self.users):
+                        raise IndexError(row)
+                    block = bisect.bisect_right(self.block_starts, row) - 1
+                    raw = self._read_block(fh, block)[row - self.block_starts[block]]
+                yield json.loads(raw)
+
+    def read_range(self, start: int, stop: int) -> Iterator[Dict]:
+        """Contiguous rows [start, stop)."""
+        return self.iter_rows(list(range(start, min(stop, len(self)))))
+
+    def scan(self) -> Iterator[Dict]:
+        """
+        Every record in append order, with one sequential read.
+
+        Bypasses the block cache, so analytics over the whole archive do
+        not evict the blocks serving random access.
+        """
+        self._ensure_fresh()
+        with self._lock:
+            offsets, covered, dictionary = list(self.block_offsets), self.covered, self.dictionary
+        if not offsets:
+            return
+        with open(self.path, "rb") as fh:
+            fh.seek(offsets[0])
+            remaining = covered - offsets[0]
+            while remaining > 0:
+                _, _, meta_len, data_len, _ = _BLOCK_HEADER.unpack(fh.read(_BLOCK_HEADER.size))
+                fh.seek(meta_len, os.SEEK_CUR)
+                decompressor = zlib.decompressobj(zdict=dictionary)
+                raw = decompressor.decompress(fh.read(data_len)) + decompressor.flush()
+                for line in raw.split(b"\n"):
+                    yield json.loads(line)
+                remaining -= _BLOCK_HEADER.size + meta_len + data_len
+
+    def page(
+        self,
+        user_id,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+        descending: bool = True
+    ) -> Tuple[List[int], Optional[str]]:
+        """Same contract as CsvOffsetIndex.page()."""
+        self._ensure_fresh()
+        with self._lock:
+            keys = self._by_user.get(normalize_user_id(user_id), [])
+            return page_keys(keys, cursor, limit, descending)
+
+    def count(self, user_id) -> int:
+        self._ensure_fresh()
+        with self._lock:
+            return len(self._by_user.get(normalize_user_id(user_id), []))
+
+    def get_stats(self) -> Dict:
+        self._ensure_fresh()
+        with self._lock:
+            blocks = len(self.block_offsets)
+            return {
+                "records": len(self.users),
+                "blocks": blocks,
+                "records_per_block": round(len(self.users) / blocks, 1) if blocks else 0,
+                "dictionary_bytes": len(self.dictionary),
+                "bytes": self.covered,
+            }
+
+
+def migrate_csv(
+    csv_path: str,
+    archive_path: str,
+    block_records: int = 256,
+    dictionary_size: int = MAX_DICTIONARY,
+    sample_records: int = 500,
+    level: int = 9
+) -> Dict:
+    """
+    Copy a dialogue CSV into a new archive.
+
+    The dictionary is trained on up to `sample_records` rows spread evenly
+    over the file. The archive is written beside the target and renamed into
+    place, so an existing archive is replaced only by a complete one.
+
+    Returns:
+        {"records", "csv_bytes", "archive_bytes", "ratio"}
+    """
+    index = get_csv_index(csv_path)
+    total = len(index)
+    step = max(1, total // max(sample_records, 1))
+    samples = [_encode(row) for row in index.iter_rows(list(range(0, total, step)))]
+    return _rewrite(
+        (row for start in range(0, total, 10_000)
+         for row in index.read_range(start, start + 10_000)),
+        samples, archive_path, os.path.getsize(csv_path),
+        block_records, dictionary_size, level)
+
+
+def compact(archive_path: str, block_records: int = 256, dictionary_size: int = MAX_DICTIONARY) -> Dict:
+    """
+    Rewrite an archive into full blocks with a retrained dictionary.
+
+    Live appends write one small block per dialogue; compacting merges them.
+    Appends made while compacting wait for the file lock.
+    """
+    archive = get_dialogue_archive(archive_path)
+    with _file_lock(archive.lock_path):
+        archive._writing = True
+        try:
+            total = len(archive)
+            step = max(1, total // 500)
+            samples = [_encode(row) for i, row in enumerate(archive.scan()) if i % step == 0]
+            with open(archive_path, "rb") as fh:
+                level, _, _ = _read_file_header(fh)
+            return _rewrite(archive.scan(), samples, archive_path,
+                            os.path.getsize(archive_path), block_records, dictionary_size, level)
+        finally:
+            archive._writing = False
+
+
+def _rewrite(
+    rows: Iterable[Dict],
+    samples: List[bytes],
+    archive_path: str,
+    source_bytes: int,
+    block_records: int,
+    dictionary_size: int,
+    level: int
+) -> Dict:
+    tmp_path = archive_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    dictionary = train_dictionary(samples, dictionary_size)
+    with ArchiveWriter(tmp_path, dictionary, level, block_records) as writer:
+        for row in rows:
+            writer.write(row)
+    os.replace(tmp_path, archive_path)
+    archive_bytes = os.path.getsize(archive_path)
+    return {
+        "records": writer.records_written,
+        "source_bytes": source_bytes,
+        "archive_bytes": archive_bytes,
+        "ratio": round(source_bytes / archive_bytes, 2) if archive_bytes else None,
+    }
+
+
+_archives: Dict[str, DialogueArchive] = {}
+_archives_lock = threading.Lock()
+
+
+def get_dialogue_archive(path: str) -> DialogueArchive:
+    """Process-wide reader per archive, shared by all requests and writers."""
+    key = os.path.abspath(path)
+    with _archives_lock:
+        archive = _archives.get(key)
+        if archive is None:
+            archive = _archives[key] = DialogueArchive(path)
+        return archive
+
+
+def get_dialogue_log(path: str) -> Union[CsvOffsetIndex, DialogueArchive]:
+    """Dialogue history store for a path: an archive for *.dla, else the CSV index."""
+    if path.endswith(ARCHIVE_SUFFIX):
+        return get_dialogue_archive(path)
+    return get_csv_index(path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Dialogue archive maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_cmd = commands.add_parser("migrate", help="convert a dialogue CSV into an archive")
+    migrate_cmd.add_argument("csv")
+    migrate_cmd.add_argument("archive")
+    compact_cmd = commands.add_parser("compact", help="merge small blocks and retrain the dictionary")
+    compact_cmd.add_argument("archive")
+    for cmd in (migrate_cmd, compact_cmd):
+        cmd.add_argument("--block-records", type=int, default=256)
+        cmd.add_argument("--dictionary-size", type=int, default=MAX_DICTIONARY)
+    stats_cmd = commands.add_parser("stats", help="print record and block counts")
+    stats_cmd.add_argument("archive")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        result = migrate_csv(args.csv, args.archive, args.block_records, args.dictionary_size)
+    elif args.command == "compact":
+        result = compact(args.archive, args.block_records, args.dictionary_size)
+    else:
+        result = get_dialogue_archive(args.archive).get_stats()
+    print(json.dumps(result, indent=2))
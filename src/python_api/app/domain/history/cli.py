@@ -0,0 +1,85 @@
+from __future__ import annotations
+import json
+from typing import Dict, Iterator, Optional
+
+from .archive import get_dialogue_log
+from .index import get_csv_index, normalize_user_id, _to_int
+
+
+def _dialogue_record(row: Dict[str, str], include_dialogue: bool) -> Dict:
+    record = {
+        "user_id": normalize_user_id(row.get("user_id")),
+        "timestamp": _to_int(row.get("timestamp")),
+        "latent": row.get("latent"),
+    }
+    if include_dialogue:
+        dialogue = row.get("dialogue")
+        if isinstance(dialogue, str) or dialogue is None:
+            # CSV rows hold the dialogue as a JSON string; archive rows are decoded
+            try:
+                dialogue = json.loads(dialogue or "[]")
+            except ValueError:
+                pass
+        record["dialogue"] = dialogue
+    return record
+
+
+def _flashcard_record(row: Dict[str, str]) -> Dict:
+    record = {
+        "user_id": normalize_user_id(row.get("user_id")),
+        "concept": row.get("concept"),
+        "question": row.get("question"),
+        "answer": row.get("answer"),
+    }
+    if row.get("timestamp"):
+        record["timestamp"] = _to_int(row.get("timestamp"))
+    return record
+
+
+def _stream_page(records: Iterator[Dict], next_cursor: Optional[str], total: int) -> Iterator[str]:
+    """Emit {"items": [...], "next_cursor": ..., "total": ...} one item at a time."""
+    yield '{"items": ['
+    for i, record in enumerate(records):
+        yield ("," if i else "") + json.dumps(record, ensure_ascii=False)
+    yield '], "next_cursor": ' + json.dumps(next_cursor) + \
+        ', "total": ' + str(total) + '}'
+
+
+def stream_user_dialogues(
+    user_id,
+    dialogue_csv_path="../../data/dialogues.csv",
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    descending: bool = True,
+    include_dialogue: bool = True,
+) -> Iterator[str]:
+    """
+    Stream one page of a user's analyzed dialogues as JSON text chunks.
+
+    `dialogue_csv_path` may also name a compressed archive (*.dla).
+    Raises ValueError for a malformed cursor before any output is produced.
+    """
+    index = get_dialogue_log(dialogue_csv_path)
+    rows, next_cursor = index.page(user_id, cursor, limit, descending)
+    records = (_dialogue_record(row, include_dialogue)
+               for row in index.iter_rows(rows))
+    return _stream_page(records, next_cursor, index.count(user_id))
+
+
+def stream_user_flashcards(
+    user_id,
+    flashcards_csv_path="../../data/flashcards.csv",
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    descending: bool = True,
+) -> Iterator[str]:
+    """
+    Stream one page of a user's flashcards as JSON text chunks.
+
+    Cards written before timestamps were recorded sort by insertion order.
+    Raises ValueError for a malformed cursor before any output is produced.
+    """
+    index = get_csv_index(flashcards_csv_path)
+    rows, next_cursor = index.page(user_id, cursor, limit, descending)
+    records = (_flashcard_record(row) for row in index.iter_rows(rows))
+    return _stream_page(records, next_cursor, index.count(user_id))
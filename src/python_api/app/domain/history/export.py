@@ -0,0 +1,254 @@
+"""
+Incremental columnar export of dialogue and flashcard history.
+
+Each table is written as a Hive-partitioned dataset that pyarrow, pandas,
+DuckDB or Spark can query with partition pruning and column projection:
+
+    <out>/dialogues/date=2025-01-31/user_id=7/part-000000000000-0.parquet
+    <out>/flashcards/date=2025-01-31/user_id=7/part-000000000000-0.parquet
+
+Dialogue turns are stored as a list<struct<role, message>> column, so
+nothing has to parse JSON per row. Sources are read in chunks through
+their offset index (or archive), and a watermark per table in
+<out>/_export_state.json records how many source rows were exported;
+the next run writes only rows appended since. Part files are named
+after the first source row of their chunk; files at or past the
+watermark were left by an interrupted run and are deleted before the
+next one resumes, so no row is exported twice.
+
+Requires pyarrow (pip install pyarrow), which the API itself does not.
+
+    python -m app.domain.history.export ../../data/export
+    python -m app.domain.history.export ../../data/export --format ipc
+"""
+from __future__ import annotations
+import json
+import os
+import re
+import shutil
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from .archive import get_dialogue_log
+from .index import _file_lock, _to_int, get_csv_index, normalize_user_id
+
+VERSION = 1
+STATE_FILE = "_export_state.json"
+FORMATS = {"parquet": "parquet", "ipc": "arrow"}
+_PART_RE = re.compile(r"^part-(\d{12})-\d+\.")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+    except ImportError:
+        raise RuntimeError("Columnar export requires pyarrow: pip install pyarrow") from None
+    return pyarrow
+
+
+def _date(ts: int) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(ts))
+
+
+def _turns(dialogue: Any) -> List[Dict[str, str]]:
+    if isinstance(dialogue, str):
+        # CSV rows hold the dialogue as a JSON string; archive rows are decoded
+        try:
+            dialogue = json.loads(dialogue or "[]")
+        except ValueError:
+            return []
+    if not isinstance(dialogue, list):
+        return []
+    return [{"role": str(turn.get("role") or ""), "message": str(turn.get("message") or "")}
+            for turn in dialogue if isinstance(turn, dict)]
+
+
+def _dialogue_columns(rows: Iterable[Dict], start: int) -> Dict[str, List]:
+    columns: Dict[str, List] = {
+        "row_id": [], "date": [], "user_id": [], "timestamp": [],
+        "latent": [], "turns": [], "dialogue": []}
+    for row_id, row in enumerate(rows, start):
+        ts = _to_int(row.get("timestamp"))
+        turns = _turns(row.get("dialogue"))
+        columns["row_id"].append(row_id)
+        columns["date"].append(_date(ts))
+        columns["user_id"].append(normalize_user_id(row.get("user_id")))
+        columns["timestamp"].append(ts)
+        columns["latent"].append(row.get("latent") or "")
+        columns["turns"].append(len(turns))
+        columns["dialogue"].append(turns)
+    return columns
+
+
+def _flashcard_columns(rows: Iterable[Dict], start: int) -> Dict[str, List]:
+    columns: Dict[str, List] = {
+        "row_id": [], "date": [], "user_id": [], "timestamp": [],
+        "concept": [], "question": [], "answer": []}
+    for row_id, row in enumerate(rows, start):
+        ts = _to_int(row.get("timestamp"))
+        columns["row_id"].append(row_id)
+        columns["date"].append(_date(ts))
+        columns["user_id"].append(normalize_user_id(row.get("user_id")))
+        columns["timestamp"].append(ts)
+        for field in ("concept", "question", "answer"):
+            columns[field].append(row.get(field) or "")
+    return columns
+
+
+def _discard_uncommitted(table_dir: str, rows: int) -> int:
+    """Delete part files starting at or past the watermark; returns how many."""
+    removed = 0
+    for root, _, files in os.walk(table_dir):
+        for name in files:
+            match = _PART_RE.match(name)
+            if match and int(match.group(1)) >= rows:
+                os.remove(os.path.join(root, name))
+                removed += 1
+    return removed
+
+
+def _schemas(pa) -> Dict[str, Any]:
+    common = [
+        ("row_id", pa.int64()),
+        ("date", pa.string()),
+        ("user_id", pa.string()),
+        ("timestamp", pa.int64()),
+    ]
+    turn = pa.struct([("role", pa.string()), ("message", pa.string())])
+    return {
+        "dialogues": pa.schema(common + [
+            ("latent", pa.string()),
+            ("turns", pa.int32()),
+            ("dialogue", pa.list_(turn)),
+        ]),
+        "flashcards": pa.schema(common + [
+            ("concept", pa.string()),
+            ("question", pa.string()),
+            ("answer", pa.string()),
+        ]),
+    }
+
+
+class HistoryExporter:
+    """
+    Writes new dialogue and flashcard rows to partitioned columnar datasets.
+
+    Only one export per output directory runs at a time (an advisory file
+    lock); the watermark is saved after every chunk, so an interrupted run
+    resumes where it stopped.
+    """
+
+    def __init__(
+        self,
+        out_dir: str,
+        dialogue_path: str,
+        flashcards_csv_path: str,
+        format: str = "parquet",
+        chunk_rows: int = 50_000
+    ):
+        if format not in FORMATS:
+            raise ValueError(f"format must be one of {sorted(FORMATS)}")
+        self.out_dir = out_dir
+        self.format = format
+        self.chunk_rows = chunk_rows
+        self.state_path = os.path.join(out_dir, STATE_FILE)
+        self.lock_path = os.path.join(out_dir, ".export.lock")
+        self.sources = {"dialogues": dialogue_path, "flashcards": flashcards_csv_path}
+
+    def _load_state(self) -> Dict:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as fh:
+                state = json.load(fh)
+        except (FileNotFoundError, ValueError):
+            state = {}
+        if state.get("version") != VERSION or state.get("format") != self.format:
+            state = {"version": VERSION, "format": self.format, "tables": {}}
+        return state
+
+    def _save_state(self, state: Dict) -> None:
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(state, fh, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def _write_chunk(self, pa, table_name: str, columns: Dict[str, List], start: int) -> None:
+        table = pa.Table.from_pydict(columns, schema=_schemas(pa)[table_name])
+        file_format = pa.dataset.ParquetFileFormat() if self.format == "parquet" else pa.dataset.IpcFileFormat()
+        options = file_format.make_write_options(
+            **({"compression": "zstd"} if self.format == "parquet" else {}))
+        pa.dataset.write_dataset(
+            table,
+            os.path.join(self.out_dir, table_name),
+            format=file_format,
+            file_options=options,
+            partitioning=pa.dataset.partitioning(
+                pa.schema([("date", pa.string()), ("user_id", pa.string())]), flavor="hive"),
+            basename_template=f"part-{start:012d}-{{i}}.{FORMATS[self.format]}",
+            existing_data_behavior="overwrite_or_ignore",
+            max_partitions=max(1024, len(table)),
+        )
+
+    def _export_table(self, pa, state: Dict, table_name: str) -> Dict[str, int]:
+        source = self.sources[table_name]
+        log = get_dialogue_log(source) if table_name == "dialogues" else get_csv_index(source)
+        to_columns = _dialogue_columns if table_name == "dialogues" else _flashcard_columns
+        total = len(log)
+
+        watermark = state["tables"].get(table_name)
+        if watermark is None or watermark["source"] != os.path.abspath(source) or total < watermark["rows"]:
+            # New, different or rewritten source: export it from scratch
+            shutil.rmtree(os.path.join(self.out_dir, table_name), ignore_errors=True)
+            watermark = state["tables"][table_name] = {"source": os.path.abspath(source), "rows": 0}
+
+        start = watermark["rows"]
+        _discard_uncommitted(os.path.join(self.out_dir, table_name), start)
+        for chunk_start in range(start, total, self.chunk_rows):
+            chunk_stop = min(chunk_start + self.chunk_rows, total)
+            columns = to_columns(log.read_range(chunk_start, chunk_stop), chunk_start)
+            self._write_chunk(pa, table_name, columns, chunk_start)
+            watermark["rows"] = chunk_stop
+            watermark["exported_at"] = int(time.time())
+            self._save_state(state)
+        return {"exported": total - start, "total": total}
+
+    def run(self, tables: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+        """
+        Export rows appended since the last run.
+
+        Args:
+            tables: Subset of "dialogues" and "flashcards"; both by default
+
+        Returns:
+            {table: {"exported": rows written now, "total": rows in the source}}
+        """
+        pa = _pyarrow()
+        os.makedirs(self.out_dir, exist_ok=True)
+        with _file_lock(self.lock_path):
+            state = self._load_state()
+            results = {name: self._export_table(pa, state, name)
+                       for name in tables or list(self.sources)}
+            self._save_state(state)
+            return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export history to partitioned Parquet/Arrow datasets")
+    parser.add_argument("out_dir", nargs="?", default="../../data/export")
+    parser.add_argument("--dialogues", default=os.getenv("DIALOGUES_CSV", "../../data/dialogues.csv"))
+    parser.add_argument("--flashcards", default=os.getenv("FLASHCARDS_CSV", "../../data/flashcards.csv"))
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    parser.add_argument("--chunk-rows", type=int, default=50_000)
+    parser.add_argument("--table", action="append", choices=["dialogues", "flashcards"],
+                        help="export only this table (repeatable)")
+    args = parser.parse_args()
+
+    exporter = HistoryExporter(args.out_dir, args.dialogues, args.flashcards,
+                               format=args.format, chunk_rows=args.chunk_rows)
+    try:
+        result = exporter.run(args.table)
+    except RuntimeError as e:
+        parser.exit(1, f"{e}\n")
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,228 @@
+"""
+Per-user aggregates of extracted latent concepts ("knowledge gaps").
+
+    python -m app.domain.history.gaps rebuild ../../data/dialogues.csv
+"""
+from __future__ import annotations
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+from .archive import get_dialogue_log
+from .index import _to_int, normalize_user_id
+from ..flashcard.concepts import concept_key
+
+VERSION = 1
+
+
+class _UserGaps:
+    """Counts per concept plus a top-k list kept exact as counts only grow."""
+
+    def __init__(self, top_k: int):
+        self.top_k = top_k
+        self.concepts: Dict[str, Dict] = {}
+        self.top: List[str] = []
+        self.dialogues = 0
+        self.recurring = 0
+        self.first_seen: Optional[int] = None
+        self.last_seen: Optional[int] = None
+
+    def add(self, key: str, latent: str, ts: int) -> None:
+        self.dialogues += 1
+        self.first_seen = ts if self.first_seen is None else min(self.first_seen, ts)
+        self.last_seen = ts if self.last_seen is None else max(self.last_seen, ts)
+
+        entry = self.concepts.get(key)
+        if entry is None:
+            entry = self.concepts[key] = {
+                "latent": latent, "count": 0, "first_seen": ts, "last_seen": ts}
+        entry["count"] += 1
+        entry["first_seen"] = min(entry["first_seen"], ts)
+        entry["last_seen"] = max(entry["last_seen"], ts)
+        if entry["count"] == 2:
+            self.recurring += 1
+
+        if key not in self.top:
+            if len(self.top) < self.top_k:
+                self.top.append(key)
+            elif self._rank(key) > self._rank(self.top[-1]):
+                self.top[-1] = key
+            else:
+                return
+        self.top.sort(key=self._rank, reverse=True)
+
+    def _rank(self, key: str):
+        # Most frequent first; ties go to the more recently seen concept
+        entry = self.concepts[key]
+        return entry["count"], entry["last_seen"]
+
+    def to_dict(self) -> Dict:
+        return {
+            "concepts": self.concepts,
+            "top": self.top,
+            "dialogues": self.dialogues,
+            "recurring": self.recurring,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict, top_k: int) -> "_UserGaps":
+        gaps = cls(top_k)
+        gaps.concepts = data["concepts"]
+        gaps.dialogues = data["dialogues"]
+        gaps.recurring = data["recurring"]
+        gaps.first_seen = data["first_seen"]
+        gaps.last_seen = data["last_seen"]
+        gaps.top = sorted(gaps.concepts, key=gaps._rank, reverse=True)[:top_k]
+        return gaps
+
+
+class LatentAggregates:
+    """
+    Materialized per-user latent-concept statistics over the dialogue log.
+
+    Latents are grouped by concept_key(), so spelling variants of one gap
+    count together. The aggregates follow the dialogue log (CSV or
+    archive) by row count: refresh() folds in only rows past the
+    watermark, which summarize_dialogue_async calls right after saving.
+    A snapshot (<dialogues>.gaps.json) is written every snapshot_every
+    new rows so a restart resumes from it instead of rescanning history.
+    """
+
+    def __init__(
+        self,
+        dialogue_path: str,
+        top_k: int = 20,
+        snapshot_every: int = 200,
+        snapshot_path: Optional[str] = None
+    ):
+        self.dialogue_path = dialogue_path
+        self.top_k = top_k
+        self.snapshot_every = snapshot_every
+        self.snapshot_path = snapshot_path or dialogue_path + ".gaps.json"
+        self._lock = threading.RLock()
+        self._users: Dict[str, _UserGaps] = {}
+        self._rows = 0
+        self._snapshot_rows = 0
+        self._loaded = False
+
+    def _load_snapshot(self) -> None:
+        self._loaded = True
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return
+        if data.get("version") != VERSION or data.get("top_k") != self.top_k:
+            return
+        self._users = {user: _UserGaps.from_dict(gaps, self.top_k)
+                       for user, gaps in data["users"].items()}
+        self._rows = self._snapshot_rows = data["rows"]
+
+    def _write_snapshot(self) -> None:
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump({
+                "version": VERSION,
+                "top_k": self.top_k,
+                "rows": self._rows,
+                "users": {user: gaps.to_dict() for user, gaps in self._users.items()},
+            }, fh, ensure_ascii=False)
+        os.replace(tmp_path, self.snapshot_path)
+        self._snapshot_rows = self._rows
+
+    def _add_row(self, row: Dict) -> None:
+        latent = row.get("latent") or ""
+        key = concept_key(latent)
+        if not key:
+            return
+        user = normalize_user_id(row.get("user_id"))
+        gaps = self._users.get(user)
+        if gaps is None:
+            gaps = self._users[user] = _UserGaps(self.top_k)
+        gaps.add(key, latent, _to_int(row.get("timestamp")))
+
+    def refresh(self) -> int:
+        """Fold in dialogues saved since the last refresh; returns how many."""
+        log = get_dialogue_log(self.dialogue_path)
+        total = len(log)
+        with self._lock:
+            if not self._loaded:
+                self._load_snapshot()
+            if total < self._rows:
+                # Log was replaced by a shorter one; start over
+                self._users.clear()
+                self._rows = self._snapshot_rows = 0
+            if total == self._rows:
+                return 0
+            start = self._rows
+            for row in log.read_range(start, total):
+                self._add_row(row)
+            self._rows = total
+            if self._rows - self._snapshot_rows >= self.snapshot_every:
+                self._write_snapshot()
+            return total - start
+
+    def rebuild(self) -> Dict[str, int]:
+        """Recompute everything from the full log and write a fresh snapshot."""
+        with self._lock:
+            self._loaded = True
+            self._users.clear()
+            self._rows = self._snapshot_rows = 0
+            self.refresh()
+            self._write_snapshot()
+            return {"dialogues": self._rows, "users": len(self._users)}
+
+    def get_user_gaps(self, user_id, k: int = 10) -> Dict:
+        """
+        A user's most frequent latent concepts, from the maintained top-k.
+
+        Returns:
+            {"user_id", "dialogues", "distinct_concepts", "recurring",
+             "first_seen", "last_seen", "gaps": [{"concept", "latent",
+             "count", "first_seen", "last_seen"}, ...]}
+        """
+        self.refresh()
+        user = normalize_user_id(user_id)
+        with self._lock:
+            gaps = self._users.get(user) or _UserGaps(self.top_k)
+            return {
+                "user_id": user,
+                "dialogues": gaps.dialogues,
+                "distinct_concepts": len(gaps.concepts),
+                "recurring": gaps.recurring,
+                "first_seen": gaps.first_seen,
+                "last_seen": gaps.last_seen,
+                "gaps": [{"concept": key, **gaps.concepts[key]}
+                         for key in gaps.top[:min(k, self.top_k)]],
+            }
+
+
+_aggregates: Dict[str, LatentAggregates] = {}
+_aggregates_lock = threading.Lock()
+
+
+def get_latent_aggregates(dialogue_path: str) -> LatentAggregates:
+    """Process-wide aggregates for a dialogue CSV or archive."""
+    key = os.path.abspath(dialogue_path)
+    with _aggregates_lock:
+        aggregates = _aggregates.get(key)
+        if aggregates is None:
+            aggregates = _aggregates[key] = LatentAggregates(
+                dialogue_path, top_k=int(os.getenv("GAPS_TOP_K", "20")))
+        return aggregates
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Per-user latent concept aggregates")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild_cmd = commands.add_parser("rebuild", help="recompute from the whole dialogue log")
+    rebuild_cmd.add_argument("dialogues", nargs="?", default=os.getenv(
+        "DIALOGUES_CSV", "../../data/dialogues.csv"))
+    args = parser.parse_args()
+
+    print(json.dumps(get_latent_aggregates(args.dialogues).rebuild(), indent=2))
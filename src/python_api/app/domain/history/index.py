@@ -0,0 +1,484 @@
+from __future__ import annotations
+import base64
+import bisect
+import csv
+import fcntl
+import io
+import itertools
+import json
+import os
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Dialogue rows embed a full JSON dump, well past the csv module default
+csv.field_size_limit(2**31 - 1)
+
+
+def normalize_user_id(value) -> str:
+    """Canonical string form of a user_id cell ("3", "3.0" and 3 are equal)."""
+    if value is None:
+        return ""
+    text = str(value).strip()
+    if text.lower() == "nan":
+        return ""
+    if text.endswith(".0") and text[:-2].lstrip("-").isdigit():
+        return text[:-2]
+    return text
+
+
+def _to_int(value) -> int:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def encode_cursor(key: Tuple[int, int]) -> str:
+    raw = json.dumps(list(key)).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """Inverse of encode_cursor; raises ValueError on malformed input."""
+    try:
+        ts, row = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return int(ts), int(row)
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {cursor}") from e
+
+
+def page_keys(
+    keys: List[Tuple[int, int]],
+    cursor: Optional[str],
+    limit: int,
+    descending: bool
+) -> Tuple[List[int], Optional[str]]:
+    """One page of row ids from sorted (timestamp, row) keys."""
+    if descending:
+        end = len(keys) if cursor is None else bisect.bisect_left(
+            keys, decode_cursor(cursor))
+        selected = keys[max(0, end - limit):end][::-1]
+        has_more = end - limit > 0
+    else:
+        start = 0 if cursor is None else bisect.bisect_right(
+            keys, decode_cursor(cursor))
+        selected = keys[start:start + limit]
+        has_more = start + limit < len(keys)
+
+    next_cursor = encode_cursor(
+        selected[-1]) if selected and has_more else None
+    return [row for _, row in selected], next_cursor
+
+
+class CsvOffsetIndex:
+    """
+    Byte-offset index over a CSV history file, persisted as a sidecar.
+
+    The sidecar (<csv>.idx) holds one line per data row with its byte offset,
+    length, timestamp and user_id, so single rows and ranges are read with a
+    seek instead of a full parse. Rows appended through append_row(), or by
+    another process, are picked up by scanning only the bytes past the last
+    indexed offset. Every process brings the shared sidecar up to date under
+    an exclusive lock of its own (<csv>.idx.lock), adding only the rows it
+    does not hold yet. Adding a column rewrites the file with os.replace(); the
+    new inode tells every other process to drop its offsets and re-index.
+    Rows without a timestamp column sort by insertion order.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str, timestamp_column: str = "timestamp"):
+        self.path = path
+        self.idx_path = path + ".idx"
+        self.idx_lock_path = self.idx_path + ".lock"
+        self.lock_path = path + ".lock"
+        self.timestamp_column = timestamp_column
+        self._lock = threading.RLock()
+        self._writing = False
+        self._reset()
+
+    def _reset(self) -> None:
+        self.inode: Optional[int] = None
+        self.header: Optional[List[str]] = None
+        self.header_end = 0
+        self.covered = 0
+        self.offsets: List[int] = []
+        self.lengths: List[int] = []
+        self.timestamps: List[int] = []
+        self.users: List[str] = []
+        self._by_user: Dict[str, List[Tuple[int, int]]] = {}
+
+    # -- index maintenance -------------------------------------------------
+
+    def _ensure_fresh(self) -> None:
+        with self._lock:
+            if self._stat() == (self.covered, self.inode):
+                return
+            # Shared lock: never index a record another process is still writing
+            lock = nullcontext() if self._writing else _file_lock(
+                self.lock_path, shared=True)
+            with lock:
+                size, inode = self._stat()
+                if inode != self.inode:
+                    # Replaced (e.g. a header extended by another process): our
+                    # offsets describe the old file. Its sidecar is checked on load.
+                    self._reset()
+                    self.inode = inode
+                elif size < self.covered:
+                    # File was truncated underneath us
+                    self._reset()
+                    self.inode = inode
+                    self._drop_sidecar()
+                if self.covered == 0 and size:
+                    self._load_sidecar(size)
+                if size > self.covered:
+                    self._scan_from(self.covered)
+
+    def _size(self) -> int:
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def _stat(self) -> Tuple[int, int]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return 0, 0
+        return stat.st_size, stat.st_ino
+
+    def _open(self, select):
+        """
+        Open the data file along with select()'s view of the index over it.
+
+        select() runs under the index lock; the open file is checked to be
+        the one the offsets were taken from, so a concurrent rewrite cannot
+        pair new bytes with old offsets.
+        """
+        while True:
+            self._ensure_fresh()
+            with self._lock:
+                try:
+                    fh = open(self.path, "rb")
+                except FileNotFoundError:
+                    if self.inode:
+                        continue
+                    # Nothing indexed yet either
+                    return io.BytesIO(), select()
+                try:
+                    if os.fstat(fh.fileno()).st_ino == self.inode:
+                        return fh, select()
+                except BaseException:
+                    fh.close()
+                    raise
+            fh.close()
+
+    def _drop_sidecar(self) -> None:
+        try:
+            os.remove(self.idx_path)
+        except FileNotFoundError:
+            pass
+
+    def _load_sidecar(self, size: int) -> None:
+        """Adopt the persisted index if it still matches the data file."""
+        try:
+            with _file_lock(self.idx_lock_path, shared=True), \
+                    open(self.idx_path, "r", encoding="utf-8", newline="") as fh:
+                meta = json.loads(fh.readline())
+                entries = list(csv.reader(fh))
+        except (FileNotFoundError, ValueError):
+            self._drop_sidecar()
+            return
+
+        if meta.get("version") != self.VERSION or meta.get("timestamp_column") != self.timestamp_column:
+            self._drop_sidecar()
+            return
+        with open(self.path, "rb") as data:
+            head = data.read(meta["header_end"])
+            if self._parse_record(head) != meta["header"]:
+                self._drop_sidecar()
+                return
+            if entries:
+                end = int(entries[-1][0]) + int(entries[-1][1])
+                data.seek(end - 1)
+                if end > size or data.read(1) != b"\n":
+                    self._drop_sidecar()
+                    return
+
+        self.header = meta["header"]
+        self.header_end = self.covered = meta["header_end"]
+        # Records are contiguous, so each entry must start where the last
+        # ended; repeated entries (from sidecars written by older versions)
+        # are skipped, and anything past a gap is re-scanned from the file
+        clean = True
+        for offset, length, ts, user in entries:
+            offset = int(offset)
+            if offset != self.covered:
+                clean = False
+                if offset < self.covered:
+                    continue
+                break
+            self._add_entry(offset, int(length), int(ts), user)
+        if not clean:
+            self._persist(rewrite=True)
+
+    def _add_entry(self, offset: int, length: int, ts: int, user: str) -> None:
+        row = len(self.offsets)
+        self.offsets.append(offset)
+        self.lengths.append(length)
+        self.timestamps.append(ts)
+        self.users.append(user)
+        keys = self._by_user.setdefault(user, [])
+        if keys and keys[-1] > (ts, row):
+            bisect.insort(keys, (ts, row))
+        else:
+            keys.append((ts, row))
+        self.covered = offset + length
+
+    @staticmethod
+    def _parse_record(raw: bytes) -> List[str]:
+        return next(csv.reader(io.StringIO(raw.decode("utf-8"), newline="")), [])
+
+    def _scan_from(self, start: int) -> None:
+        """Index complete records from byte `start` to EOF and persist them."""
+        with open(self.path, "rb") as fh:
+            fh.seek(start)
+            offset = start
+            record = b""
+            for line in fh:
+                record += line
+                # A record is complete once its quotes balance and it ends a line
+                if record.count(b'"') % 2 or not record.endswith(b"\n"):
+                    continue
+                if self.header is None:
+                    self.header = self._parse_record(record)
+                    self.header_end = self.covered = offset + len(record)
+                else:
+                    values = dict(zip(self.header, self._parse_record(record)))
+                    ts = _to_int(values.get(self.timestamp_column))
+                    user = normalize_user_id(values.get("user_id"))
+                    self._add_entry(offset, len(record), ts, user)
+                offset += len(record)
+                record = b""
+
+            # A final record without a trailing newline (hand-edited files)
+            if record and self.header is not None and record.count(b'"') % 2 == 0:
+                values = dict(zip(self.header, self._parse_record(record)))
+                ts = _to_int(values.get(self.timestamp_column))
+                user = normalize_user_id(values.get("user_id"))
+                self._add_entry(offset, len(record), ts, user)
+
+        self._persist(rewrite=start == 0)
+
+    def _sidecar_end(self) -> Optional[int]:
+        """Byte offset the sidecar's entries reach, or None if it must be rewritten."""
+        try:
+            with open(self.idx_path, "rb") as fh:
+                meta = json.loads(fh.readline())
+                body = fh.tell()
+                size = fh.seek(0, os.SEEK_END)
+                fh.seek(max(body, size - 4096))
+                tail = fh.read()
+        except (FileNotFoundError, ValueError):
+            return None
+        if (meta.get("version") != self.VERSION
+                or meta.get("timestamp_column") != self.timestamp_column
+                or meta.get("header") != self.header
+                or meta.get("header_end") != self.header_end):
+            return None
+        if not tail:
+            return self.header_end
+        if not tail.endswith(b"\n"):
+            return None
+        try:
+            offset, length = tail[:-1].rsplit(b"\n", 1)[-1].split(b",")[:2]
+            return int(offset) + int(length)
+        except ValueError:
+            return None
+
+    def _persist(self, rewrite: bool = False) -> None:
+        """
+        Bring the shared sidecar up to what this process has indexed.
+
+        Other processes scan the same appended bytes, so under the exclusive
+        sidecar lock only entries past the sidecar's last one are appended.
+        A sidecar that does not line up with this index is rewritten whole.
+        """
+        if self.header is None:
+            return
+        with _file_lock(self.idx_lock_path):
+            end = None if rewrite else self._sidecar_end()
+            if end is not None:
+                first = bisect.bisect_left(self.offsets, end)
+                boundary = self.offsets[first] if first < len(self.offsets) else self.covered
+                if boundary != end:
+                    end = None
+            entries = zip(self.offsets, self.lengths, self.timestamps, self.users)
+            if end is None:
+                tmp_path = f"{self.idx_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8", newline="") as fh:
+                    fh.write(json.dumps({
+                        "version": self.VERSION,
+                        "timestamp_column": self.timestamp_column,
+                        "header": self.header,
+                        "header_end": self.header_end,
+                    }) + "\n")
+                    csv.writer(fh, lineterminator="\n").writerows(entries)
+                os.replace(tmp_path, self.idx_path)
+            elif first < len(self.offsets):
+                with open(self.idx_path, "a", encoding="utf-8", newline="") as fh:
+                    csv.writer(fh, lineterminator="\n").writerows(
+                        itertools.islice(entries, first, None))
+
+    # -- writes ------------------------------------------------------------
+
+    def append_row(self, row: Dict) -> int:
+        """
+        Append one record and index it; returns its row id.
+
+        Columns the file does not have yet are added to the header with a
+        one-off rewrite, after which writes are plain appends again.
+        """
+        return self.append_rows([row])
+
+    def append_rows(self, rows: List[Dict]) -> int:
+        """Append many records with a single write; returns the last row id."""
+        if not rows:
+            return len(self) - 1
+        with self._lock, _file_lock(self.lock_path):
+            self._writing = True
+            try:
+                self._ensure_fresh()
+                if self._size() and not self._ends_with_newline():
+                    # Terminate the last record, then re-index it with its newline
+                    with open(self.path, "ab") as fh:
+                        fh.write(b"\n")
+                    self._reset()
+                    self._drop_sidecar()
+                    self._ensure_fresh()
+                columns = list(dict.fromkeys(c for row in rows for c in row))
+                if self.header is not None:
+                    missing = [c for c in columns if c not in self.header]
+                    if missing:
+                        self._extend_header(missing)
+                header = self.header or columns
+
+                buf = io.StringIO()
+                writer = csv.writer(buf, lineterminator="\n")
+                if self.header is None:
+                    writer.writerow(header)
+                writer.writerows(["" if row.get(c) is None else row.get(c)
+                                  for c in header] for row in rows)
+                with open(self.path, "ab") as fh:
+                    fh.write(buf.getvalue().encode("utf-8"))
+
+                self._ensure_fresh()
+                return len(self.offsets) - 1
+            finally:
+                self._writing = False
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as fh:
+            fh.seek(-1, os.SEEK_END)
+            return fh.read(1) == b"\n"
+
+    def _extend_header(self, columns: List[str]) -> None:
+        tmp_path = self.path + ".tmp"
+        pad = ("," * len(columns)).encode("utf-8")
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator="\n").writerow(self.header + columns)
+        with open(self.path, "rb") as src, open(tmp_path, "wb") as dst:
+            dst.write(buf.getvalue().encode("utf-8"))
+            for offset, length in zip(self.offsets, self.lengths):
+                src.seek(offset)
+                record = src.read(length)
+                newline = b"\r\n" if record.endswith(b"\r\n") else b"\n"
+                dst.write(record[:-len(newline)] + pad + newline)
+        os.replace(tmp_path, self.path)
+        self._reset()
+        self.inode = self._stat()[1]
+        self._drop_sidecar()
+        self._scan_from(0)
+
+    # -- reads -------------------------------------------------------------
+
+    def __len__(self) -> int:
+        self._ensure_fresh()
+        return len(self.offsets)
+
+    def read_row(self, row_id: int) -> Dict[str, str]:
+        """Random access to a single record by row id."""
+        return next(self.iter_rows([row_id]))
+
+    def read_range(self, start: int, stop: int) -> Iterator[Dict[str, str]]:
+        """Contiguous rows [start, stop) with a single seek."""
+        def select():
+            last = min(stop, len(self.offsets))
+            if start >= last:
+                return None
+            return self.offsets[start], self.offsets[last - 1] + self.lengths[last - 1], self.header
+
+        fh, span = self._open(select)
+        with fh:
+            if span is None:
+                return iter(())
+            begin, end, header = span
+            fh.seek(begin)
+            raw = fh.read(end - begin)
+        reader = csv.reader(io.StringIO(raw.decode("utf-8"), newline=""))
+        return (dict(zip(header, values)) for values in reader)
+
+    def page(
+        self,
+        user_id,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+        descending: bool = True
+    ) -> Tuple[List[int], Optional[str]]:
+        """
+        Select one page of row ids for a user.
+
+        Returns:
+            (row ids in requested order, cursor for the next page or None)
+        """
+        self._ensure_fresh()
+        with self._lock:
+            keys = self._by_user.get(normalize_user_id(user_id), [])
+            return page_keys(keys, cursor, limit, descending)
+
+    def count(self, user_id) -> int:
+        self._ensure_fresh()
+        with self._lock:
+            return len(self._by_user.get(normalize_user_id(user_id), []))
+
+    def iter_rows(self, row_ids: List[int]) -> Iterator[Dict[str, str]]:
+        """Read the given rows by seeking straight to each one."""
+        fh, (spans, header) = self._open(
+            lambda: ([(self.offsets[r], self.lengths[r]) for r in row_ids], self.header))
+        with fh:
+            for offset, length in spans:
+                fh.seek(offset)
+                yield dict(zip(header, self._parse_record(fh.read(length))))
+
+
+@contextmanager
+def _file_lock(path: str, shared: bool = False):
+    """Advisory lock so appends from several processes do not interleave."""
+    with open(path, "a") as fh:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+_indexes: Dict[Tuple[str, str], CsvOffsetIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_csv_index(path: str, timestamp_column: str = "timestamp") -> CsvOffsetIndex:
+    """Process-wide index per file, shared by all requests and writers."""
+    key = (os.path.abspath(path), timestamp_column)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = CsvOffsetIndex(path, timestamp_column)
+        return index
@@ -0,0 +1,251 @@
+from __future__ import annotations
+import heapq
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+from ..history.index import _file_lock, get_csv_index, normalize_user_id
+from ..flashcard.concepts import concept_key
+
+_DAY = 86400
+
+
+@dataclass
+class CardState:
+    """SM-2 schedule of one card for one user."""
+    repetitions: int = 0
+    interval_days: float = 0.0
+    ease: float = 2.5
+    due: float = 0.0
+    reviews: int = 0
+    lapses: int = 0
+    last_reviewed: Optional[float] = None
+
+
+def sm2(state: CardState, quality: int, now: float) -> CardState:
+    """
+    Next schedule after answering with `quality` (0-5, SuperMemo grades).
+
+    Grades below 3 are lapses: the card starts over at a one-day interval.
+    Ease is adjusted on every answer and never drops below 1.3.
+    """
+    if not 0 <= quality <= 5:
+        raise ValueError("quality must be between 0 and 5")
+    if quality < 3:
+        repetitions, interval, lapses = 0, 1.0, state.lapses + 1
+    else:
+        repetitions, lapses = state.repetitions + 1, state.lapses
+        if repetitions == 1:
+            interval = 1.0
+        elif repetitions == 2:
+            interval = 6.0
+        else:
+            interval = round(state.interval_days * state.ease, 2)
+    ease = max(1.3, state.ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return CardState(
+        repetitions=repetitions,
+        interval_days=interval,
+        ease=round(ease, 4),
+        due=now + interval * _DAY,
+        reviews=state.reviews + 1,
+        lapses=lapses,
+        last_reviewed=now,
+    )
+
+
+class _Deck:
+    """One user's cards with a due-date min-heap (stale entries skipped lazily)."""
+
+    def __init__(self):
+        self.rows: Dict[str, int] = {}     # card key -> flashcard row id
+        self.created: Dict[str, float] = {}
+        self.heap: List[Tuple[float, int, str]] = []
+        self.cards_seen = 0
+
+
+class ReviewScheduler:
+    """
+    Spaced-repetition queue over the cards each user owns.
+
+    A user's deck is their rows in the flashcard CSV, one card per
+    concept_key(). Unreviewed cards are due from the moment they were
+    written. Each deck keeps a heap of (due, row, card); answering a card
+    pushes its new due date and leaves the old entry to be discarded when
+    it surfaces, so both "next due" and "record answer" are O(log n).
+
+    Answers are appended to a JSON-lines log carrying the resulting state.
+    Every process follows the log from its last offset, so workers agree
+    on schedules without ever replaying or rewriting the whole history.
+    """
+
+    def __init__(self, flashcards_csv_path: str, log_path: Optional[str] = None):
+        self.flashcards_csv_path = flashcards_csv_path
+        self.log_path = log_path or flashcards_csv_path + ".reviews.jsonl"
+        self.lock_path = self.log_path + ".lock"
+        self._lock = threading.RLock()
+        self._states: Dict[str, Dict[str, CardState]] = {}
+        self._decks: Dict[str, _Deck] = {}
+        self._log_offset = 0
+
+    # -- log ---------------------------------------------------------------
+
+    def _sync_log(self) -> None:
+        """Apply answers appended since the last read, by any process."""
+        try:
+            size = os.path.getsize(self.log_path)
+        except FileNotFoundError:
+            return
+        if size == self._log_offset:
+            return
+        with open(self.log_path, "rb") as fh:
+            fh.seek(self._log_offset)
+            data = fh.read(size - self._log_offset)
+        # Leave a line still being written for the next sync
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            self._apply(entry["user_id"], entry["card"], CardState(**entry["state"]))
+        self._log_offset += end
+
+    def _apply(self, user: str, key: str, state: CardState) -> None:
+        self._states.setdefault(user, {})[key] = state
+        deck = self._decks.get(user)
+        if deck is not None and key in deck.rows:
+            heapq.heappush(deck.heap, (state.due, deck.rows[key], key))
+
+    # -- decks -------------------------------------------------------------
+
+    def _deck(self, user: str) -> _Deck:
+        """The user's deck, extended with any cards written since last time."""
+        index = get_csv_index(self.flashcards_csv_path)
+        deck = self._decks.get(user)
+        if deck is None:
+            deck = self._decks[user] = _Deck()
+        total = index.count(user)
+        if total == deck.cards_seen:
+            return deck
+
+        row_ids, _ = index.page(user, limit=total, descending=False)
+        known = set(deck.rows.values())
+        new_rows = [r for r in row_ids if r not in known]
+        states = self._states.get(user, {})
+        for row_id, row in zip(new_rows, index.iter_rows(new_rows)):
+            key = concept_key(row.get("concept") or "")
+            if not key or key in deck.rows:
+                continue
+            deck.rows[key] = row_id
+            deck.created[key] = float(index.timestamps[row_id])
+            state = states.get(key)
+            due = state.due if state is not None else deck.created[key]
+            heapq.heappush(deck.heap, (due, row_id, key))
+        deck.cards_seen = total
+        return deck
+
+    def _due(self, user: str, deck: _Deck, key: str) -> float:
+        state = self._states.get(user, {}).get(key)
+        return state.due if state is not None else deck.created[key]
+
+    def _peek(self, user: str, deck: _Deck) -> Optional[Tuple[float, int, str]]:
+        while deck.heap:
+            due, row_id, key = deck.heap[0]
+            if due == self._due(user, deck, key):
+                return deck.heap[0]
+            heapq.heappop(deck.heap)
+        return None
+
+    def _card(self, user: str, key: str, row: Dict[str, str], now: float) -> Dict:
+        deck = self._decks[user]
+        state = self._states.get(user, {}).get(key) or CardState(due=deck.created[key])
+        return {
+            "card": key,
+            "concept": row.get("concept"),
+            "question": row.get("question"),
+            "answer": row.get("answer"),
+            "due_at": state.due,
+            "is_due": state.due <= now,
+            "repetitions": state.repetitions,
+            "interval_days": state.interval_days,
+            "ease": state.ease,
+            "reviews": state.reviews,
+            "lapses": state.lapses,
+            "last_reviewed": state.last_reviewed,
+        }
+
+    # -- API ---------------------------------------------------------------
+
+    def next_card(self, user_id, now: Optional[float] = None) -> Optional[Dict]:
+        """
+        The user's card with the earliest due date, due or not.
+
+        Returns:
+            Card dict with its schedule ("is_due" tells whether it is due
+            yet), or None if the user has no cards
+        """
+        user = normalize_user_id(user_id)
+        now = time.time() if now is None else now
+        with self._lock:
+            self._sync_log()
+            deck = self._deck(user)
+            top = self._peek(user, deck)
+            if top is None:
+                return None
+            _, row_id, key = top
+        row = get_csv_index(self.flashcards_csv_path).read_row(row_id)
+        with self._lock:
+            return self._card(user, key, row, now)
+
+    def record_answer(self, user_id, card: str, quality: int, now: Optional[float] = None) -> Optional[Dict]:
+        """
+        Reschedule a card after the user answered it.
+
+        `card` is matched by concept_key(), so the concept as shown or the
+        "card" key from next_card() both work.
+
+        Returns:
+            The card with its new schedule, or None if the user has no such card
+        """
+        user = normalize_user_id(user_id)
+        key = concept_key(card)
+        now = time.time() if now is None else now
+        with self._lock, _file_lock(self.lock_path):
+            # Catch up under the file lock so concurrent answers build on each other
+            self._sync_log()
+            deck = self._deck(user)
+            if key not in deck.rows:
+                return None
+            current = self._states.get(user, {}).get(key) or CardState(due=deck.created[key])
+            state = sm2(current, quality, now)
+            line = json.dumps({
+                "user_id": user,
+                "card": key,
+                "quality": quality,
+                "state": asdict(state),
+            }) + "\n"
+            with open(self.log_path, "ab") as fh:
+                fh.write(line.encode("utf-8"))
+            self._sync_log()
+            row_id = deck.rows[key]
+        row = get_csv_index(self.flashcards_csv_path).read_row(row_id)
+        with self._lock:
+            return self._card(user, key, row, now)
+
+
+_schedulers: Dict[str, ReviewScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_review_scheduler(flashcards_csv_path: str) -> ReviewScheduler:
+    """Process-wide review scheduler for a flashcard CSV."""
+    key = os.path.abspath(flashcards_csv_path)
+    with _schedulers_lock:
+        scheduler = _schedulers.get(key)
+        if scheduler is None:
+            scheduler = _schedulers[key] = ReviewScheduler(
+                flashcards_csv_path, os.getenv("REVIEW_LOG_PATH") or None)
+        return scheduler
@@ -0,0 +1,265 @@
+from __future__ import annotations
+import functools
+import math
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ..flashcard.concepts import normalize_text, stem
+
+# Function words carry no topic; anything else too common is cut by max_df
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "does", "for",
+    "from", "how", "i", "in", "is", "it", "its", "of", "on", "or", "that",
+    "the", "this", "to", "vs", "what", "when", "which", "why", "with", "you",
+}
+
+
+@functools.lru_cache(maxsize=1 << 18)
+def term_feature(term: str, n_features: int) -> int:
+    """Bucket of a prefixed word ("b:words"), stemmed so plurals share it."""
+    prefix, _, word = term.rpartition(":")
+    word = " ".join(stem(w) for w in word.split(" "))
+    return zlib.crc32(f"{prefix}:{word}".encode("utf-8")) % n_features
+
+
+def add_terms(
+    weights: Dict[int, float],
+    words: List[str],
+    prefix: str,
+    boost: float,
+    n_features: int
+) -> None:
+    """Accumulate field-weighted sublinear term frequencies of `words`."""
+    for word, n in Counter(words).items():
+        feature = term_feature(f"{prefix}:{word}", n_features)
+        weights[feature] = weights.get(feature, 0.0) + boost * (1.0 + math.log(n))
+
+
+def text_words(text: str) -> List[str]:
+    """Normalized, stopword-free words of free text."""
+    return [w for w in normalize_text(text).split("_") if w and w not in STOPWORDS]
+
+
+class _Column:
+    """Append-only numpy array with amortized growth."""
+
+    def __init__(self, dtype, capacity: int = 1024):
+        self._data = np.zeros(capacity, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values) -> None:
+        values = np.asarray(values, dtype=self._data.dtype)
+        need = self.size + len(values)
+        if need > len(self._data):
+            grown = np.zeros(max(need, 2 * len(self._data)), dtype=self._data.dtype)
+            grown[:self.size] = self._data[:self.size]
+            self._data = grown
+        self._data[self.size:need] = values
+        self.size = need
+
+    def view(self, start: int = 0) -> np.ndarray:
+        return self._data[start:self.size]
+
+
+class _Compaction:
+    """
+    Merge of the uncompacted postings into the CSR arrays.
+
+    Taken under the owner's lock by HashedTfidf.begin_compaction(); run()
+    only reads arrays that are never modified in place (the CSR is replaced
+    wholesale and the columns only grow), so it can run outside that lock.
+    """
+
+    def __init__(self, tfidf: "HashedTfidf"):
+        self.start = tfidf._compacted
+        self.stop = tfidf._features.size
+        self.n_features = tfidf.n_features
+        self.csr = (tfidf._indptr, tfidf._csr_docs, tfidf._csr_weights)
+        self.tail = (tfidf._features.view(self.start), tfidf._docs.view(self.start),
+                     tfidf._weights.view(self.start))
+        self.result: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+
+    def run(self) -> None:
+        indptr, docs, weights = self.csr
+        features, tail_docs, tail_weights = self.tail
+        # Only the tail is sorted; the compacted postings keep their order
+        order = np.argsort(features, kind="stable")
+        features = features[order]
+        counts = np.bincount(features, minlength=self.n_features)
+        merged_indptr = indptr + np.concatenate(([0], np.cumsum(counts)))
+        # A tail posting lands after every compacted posting of its feature
+        # and every tail posting before it
+        slots = indptr[features + 1] + np.arange(len(features))
+        old = np.ones(len(docs) + len(features), dtype=bool)
+        old[slots] = False
+        merged_docs = np.empty(len(old), dtype=np.int32)
+        merged_weights = np.empty(len(old), dtype=np.float32)
+        merged_docs[old] = docs
+        merged_docs[slots] = tail_docs[order]
+        merged_weights[old] = weights
+        merged_weights[slots] = tail_weights[order]
+        self.result = (merged_indptr, merged_docs, merged_weights)
+
+
+def compact_unlocked(lock, tfidf: "HashedTfidf") -> None:
+    """
+    Compact tfidf if it is due, holding its owner's `lock` only to take
+    the tail and to publish the merged postings.
+    """
+    with lock:
+        compaction = tfidf.begin_compaction()
+    if compaction is None:
+        return
+    try:
+        compaction.run()
+    finally:
+        with lock:
+            tfidf.finish_compaction(compaction)
+
+
+class HashedTfidf:
+    """
+    Inverted index of hashed TF-IDF vectors with cosine top-k search.
+
+    Documents are {feature: weight} dicts (see add_terms()), numbered in
+    the order they are added. Postings are kept as append-only (feature,
+    doc, weight) columns; the prefix up to the last compaction is sorted by
+    feature into CSR form, and the short tail appended since is scanned
+    directly. A query therefore touches only the postings of its own terms,
+    and terms occurring in more than max_df of all documents are skipped.
+    Once the tail reaches compact_every postings, owners merge it into the
+    CSR with compact_unlocked(), which sorts only the tail and does the
+    merge outside their lock.
+
+    Document norms use the IDF at the time the document was added; as the
+    collection grows they drift slightly, which affects scores but hardly
+    the ranking. Not thread-safe; owners serialize access.
+    """
+
+    def __init__(self, n_features: int = 1 << 20, max_df: float = 0.2, compact_every: int = 50_000):
+        self.n_features = n_features
+        self.max_df = max_df
+        self.compact_every = compact_every
+        self._features = _Column(np.int32)
+        self._docs = _Column(np.int32)
+        self._weights = _Column(np.float32)
+        self._norms = _Column(np.float32)
+        self._df = np.zeros(n_features, dtype=np.int32)
+        # CSR over postings[:_compacted]
+        self._compacted = 0
+        self._indptr = np.zeros(n_features + 1, dtype=np.int64)
+        self._csr_docs = np.zeros(0, dtype=np.int32)
+        self._csr_weights = np.zeros(0, dtype=np.float32)
+        self._compacting = False
+
+    def __len__(self) -> int:
+        return self._norms.size
+
+    def _idf(self, features: np.ndarray, n_docs: Optional[int] = None) -> np.ndarray:
+        n_docs = self._norms.size if n_docs is None else n_docs
+        return np.log((n_docs + 1) / (self._df[features] + 1.0)) + 1.0
+
+    def add_many(self, documents: Iterable[Dict[int, float]]) -> int:
+        """Append documents in one batch; returns the id of the first one."""
+        features: List[int] = []
+        weights: List[float] = []
+        docs: List[int] = []
+        first = doc = self._norms.size
+        for terms in documents:
+            features.extend(terms.keys())
+            weights.extend(terms.values())
+            docs.extend([doc] * len(terms))
+            doc += 1
+        if doc == first:
+            return first
+
+        f = np.array(features, dtype=np.int32)
+        w = np.array(weights, dtype=np.float32)
+        d = np.array(docs, dtype=np.int32)
+        np.add.at(self._df, f, 1)
+        squares = np.bincount(d - first, weights=(w * self._idf(f, doc)) ** 2,
+                              minlength=doc - first)
+        self._features.extend(f)
+        self._docs.extend(d)
+        self._weights.extend(w)
+        self._norms.extend(np.where(squares > 0, np.sqrt(squares), 1.0))
+        return first
+
+    def begin_compaction(self) -> Optional[_Compaction]:
+        """A compaction to run, if the tail is long enough and none is running."""
+        if self._compacting or self._features.size - self._compacted < self.compact_every:
+            return None
+        self._compacting = True
+        return _Compaction(self)
+
+    def finish_compaction(self, compaction: _Compaction) -> None:
+        """Publish a compaction's result (if it completed)."""
+        self._compacting = False
+        if compaction.result is not None and compaction.start == self._compacted:
+            self._indptr, self._csr_docs, self._csr_weights = compaction.result
+            self._compacted = compaction.stop
+
+    def compact(self) -> None:
+        """Merge the whole tail now, in the caller's thread."""
+        compaction = _Compaction(self)
+        compaction.run()
+        self.finish_compaction(compaction)
+
+    def _postings(self, feature: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self._indptr[feature], self._indptr[feature + 1]
+        return self._csr_docs[start:end], self._csr_weights[start:end]
+
+    def search(self, terms: Dict[int, float], k: int, exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Top-k (doc, cosine similarity) for a query document."""
+        n_docs = self._norms.size
+        if not terms or not n_docs:
+            return []
+        features = np.fromiter(terms.keys(), dtype=np.int32, count=len(terms))
+        query = np.fromiter(terms.values(), dtype=np.float32, count=len(terms))
+        if n_docs >= 100:
+            keep = self._df[features] <= self.max_df * n_docs
+            features, query = features[keep], query[keep]
+        if not len(features):
+            return []
+        idf = self._idf(features)
+        query = query * idf
+        query /= np.linalg.norm(query) or 1.0
+        # A document's score is sum(query_t * idf_t * tf_t,d) / norm_d
+        order = np.argsort(features)
+        features, scales = features[order], (query * idf)[order]
+
+        docs, contributions = [], []
+        for feature, scale in zip(features.tolist(), scales.tolist()):
+            ids, weights = self._postings(feature)
+            if len(ids):
+                docs.append(ids)
+                contributions.append(weights * scale)
+        tail = self._features.view(self._compacted)
+        if len(tail):
+            hits = np.isin(tail, features)
+            if hits.any():
+                docs.append(self._docs.view(self._compacted)[hits])
+                scale = scales[np.searchsorted(features, tail[hits])]
+                contributions.append(self._weights.view(self._compacted)[hits] * scale)
+        if not docs:
+            return []
+
+        unique, inverse = np.unique(np.concatenate(docs), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions)) / self._norms.view()[unique]
+        if exclude is not None:
+            scores[unique == exclude] = -1.0
+        k = min(k, len(unique))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(unique[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "documents": self._norms.size,
+            "postings": self._features.size,
+            "uncompacted": self._features.size - self._compacted,
+            "compacting": int(self._compacting),
+        }
@@ -0,0 +1,306 @@
+from __future__ import annotations
+import abc
+import contextvars
+import dataclasses
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, List, Optional, Tuple, Type, Union
+
+from ...tracing import tracer
+from .ratelimit import estimate_tokens
+from .resilience import ResilientCaller, llm_caller
+
+# Upper bound on the collection window whatever the configuration says;
+# beyond this the added latency outweighs any saving
+MAX_WINDOW_MS = 200.0
+
+
+class BatchItemError(Exception):
+    """One request's output was missing or invalid in an otherwise good batch."""
+
+
+@dataclass
+class BatchRequest:
+    """A structured-output request that may share an upstream call with others."""
+    stage: str
+    client: Any
+    model: str
+    system: str
+    user: str
+    schema: Type[Any]
+    temperature: float = 0.5
+    n: int = 1
+    completion_tokens: int = 300
+    context: contextvars.Context = field(default_factory=contextvars.copy_context)
+
+    def group_key(self) -> Hashable:
+        # Only requests that differ in nothing but their input can be packed
+        return (self.stage, self.model, self.system, self.schema,
+                self.temperature, self.n)
+
+
+class BatchBackend(abc.ABC):
+    """
+    Issues several requests of one group as a single upstream call.
+
+    request() performs the call (it runs under the ResilientCaller, so it
+    receives the attempt timeout); split() maps the response back to one
+    entry per request: a list of `n` parsed outputs, or an exception.
+    """
+
+    @abc.abstractmethod
+    def request(self, requests: List[BatchRequest], timeout: float) -> Any:
+        ...
+
+    @abc.abstractmethod
+    def split(self, response: Any, requests: List[BatchRequest]) -> List[Union[List[Any], BaseException]]:
+        ...
+
+
+_PACKED_INSTRUCTIONS = """
+
+You will receive {count} independent inputs as JSON: {{"inputs": [{{"id": 0, "input": ...}}, ...]}}.
+Handle each one on its own exactly as described above; they are unrelated.
+Reply with a single JSON object {{"results": [{{"id": 0, "output": ...}}, ...]}} holding one
+result per input id, where every "output" is an object matching this JSON schema:
+{schema}
+"""
+
+
+class PackedPromptBackend(BatchBackend):
+    """
+    Packs the inputs of a batch into one chat completion in JSON mode.
+
+    The shared system prompt is sent once, so a batch costs one request
+    against the rate limiter and fewer prompt tokens than its parts.
+    """
+
+    def request(self, requests: List[BatchRequest], timeout: float) -> Any:
+        first = requests[0]
+        system = first.system + _PACKED_INSTRUCTIONS.format(
+            count=len(requests),
+            schema=json.dumps(first.schema.model_json_schema(), ensure_ascii=False))
+        inputs = [{"id": i, "input": r.user} for i, r in enumerate(requests)]
+        return first.client.chat.completions.create(
+            model=first.model,
+            temperature=first.temperature,
+            n=first.n,
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": json.dumps({"inputs": inputs}, ensure_ascii=False)},
+            ],
+            timeout=timeout,
+        )
+
+    def split(self, response: Any, requests: List[BatchRequest]) -> List[Union[List[Any], BaseException]]:
+        schema = requests[0].schema
+        outputs: List[List[Any]] = [[] for _ in requests]
+        for choice in response.choices:
+            try:
+                results = json.loads(choice.message.content)["results"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            for result in results if isinstance(results, list) else []:
+                try:
+                    i = int(result["id"])
+                    parsed = schema.model_validate(result["output"])
+                except Exception:
+                    continue
+                if 0 <= i < len(requests):
+                    outputs[i].append(parsed)
+        return [found if found else BatchItemError(f"no valid output for input {i}")
+                for i, found in enumerate(outputs)]
+
+
+class _Pending:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.items: List[Tuple[BatchRequest, Future]] = []
+
+
+class MicroBatcher:
+    """
+    Collects concurrent LLM requests for a short window and sends each group
+    of compatible ones (same stage, model, prompt and schema) as one call.
+
+    run() blocks until the caller's result is back. It returns None when
+    the request should be sent on its own instead: batching is disabled
+    (window 0, the default), nobody else arrived within the window, the
+    batched call failed, or it came back without a valid output for this
+    request. Batched calls go through the ResilientCaller as stage
+    "<stage>.batch", so they share the stage's retries and rate limit; the
+    timeout and deadline grow by item_timeout_share of the stage's for
+    every request past the first, as the reply grows with the batch.
+    """
+
+    def __init__(
+        self,
+        backend: BatchBackend,
+        window_ms: float = 0.0,
+        max_batch: int = 8,
+        workers: int = 4,
+        item_timeout_share: float = 0.5,
+        caller: Optional[ResilientCaller] = None
+    ):
+        self.backend = backend
+        self.window = min(max(window_ms, 0.0), MAX_WINDOW_MS) / 1000.0
+        self.max_batch = max_batch
+        self.workers = workers
+        self.item_timeout_share = item_timeout_share
+        self.caller = caller or llm_caller
+        self.batches = 0
+        self.batched_requests = 0
+        self.solo_requests = 0
+        self.item_failures = 0
+        self.batch_failures = 0
+        self._pid: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0 and self.max_batch > 1
+
+    def _ensure_started(self) -> None:
+        # Threads are started on first use, and again in a forked child
+        if self._pid == os.getpid():
+            return
+        self._cond = threading.Condition()
+        self._pending: Dict[Hashable, _Pending] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="llm-batch")
+        threading.Thread(target=self._loop, name="llm-batcher", daemon=True).start()
+        self._pid = os.getpid()
+
+    def run(self, request: BatchRequest, deadline: Optional[float] = None) -> Optional[List[Any]]:
+        if not self.enabled:
+            return None
+        with tracer.span(f"llm.{request.stage}.batched", stage=request.stage,
+                         model=request.model) as span:
+            future: Future = Future()
+            with _start_lock:
+                self._ensure_started()
+            with self._cond:
+                pending = self._pending.get(request.group_key())
+                if pending is None:
+                    pending = self._pending[request.group_key()] = _Pending()
+                pending.items.append((request, future))
+                self._cond.notify()
+
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                outputs, size = future.result(timeout=timeout)
+            except FutureTimeout:
+                raise TimeoutError(f"Deadline exceeded waiting for batched {request.stage} call")
+            except BatchItemError:
+                span.set(fallback=True)
+                return None
+            span.set(batch_size=size)
+            return outputs
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    ready = [key for key, p in self._pending.items()
+                             if len(p.items) >= self.max_batch or now - p.started >= self.window]
+                    if ready:
+                        break
+                    wake = min((p.started + self.window for p in self._pending.values()), default=None)
+                    self._cond.wait(None if wake is None else max(0.0, wake - now))
+                batches = [self._pending.pop(key).items for key in ready]
+            for items in batches:
+                for start in range(0, len(items), self.max_batch):
+                    self._executor.submit(self._dispatch, items[start:start + self.max_batch])
+
+    def _dispatch(self, items: List[Tuple[BatchRequest, Future]]) -> None:
+        if len(items) == 1:
+            with _stats_lock:
+                self.solo_requests += 1
+            items[0][1].set_exception(BatchItemError("batch of one"))
+            return
+
+        requests = [request for request, _ in items]
+        first = requests[0]
+        tokens = estimate_tokens(first.system, *(r.user for r in requests),
+                                 completion_tokens=sum(r.completion_tokens for r in requests))
+        stage = f"{first.stage}.batch"
+        policy = self.caller.get_policy(stage)
+        scale = 1.0 + self.item_timeout_share * (len(requests) - 1)
+        policy = dataclasses.replace(
+            policy, timeout=policy.timeout * scale, deadline=policy.deadline * scale)
+        try:
+            # Run in the first caller's context so the call joins its trace
+            response = first.context.run(
+                self.caller.call, stage,
+                lambda timeout: self.backend.request(requests, timeout),
+                tokens=tokens, model=first.model, policy=policy)
+            results = self.backend.split(response, requests)
+        except Exception as e:
+            # Every caller retries on its own rather than failing with the batch
+            with _stats_lock:
+                self.batch_failures += 1
+            for _, future in items:
+                error = BatchItemError(f"batched call failed: {e!r}")
+                error.__cause__ = e
+                future.set_exception(error)
+            return
+        except BaseException as e:
+            for _, future in items:
+                future.set_exception(e)
+            raise
+
+        failures = 0
+        for (_, future), result in zip(items, results):
+            if isinstance(result, BaseException):
+                failures += 1
+                future.set_exception(result)
+            else:
+                future.set_result((result, len(items)))
+        with _stats_lock:
+            self.batches += 1
+            self.batched_requests += len(items)
+            self.item_failures += failures
+
+    def get_stats(self) -> Dict[str, Any]:
+        with _stats_lock:
+            return {
+                "enabled": self.enabled,
+                "window_ms": self.window * 1000,
+                "max_batch": self.max_batch,
+                "batches": self.batches,
+                "batched_requests": self.batched_requests,
+                "avg_batch_size": round(self.batched_requests / self.batches, 2) if self.batches else None,
+                "solo_requests": self.solo_requests,
+                "item_failures": self.item_failures,
+                "batch_failures": self.batch_failures,
+            }
+
+
+_start_lock = threading.Lock()
+_stats_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    # The parent's lock may have been held mid-fork
+    global _start_lock
+    _start_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+# Shared by the generator, critic and flashcard agents; off unless
+# LLM_BATCH_WINDOW_MS is set
+llm_batcher = MicroBatcher(
+    PackedPromptBackend(),
+    window_ms=float(os.getenv("LLM_BATCH_WINDOW_MS", "0")),
+    max_batch=int(os.getenv("LLM_BATCH_MAX", "8")),
+    workers=int(os.getenv("LLM_BATCH_WORKERS", "4")),
+    item_timeout_share=float(os.getenv("LLM_BATCH_ITEM_TIMEOUT_SHARE", "0.5")),
+)
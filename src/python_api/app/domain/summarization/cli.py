@@ -1,29 +1,107 @@
 import os
 import json
 import time
-import pandas as pd
-from pandas.errors import EmptyDataError
-from typing import Callable, Optional
+from typing import Callable, Dict, Optional
 
-from .extraction import MultiAgentLatentExtractor
+from .extraction import MultiAgentLatentExtractor, GeneratorOutput, CriticOutput
 from .generation import FlashCardGenerator
+from .generation.simpleWorkflow import FlashCardSchema
 from .task_manager import TaskStage
+from .prefix_cache import PrefixEntry, prefix_cache
+from .neighbors import get_latent_neighbors
+from ..history.archive import get_dialogue_log
+from ..history.gaps import get_latent_aggregates
+from ..history.index import get_csv_index
+from ..flashcard.store import get_flashcard_store
+from ..flashcard.concepts import get_concept_registry
+from ...tracing import tracer
 
 
-def _load_or_empty(path: str, columns: list[str]) -> pd.DataFrame:
+def _extract_latent(dialogue, user_id, report_progress, deadline, resume=None, checkpoint_callback=None, dialogue_csv_path=None) -> str:
     """
-    Load a CSV if it has content, otherwise return an empty DataFrame
-    with the given columns.
+    Run latent extraction, starting from a previously analyzed prefix when possible.
+
+    The MCP client resubmits the growing conversation every few turns, so the
+    longest cached prefix for this user seeds the extractor and only a
+    verification/update pass runs over the extended dialogue.
+
+    Otherwise the latents of similar past dialogues in dialogue_csv_path are
+    proposed to the critic: in place of the generator when the match is
+    confident, next to its candidates when it is merely plausible.
     """
-    if not os.path.exists(path) or os.path.getsize(path) == 0:
-        # File doesn't exist or is completely empty -> start fresh
-        return pd.DataFrame(columns=columns)
+    started = time.time()
+    hit = None if resume else prefix_cache.lookup(user_id, dialogue)
+
+    if hit and hit[1] == len(dialogue):
+        entry, _ = hit
+        report_progress(TaskStage.CRITICISM,
+                        f"Dialogue already analyzed; reusing latent {entry.latent}")
+        prefix_cache.record_savings(entry.cold_duration)
+        return entry.latent
 
-    try:
-        return pd.read_csv(path)
-    except EmptyDataError:
-        # File exists but has no columns/rows
-        return pd.DataFrame(columns=columns)
+    extractor = MultiAgentLatentExtractor()
+    if hit:
+        entry, turns = hit
+        report_progress(
+            TaskStage.CRITICISM,
+            f"Reusing analysis of first {turns}/{len(dialogue)} turns (latent: {entry.latent})")
+        latent = extractor.predict_incremental(
+            dialogue,
+            GeneratorOutput(latent=entry.latent, argument=entry.argument),
+            CriticOutput(verdict=entry.verdict, score=entry.score,
+                         critique=entry.critique),
+            report_progress, deadline, checkpoint_callback)
+        elapsed = time.time() - started
+        cold_duration = entry.cold_duration
+        prefix_cache.record_savings(cold_duration - elapsed)
+        report_progress(
+            TaskStage.CRITICISM,
+            f"Incremental analysis reused {turns / len(dialogue):.0%} of turns "
+            f"in {elapsed:.1f}s (cold run: {cold_duration:.1f}s)")
+    else:
+        report_progress(TaskStage.GENERATION,
+                        "Starting latent concept extraction")
+        neighbors, seeds, skip_generator = None, [], False
+        if dialogue_csv_path and not resume:
+            with tracer.span("latent_neighbors") as span:
+                neighbors = get_latent_neighbors(dialogue_csv_path)
+                suggestion = neighbors.suggest(dialogue)
+                seed = neighbors.seed(suggestion)
+                span.set(candidates=len(suggestion.candidates),
+                         confident=suggestion.confident)
+            if seed is not None:
+                seeds = [GeneratorOutput(
+                    latent=seed.latent,
+                    argument=f"{seed.support} similar past dialogue(s) (similarity up to "
+                             f"{seed.score:.2f}) were resolved to this prerequisite.")]
+                skip_generator = suggestion.confident
+        if skip_generator:
+            report_progress(TaskStage.CRITICISM,
+                            f"Similar past dialogues point to {seeds[0].latent}; skipping generation")
+        # Modify extractor to support progress reporting
+        latent = extractor.predict_with_progress(
+            dialogue, report_progress, deadline,
+            resume=resume, checkpoint_callback=checkpoint_callback,
+            seed_candidates=seeds if skip_generator else None,
+            extra_candidates=None if skip_generator else seeds)
+        cold_duration = time.time() - started
+        if neighbors is not None:
+            neighbors.record_outcome(
+                skipped_generator=skip_generator, seeded=bool(seeds),
+                won=bool(seeds) and latent == seeds[0].latent)
+
+    if extractor.last_candidate is not None:
+        prefix_cache.store(user_id, dialogue, PrefixEntry(
+            latent=latent,
+            argument=extractor.last_candidate.argument,
+            verdict=extractor.last_critic.verdict,
+            score=extractor.last_critic.score,
+            critique=extractor.last_critic.critique,
+            turns=len(dialogue),
+            cold_duration=cold_duration,
+            created_at=time.time(),
+        ))
+    return latent
 
 
 def summarize_dialogue(
@@ -49,6 +127,9 @@ def summarize_dialogue_async(
     dialogue_csv_path="../../data/dialogues.csv",
     flashcards_csv_path="../../data/flashcards.csv",
     progress_callback: Optional[Callable[[TaskStage, str], None]] = None,
+    deadline: Optional[float] = None,
+    checkpoint: Optional[Dict] = None,
+    checkpoint_callback: Optional[Callable[[Dict], None]] = None,
 ):
     """
     Asynchronous dialogue summarization with progress tracking.
@@ -56,9 +137,12 @@ def summarize_dialogue_async(
     Args:
         dialogue: List of dialogue turns with role and message
         user_id: User identifier
-        dialogue_csv_path: Path to dialogue CSV file
+        dialogue_csv_path: Path to dialogue CSV file (or *.dla archive)
         flashcards_csv_path: Path to flashcards CSV file
         progress_callback: Optional callback to report progress updates
+        deadline: Optional absolute time by which extraction should stop refining
+        checkpoint: Stage results from an interrupted run; completed stages are skipped
+        checkpoint_callback: Receives a partial checkpoint dict after each stage
 
     Returns:
         Extracted latent concept as string
@@ -67,77 +151,105 @@ def summarize_dialogue_async(
         if progress_callback:
             progress_callback(stage, message)
 
-    report_progress(TaskStage.GENERATION, "Starting latent concept extraction")
-
-    extractor = MultiAgentLatentExtractor()
-    generator = FlashCardGenerator()
-
-    # Modify extractor to support progress reporting
-    latent = extractor.predict_with_progress(dialogue, report_progress)
-
-    report_progress(TaskStage.FLASHCARD_GENERATION,
-                    "Generating flashcard content")
-    flashcard = generator.generate(latent)
+    checkpoint = checkpoint if checkpoint is not None else {}
+
+    def save_checkpoint(update: Dict):
+        checkpoint.update(update)
+        if checkpoint_callback:
+            checkpoint_callback(update)
+
+    if checkpoint.get("saved"):
+        # Crashed after persisting but before completion was recorded
+        return checkpoint["latent"]
+
+    if checkpoint.get("latent"):
+        latent = checkpoint["latent"]
+        report_progress(TaskStage.CRITICISM,
+                        f"Reusing checkpointed latent: {latent}")
+    else:
+        with tracer.span("extract_latent", turns=len(dialogue)) as span:
+            latent = _extract_latent(
+                dialogue, user_id, report_progress, deadline,
+                resume=checkpoint.get("extraction"),
+                checkpoint_callback=lambda state: save_checkpoint(
+                    {"extraction": state}),
+                dialogue_csv_path=dialogue_csv_path)
+            span.set(latent=latent)
+        save_checkpoint({"latent": latent})
+
+    if checkpoint.get("flashcard"):
+        flashcard = FlashCardSchema.model_validate(checkpoint["flashcard"])
+        concept = checkpoint.get("concept", latent)
+    else:
+        # Another spelling of a concept that already has a card reuses it;
+        # only an exact concept_key() match counts, as a fuzzy one may be a
+        # different concept ("l1" vs "l2 regularization")
+        concept = get_concept_registry(flashcards_csv_path).canonical(latent) or latent
+        existing = get_flashcard_store(flashcards_csv_path).get(concept)
+        if existing is not None:
+            report_progress(TaskStage.FLASHCARD_GENERATION,
+                            f"Reusing existing flashcard for '{concept}'")
+            flashcard = FlashCardSchema(
+                question=existing["question"], answer=existing["answer"])
+        else:
+            concept = latent
+            report_progress(TaskStage.FLASHCARD_GENERATION,
+                            "Generating flashcard content")
+            with tracer.span("generate_flashcard", concept=latent):
+                generator = FlashCardGenerator()
+                flashcard = generator.generate(latent)
+        save_checkpoint({"flashcard": flashcard.model_dump(), "concept": concept})
 
     report_progress(TaskStage.SAVING_RESULTS, "Saving results to CSV files")
 
-    # Define expected columns for new/empty files
-    dialogue_columns = ["user_id", "timestamp", "dialogue", "latent"]
-    flashcards_columns = ["user_id", "concept", "question", "answer"]
-
-    # Safely load or create empty DataFrames
-    dialogue_df = _load_or_empty(dialogue_csv_path, dialogue_columns)
-    flashcards_df = _load_or_empty(flashcards_csv_path, flashcards_columns)
-
-    # New dialogue entry
-    new_dialogue_entry = {
-        "user_id": user_id,
-        "timestamp": int(time.time()),
-        "dialogue": json.dumps(dialogue),
-        "latent": latent,
-    }
-    dialogue_df = pd.concat(
-        [dialogue_df, pd.DataFrame([new_dialogue_entry])],
-        ignore_index=True,
-    )
-    dialogue_df.to_csv(dialogue_csv_path, index=False)
-
-    # New flashcard entry
-    new_flashcard_entry = {
-        "user_id": user_id,
-        "concept": latent,
-        "question": flashcard.question,
-        "answer": flashcard.answer,
-    }
-    flashcards_df = pd.concat(
-        [flashcards_df, pd.DataFrame([new_flashcard_entry])],
-        ignore_index=True,
-    )
-    flashcards_df.to_csv(flashcards_csv_path, index=False)
-
-    return latent
+    with tracer.span("persist", dialogue_csv=dialogue_csv_path, flashcards_csv=flashcards_csv_path):
+        saved_at = int(time.time())
 
+        # Appends go through the offset index so history reads stay seek-based
+        # and the files are never re-parsed or rewritten per task.
+        new_dialogue_entry = {
+            "user_id": user_id,
+            "timestamp": saved_at,
+            "dialogue": json.dumps(dialogue),
+            "latent": latent,
+        }
+        get_dialogue_log(dialogue_csv_path).append_row(new_dialogue_entry)
+        get_latent_aggregates(dialogue_csv_path).refresh()
 
-if __name__ == "__main__":
-    # Example usage
-    generator = FlashCardGenerator()
-    flashcards_csv_path = "flashcards.csv"
-    flashcards_df = _load_or_empty(
-        flashcards_csv_path, ["concept", "question", "answer"])
-    concepts = [
-        'maximum_likelihood',
-    ]
-    for concept in concepts:
-        print(concept)
-        flashcard = generator.generate(concept)
         new_flashcard_entry = {
+            "user_id": user_id,
             "concept": concept,
             "question": flashcard.question,
             "answer": flashcard.answer,
+            "timestamp": saved_at,
         }
-        flashcards_df = pd.concat(
-            [flashcards_df, pd.DataFrame([new_flashcard_entry])],
-            ignore_index=True,
-        )
-    flashcards_df.to_csv(flashcards_csv_path, index=False)
-    print(f"Generated flashcards for {len(concepts)} concepts.")
+        get_csv_index(flashcards_csv_path).append_row(new_flashcard_entry)
+        # Publish the new card to every worker's mapped store
+        get_flashcard_store(flashcards_csv_path).refresh()
+    save_checkpoint({"saved": True})
+
+    return latent
+
+
+if __name__ == "__main__":
+    # Pre-generate cards for a concept list, e.g.
+    #   python -m app.domain.summarization.cli concepts.txt --workers 16
+    import argparse
+    from .generation.bulk import pregenerate_flashcards, read_concepts
+
+    parser = argparse.ArgumentParser(
+        description="Bulk-generate flashcards for concepts that have none yet")
+    parser.add_argument("concepts_file", help="one concept per line")
+    parser.add_argument("--flashcards-csv", default=os.getenv(
+        "FLASHCARDS_CSV", "../../data/flashcards.csv"))
+    parser.add_argument("--workers", type=int, default=8,
+                        help="maximum concurrent LLM calls")
+    parser.add_argument("--progress", default=None,
+                        help="resume log (default: <csv>.pregen.jsonl)")
+    args = parser.parse_args()
+
+    summary = pregenerate_flashcards(
+        read_concepts(args.concepts_file), args.flashcards_csv,
+        workers=args.workers, progress_path=args.progress)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    raise SystemExit(1 if summary["failed"] else 0)
@@ -1,8 +1,11 @@
 from __future__ import annotations
 import json
-from typing import List, Dict
+from typing import List, Dict, Optional
 from openai import OpenAI
 
+from ..batching import BatchRequest, llm_batcher
+from ..ratelimit import estimate_tokens
+from ..resilience import ResilientCaller, llm_caller
 from .schemas import GeneratorOutput, CriticOutput, RefinerOutput, AgentContext
 from .prompts import (
     get_generator_prompt,
@@ -14,26 +17,37 @@ from .prompts import (
 
 class Generator:
 
-    def __init__(self, client: OpenAI, model: str, beam_width: int = 1):
+    def __init__(self, client: OpenAI, model: str, beam_width: int = 1, caller: Optional[ResilientCaller] = None):
         self.client = client
         self.model = model
         self.beam_width = beam_width
+        self.caller = caller or llm_caller
 
-    def generate_candidates(self, dialogue: List[Dict]) -> List[GeneratorOutput]:
+    def generate_candidates(self, dialogue: List[Dict], deadline: Optional[float] = None) -> List[GeneratorOutput]:
         """Generate latent concept candidates from the dialogue."""
         sys_prompt = get_generator_prompt()
+        dialogue_json = json.dumps(dialogue, ensure_ascii=False, indent=2)
 
-        resp = self.client.chat.completions.create(
+        batched = llm_batcher.run(BatchRequest(
+            stage="generator", client=self.client, model=self.model,
+            system=sys_prompt, user=dialogue_json, schema=GeneratorOutput,
+            n=self.beam_width, completion_tokens=300 * self.beam_width), deadline)
+        if batched is not None:
+            return batched
+
+        resp = self.caller.call("generator", lambda timeout: self.client.chat.completions.create(
             model=self.model,
             temperature=0.5,
             n=self.beam_width,
             response_format={"type": "json_object"},
             messages=[
                 {"role": "system", "content": sys_prompt},
-                {"role": "user", "content": json.dumps(
-                    dialogue, ensure_ascii=False, indent=2)},
+                {"role": "user", "content": dialogue_json},
             ],
-        )
+            timeout=timeout,
+        ), deadline=deadline,
+            tokens=estimate_tokens(sys_prompt, dialogue_json, completion_tokens=300 * self.beam_width),
+            model=self.model)
 
         candidates: List[GeneratorOutput] = []
         for choice in resp.choices:
@@ -48,11 +62,13 @@ class Generator:
 
 class Critic:
 
-    def __init__(self, client: OpenAI, model: str):
+    def __init__(self, client: OpenAI, model: str, caller: Optional[ResilientCaller] = None, stage: str = "critic"):
         self.client = client
         self.model = model
+        self.caller = caller or llm_caller
+        self.stage = stage
 
-    def evaluate_candidate(self, dialogue: List[Dict], candidate: GeneratorOutput, context: AgentContext) -> CriticOutput:
+    def evaluate_candidate(self, dialogue: List[Dict], candidate: GeneratorOutput, context: AgentContext, deadline: Optional[float] = None) -> CriticOutput:
         """Evaluate a candidate latent concept."""
         sys_prompt = get_critic_prompt()
 
@@ -66,27 +82,37 @@ class Critic:
             "interaction_history": context_summary if context_summary["total_loops"] > 0 else None
         }
 
-        resp = self.client.responses.parse(
+        user_json = json.dumps(user_content, ensure_ascii=False, indent=2)
+
+        batched = llm_batcher.run(BatchRequest(
+            stage=self.stage, client=self.client, model=self.model,
+            system=sys_prompt, user=user_json, schema=CriticOutput), deadline)
+        if batched is not None:
+            return batched[0]
+
+        resp = self.caller.call(self.stage, lambda timeout: self.client.responses.parse(
             model=self.model,
             temperature=0.5,
             input=[
                 {"role": "system", "content": sys_prompt},
-                {"role": "user", "content": json.dumps(
-                    user_content, ensure_ascii=False, indent=2)},
+                {"role": "user", "content": user_json},
             ],
             text_format=CriticOutput,
-        )
+            timeout=timeout,
+        ), deadline=deadline, tokens=estimate_tokens(sys_prompt, user_json), model=self.model)
 
         return resp.output_parsed
 
 
 class Refiner:
 
-    def __init__(self, client: OpenAI, model: str):
+    def __init__(self, client: OpenAI, model: str, caller: Optional[ResilientCaller] = None, stage: str = "refiner"):
         self.client = client
         self.model = model
+        self.caller = caller or llm_caller
+        self.stage = stage
 
-    def refine_concept(self, candidate: GeneratorOutput, critic: CriticOutput, context: AgentContext) -> str:
+    def refine_concept(self, candidate: GeneratorOutput, critic: CriticOutput, context: AgentContext, deadline: Optional[float] = None) -> str:
         """Refine a latent concept based on critic feedback."""
         # Choose prompt based on critic verdict
         if critic.verdict == "approve":
@@ -104,15 +130,17 @@ class Refiner:
             "interaction_history": context_summary if context_summary["total_loops"] > 0 else None
         }
 
-        resp = self.client.responses.parse(
+        user_json = json.dumps(user_content, ensure_ascii=False, indent=2)
+
+        resp = self.caller.call(self.stage, lambda timeout: self.client.responses.parse(
             model=self.model,
             temperature=0.5,
             input=[
                 {"role": "system", "content": sys_prompt},
-                {"role": "user", "content": json.dumps(
-                    user_content, ensure_ascii=False, indent=2)},
+                {"role": "user", "content": user_json},
             ],
             text_format=RefinerOutput,
-        )
+            timeout=timeout,
+        ), deadline=deadline, tokens=estimate_tokens(sys_prompt, user_json), model=self.model)
 
         return resp.output_parsed.latent
@@ -61,3 +61,25 @@ class AgentContext:
             "previous_scores": [c.score for c in self.critic_history],
             "previous_critiques": [c.critique for c in self.critic_history]
         }
+
+    def to_dict(self) -> Dict:
+        """Serialize the full interaction history for checkpointing."""
+        return {
+            "dialogue": self.dialogue,
+            "generator_history": [g.model_dump() for g in self.generator_history],
+            "critic_history": [c.model_dump() for c in self.critic_history],
+            "refiner_history": list(self.refiner_history),
+            "current_loop": self.current_loop,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "AgentContext":
+        """Rebuild a context from to_dict() output."""
+        context = cls(data["dialogue"])
+        context.generator_history = [
+            GeneratorOutput.model_validate(g) for g in data["generator_history"]]
+        context.critic_history = [
+            CriticOutput.model_validate(c) for c in data["critic_history"]]
+        context.refiner_history = list(data["refiner_history"])
+        context.current_loop = data["current_loop"]
+        return context
@@ -4,6 +4,8 @@ import datetime
 from typing import Dict, Any
 from openai import OpenAI
 
+from ....tracing import current_trace_id
+
 
 class LoggerMixin:
     """Mixin class providing structured logging functionality."""
@@ -29,6 +31,9 @@ class LoggerMixin:
         """Log the start of a new problem with clear separation."""
         with open(self.log_path, "a", encoding="utf-8") as fh:
             fh.write("\n" + "="*50 + " PROBLEM START " + "="*50 + "\n")
+            trace_id = current_trace_id()
+            if trace_id:
+                fh.write(f"TRACE_ID: {trace_id}\n")
             fh.write("ORIGINAL_DIALOGUE:\n")
             fh.write(json.dumps(dialogue, ensure_ascii=False, indent=2) + "\n")
 
@@ -61,15 +66,18 @@ class LoggerMixin:
             fh.write(f"  Verdict: {new_critic.verdict}\n")
             fh.write(f"  Critique: {new_critic.critique}\n")
 
-    def _log_problem_end(self, final_latent: str, final_critic, total_loops: int) -> None:
+    def _log_problem_end(self, final_latent: str, final_critic, total_loops: int, stop_reason: str = None) -> None:
         """Log the final result of the problem."""
         with open(self.log_path, "a", encoding="utf-8") as fh:
             fh.write(f"\nFINAL_RESULT: {final_latent}\n")
             fh.write(f"FINAL_SCORE: {final_critic.score}/4\n")
             fh.write(f"TOTAL_REFINEMENT_LOOPS: {total_loops}\n")
+            if stop_reason:
+                fh.write(f"STOP_REASON: {stop_reason}\n")
             fh.write("="*50 + " PROBLEM END " + "="*52 + "\n\n")
 
 
 def create_openai_client(api_key: str = None) -> OpenAI:
     api_key = os.getenv("OPENAI_API_KEY")
-    return OpenAI(api_key=api_key)
+    # Retries and timeouts are left to the ResilientCaller wrapping each call
+    return OpenAI(api_key=api_key, max_retries=0)
@@ -1,5 +1,7 @@
 from __future__ import annotations
+import os
 import json
+import time
 from typing import List, Dict, Callable, Optional
 
 from .schemas import GeneratorOutput, CriticOutput, AgentContext
@@ -12,82 +14,87 @@ class MultiAgentLatentExtractor(LoggerMixin):
     BEAM_WIDTH = 1
     ACCEPT_SCORE = 4
 
-    def __init__(self, model: str = "gpt-4o-mini", max_refiner_loops: int = 3):
+    def __init__(
+        self,
+        model: str = "gpt-4o-mini",
+        max_refiner_loops: int = 3,
+        latency_budget: Optional[float] = None,
+        plateau_patience: int = 1,
+        fast_model: Optional[str] = None,
+        strong_model: Optional[str] = None,
+        borderline_scores: tuple = (2, 3),
+        verify_with_strong: bool = False
+    ):
         """
         Initialize the multi-agent extractor.
 
         Args:
             model: OpenAI model to use for all agents
             max_refiner_loops: Maximum number of refinement iterations
+            latency_budget: Seconds allowed per extraction when no deadline is given
+            plateau_patience: Non-improving refinement loops tolerated before stopping
+            fast_model: Cheap model for the first critic pass (LLM_FAST_MODEL)
+            strong_model: Model for borderline re-checks and refinement (LLM_STRONG_MODEL)
+            borderline_scores: Fast-tier scores that escalate to the strong critic
+            verify_with_strong: Re-check a fast-tier acceptance once with the strong critic
         """
         super().__init__()
 
         self.max_refiner_loops = max_refiner_loops
+        self.latency_budget = latency_budget
+        self.plateau_patience = plateau_patience
+        self.last_stop_reason: Optional[str] = None
+        self.last_candidate: Optional[GeneratorOutput] = None
+        self.last_critic: Optional[CriticOutput] = None
         self.model = model
-        self.critic_model = model
+        self.fast_model = fast_model or os.getenv("LLM_FAST_MODEL", model)
+        self.strong_model = strong_model or os.getenv(
+            "LLM_STRONG_MODEL", model)
+        self.critic_model = self.fast_model
+        self.borderline_scores = set(borderline_scores)
+        self.verify_with_strong = verify_with_strong
+        self.cascade_enabled = self.fast_model != self.strong_model
 
         # Initialize OpenAI client
         self.client = create_openai_client()
 
-        # Initialize agents
+        # Initialize agents; tiered stage names keep per-tier call stats apart
         self.generator = Generator(self.client, self.model, self.BEAM_WIDTH)
-        self.critic = Critic(self.client, self.critic_model)
-        self.refiner = Refiner(self.client, self.model)
+        self.critic = Critic(self.client, self.fast_model,
+                             stage="critic.fast")
+        self.strong_critic = Critic(
+            self.client, self.strong_model, stage="critic.strong")
+        self.refiner = Refiner(self.client, self.strong_model,
+                               stage="refiner.strong")
+
+    def _evaluate_tiered(self, dialogue: List[Dict], candidate: GeneratorOutput, context: AgentContext, deadline: Optional[float] = None):
+        """Score with the fast critic, escalating borderline scores to the strong one."""
+        critic_output = self.critic.evaluate_candidate(
+            dialogue, candidate, context, deadline)
+        if self.cascade_enabled and critic_output.score in self.borderline_scores:
+            return self.strong_critic.evaluate_candidate(
+                dialogue, candidate, context, deadline), "strong"
+        return critic_output, "fast"
+
+    def _expected_loop_latency(self) -> float:
+        """Estimated duration of one refinement loop before any has run."""
+        return (self.refiner.caller.expected_latency(self.refiner.stage)
+                + self.strong_critic.caller.expected_latency(self.strong_critic.stage))
 
     def _search_latent(self, dialogue: List[Dict]) -> str:
-        self._log_problem_start(dialogue)
-
-        # Initialize context for tracking agent interactions
-        context = AgentContext(dialogue)
-
-        # 1) Generate candidates using beam search
-        candidates = self.generator.generate_candidates(dialogue)
-
-        # 2) Score candidates with critic and pick the best
-        best_candidate, best_critic = None, None
-        for candidate in candidates:
-            critic_output = self.critic.evaluate_candidate(
-                dialogue, candidate, context)
-            context.add_generator_output(candidate)
-            context.add_critic_output(critic_output)
-
-            if best_critic is None or critic_output.score > best_critic.score:
-                best_candidate, best_critic = candidate, critic_output
-
-        # Log initial generation result
-        self._log_initial_generation(best_candidate, best_critic)
-
-        # 3) Refine until accepted or retries exhausted
-        loops = 0
-        while best_critic.score < self.ACCEPT_SCORE and loops < self.max_refiner_loops:
-            loops += 1
-
-            # Log refinement loop start
-            self._log_refinement_loop_start(
-                loops, best_candidate.latent, best_critic)
-
-            # Refine the concept
-            new_latent = self.refiner.refine_concept(
-                best_candidate, best_critic, context)
-            context.add_refiner_output(new_latent)
-
-            # Update candidate and re-evaluate
-            best_candidate = GeneratorOutput(
-                latent=new_latent,
-                argument=best_candidate.argument
-            )
-            best_critic = self.critic.evaluate_candidate(
-                dialogue, best_candidate, context)
-            context.add_critic_output(best_critic)
-
-            # Log refinement loop result
-            self._log_refinement_loop_result(loops, new_latent, best_critic)
+        return self._search_latent_with_progress(dialogue)
 
-        # Log final result
-        self._log_problem_end(best_candidate.latent, best_critic, loops)
-        return best_candidate.latent
-
-    def _search_latent_with_progress(self, dialogue: List[Dict], progress_callback: Optional[Callable] = None) -> str:
+    def _search_latent_with_progress(
+        self,
+        dialogue: List[Dict],
+        progress_callback: Optional[Callable] = None,
+        deadline: Optional[float] = None,
+        resume: Optional[Dict] = None,
+        checkpoint_callback: Optional[Callable[[Dict], None]] = None,
+        seed_candidates: Optional[List[GeneratorOutput]] = None,
+        prior_critiques: Optional[List[CriticOutput]] = None,
+        extra_candidates: Optional[List[GeneratorOutput]] = None
+    ) -> str:
         # Import TaskStage here to avoid circular imports
         try:
             from ..task_manager import TaskStage
@@ -95,43 +102,125 @@ class MultiAgentLatentExtractor(LoggerMixin):
             # Fallback if TaskStage is not available
             TaskStage = None
 
+        current_stage = None
+
         def report_progress(stage, message=""):
+            nonlocal current_stage
+            current_stage = stage
             if progress_callback and TaskStage:
                 progress_callback(stage, message)
 
+        if deadline is None and self.latency_budget is not None:
+            deadline = time.time() + self.latency_budget
+
         # Start problem logging
         self._log_problem_start(dialogue)
 
-        # Initialize context for tracking agent interactions
-        context = AgentContext(dialogue)
-
-        report_progress(TaskStage.GENERATION if TaskStage else None,
-                        "Generating concept candidates")
-
-        # 1) Generate candidates using beam search
-        candidates = self.generator.generate_candidates(dialogue)
-
-        report_progress(TaskStage.CRITICISM if TaskStage else None,
-                        "Evaluating candidates")
-
-        # 2) Score candidates with critic and pick the best
-        best_candidate, best_critic = None, None
-        for candidate in candidates:
-            critic_output = self.critic.evaluate_candidate(
-                dialogue, candidate, context)
-            context.add_generator_output(candidate)
-            context.add_critic_output(critic_output)
-
-            if best_critic is None or critic_output.score > best_critic.score:
-                best_candidate, best_critic = candidate, critic_output
-
-        # Log initial generation result
-        self._log_initial_generation(best_candidate, best_critic)
+        def checkpoint():
+            if checkpoint_callback:
+                checkpoint_callback({
+                    "context": context.to_dict(),
+                    "best_candidate": best_candidate.model_dump(),
+                    "best_critic": best_critic.model_dump(),
+                    "best_tier": best_tier,
+                    "top_candidate": top_candidate.model_dump(),
+                    "top_critic": top_critic.model_dump(),
+                    "loops": loops,
+                    "stale_loops": stale_loops,
+                })
+
+        loop_durations: List[float] = []
+        if resume:
+            # Continue from the last completed stage instead of re-paying for it
+            context = AgentContext.from_dict(resume["context"])
+            best_candidate = GeneratorOutput.model_validate(
+                resume["best_candidate"])
+            best_critic = CriticOutput.model_validate(resume["best_critic"])
+            best_tier = resume["best_tier"]
+            top_candidate = GeneratorOutput.model_validate(
+                resume["top_candidate"])
+            top_critic = CriticOutput.model_validate(resume["top_critic"])
+            loops = resume["loops"]
+            stale_loops = resume["stale_loops"]
+            report_progress(TaskStage.CRITICISM if TaskStage else None,
+                            f"Resumed from checkpoint after {loops} refinement loop(s)")
+        else:
+            # Initialize context for tracking agent interactions
+            context = AgentContext(dialogue)
+            for critique in prior_critiques or []:
+                context.add_critic_output(critique)
+
+            if seed_candidates:
+                # Known candidates (e.g. from an analyzed prefix) skip the generator
+                candidates = list(seed_candidates)
+            else:
+                report_progress(TaskStage.GENERATION if TaskStage else None,
+                                "Generating concept candidates")
+
+                # 1) Generate candidates using beam search. This pass and the
+                # scoring below are needed for any answer at all, so only the
+                # stage policies bound them; the deadline cuts refinement only
+                candidates = self.generator.generate_candidates(dialogue)
+                # Proposals from elsewhere (e.g. similar past dialogues) compete too
+                generated = {c.latent for c in candidates}
+                candidates += [c for c in extra_candidates or []
+                               if c.latent not in generated]
+
+            report_progress(TaskStage.CRITICISM if TaskStage else None,
+                            "Evaluating candidates")
+
+            # 2) Score candidates with critic and pick the best
+            best_candidate, best_critic, best_tier = None, None, None
+            for candidate in candidates:
+                critic_output, tier = self._evaluate_tiered(
+                    dialogue, candidate, context)
+                context.add_generator_output(candidate)
+                context.add_critic_output(critic_output)
+
+                if best_critic is None or critic_output.score > best_critic.score:
+                    best_candidate, best_critic, best_tier = candidate, critic_output, tier
+
+            # Log initial generation result
+            self._log_initial_generation(best_candidate, best_critic)
+
+            # top_* tracks the best-so-far pair, which is what gets returned
+            top_candidate, top_critic = best_candidate, best_critic
+            loops = 0
+            stale_loops = 0
+            checkpoint()
+
+        # 3) Refine until accepted, converged, out of time or retries exhausted
+        while True:
+            if best_critic.score >= self.ACCEPT_SCORE:
+                if self.verify_with_strong and self.cascade_enabled and best_tier == "fast":
+                    # One strong-tier check before trusting a fast acceptance
+                    report_progress(current_stage,
+                                    f"Verifying {best_candidate.latent} with {self.strong_model}")
+                    try:
+                        best_critic = self.strong_critic.evaluate_candidate(
+                            dialogue, best_candidate, context, deadline)
+                    except TimeoutError:
+                        # Keep the fast-tier acceptance rather than fail the task
+                        stop_reason = "deadline"
+                        break
+                    best_tier = "strong"
+                    context.add_critic_output(best_critic)
+                    top_candidate, top_critic = best_candidate, best_critic
+                    continue
+                stop_reason = "accepted"
+                break
+            if loops >= self.max_refiner_loops:
+                stop_reason = "max_loops"
+                break
+            if deadline is not None:
+                # Do not start a loop that is not expected to finish in time
+                expected = max(loop_durations) if loop_durations else self._expected_loop_latency()
+                if time.time() + expected >= deadline:
+                    stop_reason = "deadline"
+                    break
 
-        # 3) Refine until accepted or retries exhausted
-        loops = 0
-        while best_critic.score < self.ACCEPT_SCORE and loops < self.max_refiner_loops:
             loops += 1
+            loop_started = time.time()
 
             # Report refinement progress
             if TaskStage:
@@ -152,25 +241,64 @@ class MultiAgentLatentExtractor(LoggerMixin):
                 loops, best_candidate.latent, best_critic)
 
             # Refine the concept
-            new_latent = self.refiner.refine_concept(
-                best_candidate, best_critic, context)
+            previous_latents = context.get_context_summary()[
+                "previous_latents"]
+            try:
+                new_latent = self.refiner.refine_concept(
+                    best_candidate, best_critic, context, deadline)
+            except TimeoutError:
+                # Budget ran out mid-loop; the best candidate so far stands
+                stop_reason = "deadline"
+                break
             context.add_refiner_output(new_latent)
 
-            # Update candidate and re-evaluate
+            # A latent we already scored cannot change the outcome
+            if new_latent in previous_latents:
+                stop_reason = "repeated_latent"
+                break
+
+            # Update candidate and re-evaluate; looping means the dialogue is
+            # hard, so refined latents are judged by the strong tier
             best_candidate = GeneratorOutput(
                 latent=new_latent,
                 argument=best_candidate.argument
             )
-            best_critic = self.critic.evaluate_candidate(
-                dialogue, best_candidate, context)
+            try:
+                best_critic = self.strong_critic.evaluate_candidate(
+                    dialogue, best_candidate, context, deadline)
+            except TimeoutError:
+                stop_reason = "deadline"
+                break
+            best_tier = "strong"
             context.add_critic_output(best_critic)
 
             # Log refinement loop result
             self._log_refinement_loop_result(loops, new_latent, best_critic)
+            loop_durations.append(time.time() - loop_started)
+
+            if best_critic.score > top_critic.score:
+                top_candidate, top_critic = best_candidate, best_critic
+                stale_loops = 0
+            else:
+                stale_loops += 1
+            checkpoint()
+
+            if stale_loops >= self.plateau_patience and best_critic.score < self.ACCEPT_SCORE:
+                stop_reason = "plateau"
+                break
+
+        self.last_stop_reason = stop_reason
+        self.last_candidate, self.last_critic = top_candidate, top_critic
+        if stop_reason != "accepted":
+            report_progress(
+                current_stage,
+                f"Stopped refinement: {stop_reason} "
+                f"(best: {top_candidate.latent}, score: {top_critic.score})")
 
         # Log final result
-        self._log_problem_end(best_candidate.latent, best_critic, loops)
-        return best_candidate.latent
+        self._log_problem_end(top_candidate.latent,
+                              top_critic, loops, stop_reason)
+        return top_candidate.latent
 
     def predict(self, dialogue: List[Dict]) -> str:
         return self._search_latent(dialogue)
@@ -178,6 +306,48 @@ class MultiAgentLatentExtractor(LoggerMixin):
     def predict_with_progress(
         self,
         dialogue: List[Dict],
-        progress_callback: Optional[Callable] = None
+        progress_callback: Optional[Callable] = None,
+        deadline: Optional[float] = None,
+        resume: Optional[Dict] = None,
+        checkpoint_callback: Optional[Callable[[Dict], None]] = None,
+        seed_candidates: Optional[List[GeneratorOutput]] = None,
+        extra_candidates: Optional[List[GeneratorOutput]] = None
+    ) -> str:
+        """
+        Extract the latent concept, reporting progress as stages complete.
+
+        Args:
+            dialogue: List of dialogue turns with role and message
+            progress_callback: Optional callback(stage, message)
+            deadline: Optional absolute time after which refinement stops; the
+                initial generate-and-score pass always runs
+            resume: Extraction checkpoint to continue from
+            checkpoint_callback: Receives a serializable state after each stage
+            seed_candidates: Candidates scored instead of calling the generator
+            extra_candidates: Candidates scored alongside the generated ones
+        """
+        return self._search_latent_with_progress(
+            dialogue, progress_callback, deadline, resume, checkpoint_callback,
+            seed_candidates=seed_candidates, extra_candidates=extra_candidates)
+
+    def predict_incremental(
+        self,
+        dialogue: List[Dict],
+        prior_candidate: GeneratorOutput,
+        prior_critic: CriticOutput,
+        progress_callback: Optional[Callable] = None,
+        deadline: Optional[float] = None,
+        checkpoint_callback: Optional[Callable[[Dict], None]] = None
     ) -> str:
-        return self._search_latent_with_progress(dialogue, progress_callback)
+        """
+        Re-check a latent found for a prefix of this dialogue.
+
+        The prior latent is scored against the extended dialogue (fast tier
+        first) and only refined if it no longer holds, so the generator call
+        is skipped entirely.
+        """
+        return self._search_latent_with_progress(
+            dialogue, progress_callback, deadline,
+            checkpoint_callback=checkpoint_callback,
+            seed_candidates=[prior_candidate],
+            prior_critiques=[prior_critic])
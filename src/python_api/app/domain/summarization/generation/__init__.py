@@ -1,6 +1,7 @@
 
-from .simpleWorkflow import FlashCardGenerator
+from .simpleWorkflow import FlashCardGenerator, flashcard_flight
 
 __all__ = [
     'FlashCardGenerator',
+    'flashcard_flight',
 ]
@@ -0,0 +1,147 @@
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional
+
+from ...history.index import get_csv_index
+from ...flashcard.store import get_flashcard_store
+from ...flashcard.concepts import ConceptRegistry, get_concept_registry
+from .simpleWorkflow import FlashCardGenerator
+
+
+def read_concepts(path: str) -> List[str]:
+    """One concept per line; blank lines and # comments are ignored."""
+    with open(path, "r", encoding="utf-8") as fh:
+        lines = (line.strip() for line in fh)
+        return list(dict.fromkeys(line for line in lines if line and not line.startswith("#")))
+
+
+class _Progress:
+    """JSON-lines log of finished cards, so an interrupted run can resume."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, Dict]:
+        cards: Dict[str, Dict] = {}
+        if not os.path.exists(self.path):
+            return cards
+        with open(self.path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    card = json.loads(line)
+                except ValueError:
+                    # Torn last line from an interrupted run
+                    continue
+                cards[card["concept"]] = card
+        return cards
+
+    def record(self, card: Dict) -> None:
+        line = json.dumps(card, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as fh:
+                fh.write(line)
+
+    def clear(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def pregenerate_flashcards(
+    concepts: Iterable[str],
+    flashcards_csv_path: str = "../../data/flashcards.csv",
+    workers: int = 8,
+    progress_path: Optional[str] = None,
+    generator: Optional[FlashCardGenerator] = None,
+    report_every: int = 25,
+) -> Dict:
+    """
+    Generate cards for every concept that has none yet, in parallel.
+
+    "None yet" is judged by concept_key(), so other spellings of an
+    existing card (or of another concept in the list) are skipped too;
+    merely similar concepts are generated.
+
+    Calls go through the shared ResilientCaller, so they are rate limited
+    and retried like any other flashcard generation; `workers` bounds how
+    many are in flight. Each finished card is logged to the progress file
+    immediately, and all new cards are appended to the CSV in a single
+    write at the end, after which the card store is republished once.
+    Re-running after an interruption skips cards already in the progress
+    file or the CSV.
+
+    Returns:
+        Summary dict with requested, skipped, generated, failed and written counts
+    """
+    index = get_csv_index(flashcards_csv_path)
+    existing = get_concept_registry(flashcards_csv_path)
+    progress = _Progress(progress_path or flashcards_csv_path + ".pregen.jsonl")
+    done = progress.load()
+
+    # Local view of "already covered": cards in the CSV, cards from an earlier
+    # run, and concepts planned earlier in this list
+    covered = ConceptRegistry(threshold=existing.threshold)
+    for row in index.read_range(0, len(index)):
+        if row.get("concept"):
+            covered.add(row["concept"])
+    for concept in done:
+        covered.add(concept)
+
+    concepts = list(dict.fromkeys(c.strip() for c in concepts if c.strip()))
+    todo = []
+    for concept in concepts:
+        if covered.canonical(concept) is None:
+            covered.add(concept)
+            todo.append(concept)
+    print(f"{len(concepts)} concepts: {len(concepts) - len(todo)} already have cards, "
+          f"{len(todo)} to generate with {workers} workers")
+
+    generator = generator or FlashCardGenerator()
+    failed: Dict[str, str] = {}
+    started = time.time()
+
+    def generate(concept: str) -> Dict:
+        card = generator.generate(concept)
+        return {"concept": concept, "question": card.question, "answer": card.answer}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(generate, concept): concept for concept in todo}
+        for i, future in enumerate(as_completed(futures), 1):
+            concept = futures[future]
+            try:
+                card = future.result()
+            except Exception as e:
+                failed[concept] = str(e)
+            else:
+                progress.record(card)
+                done[concept] = card
+            if i % report_every == 0 or i == len(todo):
+                rate = i / max(time.time() - started, 1e-6)
+                print(f"[{i}/{len(todo)}] {rate:.1f} cards/s, {len(failed)} failed")
+
+    # Cards from an earlier run may already have been written before it stopped
+    saved_at = int(time.time())
+    rows = [
+        {**card, "user_id": None, "timestamp": saved_at}
+        for card in done.values() if existing.canonical(card["concept"]) is None
+    ]
+    index.append_rows(rows)
+    if rows:
+        get_flashcard_store(flashcards_csv_path).refresh()
+    if not failed:
+        progress.clear()
+
+    return {
+        "requested": len(concepts),
+        "skipped": len(concepts) - len(todo),
+        "generated": len(todo) - len(failed),
+        "failed": failed,
+        "written": len(rows),
+        "seconds": round(time.time() - started, 1),
+    }
@@ -1,7 +1,13 @@
 import os
+from typing import Optional
 from pydantic import BaseModel
 from openai import OpenAI
-import os
+
+from ..batching import BatchRequest, llm_batcher
+from ..ratelimit import estimate_tokens
+from ..resilience import ResilientCaller, llm_caller
+from ..singleflight import flashcard_flight
+from ...flashcard.concepts import concept_key
 
 
 class FlashCardSchema(BaseModel):
@@ -10,9 +16,12 @@ class FlashCardSchema(BaseModel):
 
 
 class FlashCardGenerator:
-    def __init__(self):
+    def __init__(self, caller: Optional[ResilientCaller] = None):
+        self.caller = caller or llm_caller
+        # Retries and timeouts are left to the ResilientCaller
         self.client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY")
+            api_key=os.getenv("OPENAI_API_KEY"),
+            max_retries=0
         )
         self.sys_prompt = """
         You are an expert flashcard generator. Given a concept, generate a concise question and answer pair.
@@ -33,8 +42,18 @@ class FlashCardGenerator:
         self.schema = FlashCardSchema
 
     def generate(self, concept: str) -> FlashCardSchema:
+        # Near-identical spellings of one concept share a single upstream call
+        return flashcard_flight.do(
+            (self.model, concept_key(concept)), lambda: self._generate(concept))
+
+    def _generate(self, concept: str) -> FlashCardSchema:
         usr_prompt = f"Generate a flashcard for the following concept:\nConcept: {concept}\nFlashcard:"
-        response = self.client.responses.parse(
+        batched = llm_batcher.run(BatchRequest(
+            stage="flashcard", client=self.client, model=self.model,
+            system=self.sys_prompt, user=usr_prompt, schema=self.schema))
+        if batched is not None:
+            return batched[0]
+        response = self.caller.call("flashcard", lambda timeout: self.client.responses.parse(
             model=self.model,
             temperature=0.5,
             input=[
@@ -42,5 +61,6 @@ class FlashCardGenerator:
                 {"role": "user", "content": usr_prompt}
             ],
             text_format=self.schema,
-        )
+            timeout=timeout,
+        ), tokens=estimate_tokens(self.sys_prompt, usr_prompt), model=self.model)
         return response.output_parsed
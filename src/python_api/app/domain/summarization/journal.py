@@ -0,0 +1,163 @@
+from __future__ import annotations
+import fcntl
+import json
+import os
+import threading
+from typing import IO, Any, Dict, Iterable, List, Optional, Tuple
+
+# Upper bound on concurrent processes sharing one journal base path
+MAX_SLOTS = 64
+
+
+def _try_lock(path: str) -> Optional[IO]:
+    """Exclusive non-blocking flock on path, held until the handle is closed."""
+    fh = open(path, "a")
+    try:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        fh.close()
+        return None
+    return fh
+
+
+class TaskJournal:
+    """
+    Append-only JSON-lines write-ahead log of task lifecycle events.
+
+    Each line is one event with a "type" of created, alias, status, progress
+    or checkpoint. Replaying the file folds the events back into per-task
+    state so that a restarted process can serve finished results and resume
+    unfinished tasks from their last checkpoint.
+
+    A journal has a single writer. Processes sharing a base path (gunicorn
+    workers) each open their own slot through claim().
+    """
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._fh = open(path, "a", encoding="utf-8")
+        self._owner_lock: Optional[IO] = None
+        # Journals of processes that are gone, folded in on the next rewrite()
+        self._adopted: List[Tuple[str, IO]] = []
+
+    @classmethod
+    def claim(cls, base_path: str, fsync: bool = False, max_slots: int = MAX_SLOTS) -> "TaskJournal":
+        """
+        Open the first journal slot that no live process holds.
+
+        Slots are base_path, base_path.1, base_path.2, ..., each owned through
+        an exclusive flock on "<slot>.lock" for as long as the owner lives, so
+        workers never replay, resume or overwrite each other's tasks. Existing
+        slots that nobody holds (fewer workers after a restart) are adopted:
+        replay() includes them and rewrite() moves their tasks into this slot.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(base_path)), exist_ok=True)
+        paths = [base_path] + [f"{base_path}.{slot}" for slot in range(1, max_slots)]
+        journal = None
+        for path in paths:
+            if journal is None:
+                owner_lock = _try_lock(path + ".lock")
+                if owner_lock is not None:
+                    journal = cls(path, fsync)
+                    journal._owner_lock = owner_lock
+            elif os.path.exists(path):
+                orphan_lock = _try_lock(path + ".lock")
+                if orphan_lock is not None:
+                    journal._adopted.append((path, orphan_lock))
+        if journal is None:
+            raise RuntimeError(f"All {max_slots} task journal slots for {base_path} are in use")
+        return journal
+
+    def append(self, event: Dict[str, Any]) -> None:
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self._lock:
+            self._fh.write(line + "\n")
+            self._fh.flush()
+            if self.fsync:
+                os.fsync(self._fh.fileno())
+
+    def replay(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Fold the journal into {task_id: state}.
+
+        State keys: task (creation fields), status fields, progress (list),
+        checkpoint (merged dict) and aliases (duplicate task ids).
+        """
+        states: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            self._fh.flush()
+            for path in [self.path] + [path for path, _ in self._adopted]:
+                with open(path, "r", encoding="utf-8") as fh:
+                    for line in fh:
+                        try:
+                            event = json.loads(line)
+                        except ValueError:
+                            # A torn final line from a crash mid-write
+                            continue
+                        self._apply(states, event)
+        return states
+
+    @staticmethod
+    def _apply(states: Dict[str, Dict[str, Any]], event: Dict[str, Any]) -> None:
+        kind = event.get("type")
+        if kind == "created":
+            states[event["task_id"]] = {
+                "task": event["task"],
+                "status": "pending",
+                "progress": [],
+                "checkpoint": {},
+                "aliases": [],
+            }
+            return
+
+        if kind == "alias":
+            state = states.get(event["primary"])
+            if state is not None:
+                state["aliases"].append(event["task_id"])
+            return
+
+        state = states.get(event.get("task_id"))
+        if state is None:
+            return
+        if kind == "status":
+            for key in ("status", "result", "error", "started_at", "completed_at"):
+                if key in event:
+                    state[key] = event[key]
+        elif kind == "progress":
+            state["progress"].append(event["progress"])
+        elif kind == "checkpoint":
+            state["checkpoint"].update(event["checkpoint"])
+
+    def rewrite(self, events: Iterable[Dict[str, Any]]) -> None:
+        """Atomically replace the journal with a compacted event stream."""
+        tmp_path = self.path + ".tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                for event in events:
+                    fh.write(json.dumps(event, ensure_ascii=False,
+                             default=str) + "\n")
+                fh.flush()
+                os.fsync(fh.fileno())
+            self._fh.close()
+            os.replace(tmp_path, self.path)
+            self._fh = open(self.path, "a", encoding="utf-8")
+            # Adopted tasks now live in this slot
+            for path, orphan_lock in self._adopted:
+                os.remove(path)
+                orphan_lock.close()
+            self._adopted = []
+
+    def close(self) -> None:
+        with self._lock:
+            self._fh.close()
+            for _, orphan_lock in self._adopted:
+                orphan_lock.close()
+            self._adopted = []
+            if self._owner_lock is not None:
+                self._owner_lock.close()
+                self._owner_lock = None
+
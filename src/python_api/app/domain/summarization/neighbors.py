@@ -0,0 +1,227 @@
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from ..flashcard.concepts import concept_key
+from ..history.archive import get_dialogue_log
+from ..search.tfidf import HashedTfidf, add_terms, compact_unlocked, text_words
+from .resilience import llm_caller
+
+# Dialogues read from the log per indexing batch
+_SYNC_BATCH = 2_000
+
+
+def dialogue_terms(dialogue: List[Dict], n_features: int) -> Dict[int, float]:
+    """Hashed unigrams and adjacent-word bigrams of all messages."""
+    words: List[str] = []
+    bigrams: List[str] = []
+    for turn in dialogue:
+        if not isinstance(turn, dict):
+            continue
+        turn_words = text_words(str(turn.get("message") or ""))
+        words.extend(turn_words)
+        bigrams.extend(f"{a} {b}" for a, b in zip(turn_words, turn_words[1:]))
+    weights: Dict[int, float] = {}
+    add_terms(weights, words, "w", 1.0, n_features)
+    add_terms(weights, bigrams, "p", 0.5, n_features)
+    return weights
+
+
+@dataclass
+class NeighborCandidate:
+    """A historical latent proposed for a new dialogue."""
+    latent: str
+    score: float        # similarity of the closest dialogue resolved this way
+    share: float        # fraction of the neighbours' total similarity
+    support: int        # neighbours that agree on this concept
+
+
+@dataclass
+class NeighborSuggestion:
+    candidates: List[NeighborCandidate] = field(default_factory=list)
+    confident: bool = False
+
+    @property
+    def top(self) -> Optional[NeighborCandidate]:
+        return self.candidates[0] if self.candidates else None
+
+
+class LatentNeighbors:
+    """
+    Nearest-neighbour latent proposals from past dialogues.
+
+    Every saved dialogue is a hashed TF-IDF document over its words and
+    word pairs, labelled with the latent it was resolved to. suggest()
+    finds the k most similar past dialogues and ranks their latents by
+    summed similarity (grouped by concept_key()). The index follows the
+    dialogue log (CSV or archive) by row count, like LatentAggregates.
+
+    A suggestion is confident when its closest dialogue scores at least
+    skip_score and it holds skip_share of the neighbours' similarity; the
+    extractor then hands it to the critic in place of a generator call.
+    Otherwise the best candidate above seed_score is only added next to
+    the generated ones.
+    """
+
+    def __init__(
+        self,
+        dialogue_path: str,
+        k: int = 10,
+        skip_score: float = 0.8,
+        skip_share: float = 0.6,
+        seed_score: float = 0.3,
+        n_features: int = 1 << 20,
+        max_df: float = 0.3
+    ):
+        self.dialogue_path = dialogue_path
+        self.k = k
+        self.skip_score = skip_score
+        self.skip_share = skip_share
+        self.seed_score = seed_score
+        self.n_features = n_features
+        self.max_df = max_df
+        self._lock = threading.RLock()
+        self._rows = 0
+        self._reset()
+
+        self.lookups = 0
+        self.hits = 0       # lookups that yielded a candidate worth a critic call
+        self.skips = 0
+        self.seeded = 0
+        self.seed_wins = 0
+        self.lookup_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def _reset(self) -> None:
+        self._tfidf = HashedTfidf(self.n_features, self.max_df)
+        self._latents: List[str] = []
+
+    def refresh(self) -> int:
+        """Index dialogues saved since the last refresh; returns how many rows."""
+        log = get_dialogue_log(self.dialogue_path)
+        total = len(log)
+        with self._lock:
+            if total < self._rows:
+                # Log was replaced by a shorter one; start over
+                self._reset()
+                self._rows = 0
+            start = self._rows
+            for batch_start in range(start, total, _SYNC_BATCH):
+                documents, latents = [], []
+                for row in log.read_range(batch_start, min(batch_start + _SYNC_BATCH, total)):
+                    latent = (row.get("latent") or "").strip()
+                    dialogue = row.get("dialogue")
+                    if isinstance(dialogue, str):
+                        try:
+                            dialogue = json.loads(dialogue)
+                        except ValueError:
+                            continue
+                    if not latent or not isinstance(dialogue, list):
+                        continue
+                    terms = dialogue_terms(dialogue, self.n_features)
+                    if terms:
+                        documents.append(terms)
+                        latents.append(latent)
+                self._tfidf.add_many(documents)
+                self._latents.extend(latents)
+            self._rows = total
+            tfidf = self._tfidf
+        compact_unlocked(self._lock, tfidf)
+        return total - start
+
+    def suggest(self, dialogue: List[Dict]) -> NeighborSuggestion:
+        """Rank the latents of the most similar past dialogues."""
+        started = time.perf_counter()
+        self.refresh()
+        terms = dialogue_terms(dialogue, self.n_features)
+        with self._lock:
+            found = self._tfidf.search(terms, self.k)
+            groups: Dict[str, NeighborCandidate] = {}
+            for doc, score in found:
+                latent = self._latents[doc]
+                key = concept_key(latent)
+                group = groups.get(key)
+                if group is None:
+                    # Results come most similar first, so this is the best spelling
+                    groups[key] = NeighborCandidate(latent, score, score, 1)
+                else:
+                    group.share += score
+                    group.support += 1
+
+        total = sum(score for _, score in found)
+        candidates = sorted(groups.values(), key=lambda c: c.share, reverse=True)
+        for candidate in candidates:
+            candidate.share = candidate.share / total if total else 0.0
+        top = candidates[0] if candidates else None
+        confident = (top is not None and top.score >= self.skip_score
+                     and top.share >= self.skip_share)
+        with self._lock:
+            self.lookups += 1
+            self.lookup_seconds += time.perf_counter() - started
+        return NeighborSuggestion(candidates, confident)
+
+    def seed(self, suggestion: NeighborSuggestion) -> Optional[NeighborCandidate]:
+        """The candidate worth a critic call, if any."""
+        top = suggestion.top
+        if top is None or not (suggestion.confident or top.score >= self.seed_score):
+            return None
+        with self._lock:
+            self.hits += 1
+        return top
+
+    def record_outcome(self, skipped_generator: bool, seeded: bool, won: bool) -> None:
+        """Count how a suggestion was used and whether the extractor kept it."""
+        with self._lock:
+            if skipped_generator:
+                self.skips += 1
+                # Charge the saving at the generator's typical latency
+                stats = llm_caller.get_stats().get("generator") or {}
+                self.saved_seconds += stats.get("latency_p50") or 0.0
+            self.seeded += seeded
+            self.seed_wins += won
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "dialogues": len(self._latents),
+                "lookups": self.lookups,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                "generator_skips": self.skips,
+                "skip_rate": round(self.skips / self.lookups, 4) if self.lookups else 0.0,
+                "seeded": self.seeded,
+                "seed_wins": self.seed_wins,
+                "seed_win_rate": round(self.seed_wins / self.seeded, 4) if self.seeded else 0.0,
+                "avg_lookup_ms": round(1000 * self.lookup_seconds / self.lookups, 3) if self.lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
+
+
+_neighbors: Dict[str, LatentNeighbors] = {}
+_neighbors_lock = threading.Lock()
+
+
+def get_latent_neighbors(dialogue_path: str) -> LatentNeighbors:
+    """Process-wide latent neighbour index for a dialogue CSV or archive."""
+    key = os.path.abspath(dialogue_path)
+    with _neighbors_lock:
+        neighbors = _neighbors.get(key)
+        if neighbors is None:
+            neighbors = _neighbors[key] = LatentNeighbors(
+                dialogue_path,
+                k=int(os.getenv("LATENT_NN_K", "10")),
+                skip_score=float(os.getenv("LATENT_NN_SKIP_SCORE", "0.8")),
+                skip_share=float(os.getenv("LATENT_NN_SKIP_SHARE", "0.6")),
+                seed_score=float(os.getenv("LATENT_NN_SEED_SCORE", "0.3")),
+            )
+        return neighbors
+
+
+def get_neighbor_stats() -> Dict[str, Dict[str, Any]]:
+    """Stats of every neighbour index in this process, keyed by dialogue path."""
+    with _neighbors_lock:
+        neighbors = list(_neighbors.items())
+    return {path: n.get_stats() for path, n in neighbors}
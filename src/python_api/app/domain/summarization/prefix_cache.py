@@ -0,0 +1,113 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+def prefix_hashes(dialogue: List[Dict]) -> List[str]:
+    """Chained hashes where entry i identifies the first i+1 turns."""
+    hashes: List[str] = []
+    digest = b""
+    for turn in dialogue:
+        turn_json = json.dumps(turn, sort_keys=True, ensure_ascii=False)
+        digest = hashlib.sha256(digest + turn_json.encode("utf-8")).digest()
+        hashes.append(digest.hex())
+    return hashes
+
+
+@dataclass
+class PrefixEntry:
+    """Extraction result cached for one analyzed dialogue prefix."""
+    latent: str
+    argument: str
+    verdict: str
+    score: int
+    critique: str
+    turns: int
+    cold_duration: float    # what a from-scratch extraction of this prefix cost
+    created_at: float
+
+
+class PrefixCache:
+    """
+    Per-user LRU cache of analyzed dialogue prefixes keyed by prefix hash.
+
+    A resubmitted conversation that extends an earlier one is matched to the
+    longest cached prefix, letting extraction start from the prior result.
+    """
+
+    def __init__(self, max_entries_per_user: int = 32, ttl_seconds: float = 3600):
+        self.max_entries_per_user = max_entries_per_user
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[Hashable, "OrderedDict[str, PrefixEntry]"] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.full_hits = 0
+        self.reused_turns = 0
+        self.total_turns = 0
+        self.saved_seconds = 0.0
+
+    def lookup(self, user_id: Hashable, dialogue: List[Dict]) -> Optional[Tuple[PrefixEntry, int]]:
+        """Return (entry, prefix_turns) for the longest cached prefix, if any."""
+        hashes = prefix_hashes(dialogue)
+        now = time.time()
+        with self._lock:
+            self.lookups += 1
+            self.total_turns += len(dialogue)
+            entries = self._entries.get(user_id)
+            if not entries:
+                return None
+            for turns in range(len(hashes), 0, -1):
+                entry = entries.get(hashes[turns - 1])
+                if entry is None:
+                    continue
+                if now - entry.created_at > self.ttl_seconds:
+                    del entries[hashes[turns - 1]]
+                    continue
+                entries.move_to_end(hashes[turns - 1])
+                self.hits += 1
+                self.reused_turns += turns
+                if turns == len(dialogue):
+                    self.full_hits += 1
+                return entry, turns
+        return None
+
+    def store(self, user_id: Hashable, dialogue: List[Dict], entry: PrefixEntry) -> None:
+        if not dialogue:
+            return
+        key = prefix_hashes(dialogue)[-1]
+        with self._lock:
+            entries = self._entries.setdefault(user_id, OrderedDict())
+            entries[key] = entry
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries_per_user:
+                entries.popitem(last=False)
+
+    def record_savings(self, seconds: float) -> None:
+        with self._lock:
+            self.saved_seconds += max(0.0, seconds)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "users": len(self._entries),
+                "entries": sum(len(e) for e in self._entries.values()),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "full_hits": self.full_hits,
+                "reuse_ratio": (self.reused_turns / self.total_turns) if self.total_turns else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
+
+
+# Global prefix cache shared by all tasks in this process
+prefix_cache = PrefixCache(
+    max_entries_per_user=int(os.getenv("PREFIX_CACHE_ENTRIES_PER_USER", "32")),
+    ttl_seconds=float(os.getenv("PREFIX_CACHE_TTL", "3600")),
+)
@@ -0,0 +1,188 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+def estimate_tokens(*texts: str, completion_tokens: int = 300) -> int:
+    """Rough prompt + completion token estimate (~4 characters per token)."""
+    return sum(len(t) for t in texts) // 4 + completion_tokens
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate_per_minute`."""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = float(rate_per_minute) / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens +
+                          (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)."""
+        self._refill(now)
+        # Requests larger than the bucket are admitted once it is full
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Process-wide limiter on upstream requests and tokens per minute.
+
+    Every agent and the flashcard generator acquire from the same instance
+    (via the ResilientCaller) so bursts from parallel tasks share one budget.
+    """
+
+    def __init__(self, requests_per_minute: float = 500, tokens_per_minute: float = 200000):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+
+    def acquire(self, tokens: int = 1, deadline: Optional[float] = None) -> None:
+        """Block until one request and `tokens` tokens fit in the budget."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                delay = max(self.requests.wait_time(1, now),
+                            self.tokens.wait_time(tokens, now))
+                if delay <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    self.acquired += 1
+                    if waited > 0:
+                        self.throttled += 1
+                        self.total_wait += waited
+                    return
+            if deadline is not None and time.time() + delay > deadline:
+                raise TimeoutError("Rate limit wait would exceed deadline")
+            time.sleep(delay)
+            waited += delay
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            self.requests._refill(now)
+            self.tokens._refill(now)
+            return {
+                "requests_per_minute": self.requests.capacity,
+                "tokens_per_minute": self.tokens.capacity,
+                "requests_available": round(self.requests.tokens, 1),
+                "tokens_available": round(self.tokens.tokens, 1),
+                "acquired": self.acquired,
+                "throttled": self.throttled,
+                "total_wait_seconds": round(self.total_wait, 3),
+            }
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD controller for how many summarization tasks may run at once.
+
+    Each fast upstream success grows the window by 1/window (about +1 per
+    window of calls); a rate-limit error or a call slower than
+    `target_latency` halves it, at most once per `cooldown` seconds.
+    """
+
+    def __init__(
+        self,
+        initial: int = 2,
+        min_limit: int = 1,
+        max_limit: int = 8,
+        target_latency: float = 10.0,
+        decrease_factor: float = 0.5,
+        cooldown: float = 5.0
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.active = 0
+        self.increases = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def window(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    def acquire(self) -> None:
+        """Block until a task slot inside the current window is free."""
+        with self._cond:
+            while self.active >= self.window:
+                self._cond.wait()
+            self.active += 1
+
+    def release(self) -> None:
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def on_success(self, latency: float) -> None:
+        if latency > self.target_latency:
+            self._decrease()
+            return
+        with self._cond:
+            if self.limit < self.max_limit:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                self.increases += 1
+                self._cond.notify_all()
+
+    def on_rate_limited(self) -> None:
+        self._decrease()
+
+    def _decrease(self) -> None:
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_decrease < self.cooldown:
+                return
+            self._last_decrease = now
+            self.limit = max(float(self.min_limit),
+                             self.limit * self.decrease_factor)
+            self.decreases += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "window": self.window,
+                "limit": round(self.limit, 2),
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "active": self.active,
+                "target_latency": self.target_latency,
+                "increases": self.increases,
+                "decreases": self.decreases,
+            }
+
+
+TASK_POOL_SIZE = int(os.getenv("TASK_POOL_SIZE", "8"))
+
+# Global limiter and controller shared by every task and agent
+rate_limiter = RateLimiter(
+    requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "500")),
+    tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", "200000")),
+)
+concurrency_controller = AdaptiveConcurrency(
+    initial=int(os.getenv("TASK_CONCURRENCY_INITIAL", "2")),
+    min_limit=int(os.getenv("TASK_CONCURRENCY_MIN", "1")),
+    max_limit=TASK_POOL_SIZE,
+    target_latency=float(os.getenv("LLM_TARGET_LATENCY", "20")),
+)
@@ -0,0 +1,389 @@
+from __future__ import annotations
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from ...tracing import tracer
+from .ratelimit import (
+    TASK_POOL_SIZE,
+    AdaptiveConcurrency,
+    RateLimiter,
+    concurrency_controller,
+    rate_limiter,
+)
+
+# Upstream calls that may be in flight at once; tasks call one stage at a
+# time, so one per task slot by default
+LLM_MAX_CONCURRENT_CALLS = int(os.getenv("LLM_MAX_CONCURRENT_CALLS", str(TASK_POOL_SIZE)))
+
+
+@lru_cache(maxsize=None)
+def transient_errors() -> Tuple[type, ...]:
+    """
+    Errors worth another attempt: the request may succeed if simply re-sent.
+
+    openai is imported on first use so that loading this module (and the
+    metrics it backs) does not pull the SDK into app startup.
+    """
+    import openai
+    return (
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+        TimeoutError,
+    )
+
+
+@dataclass
+class CallPolicy:
+    """Timeout, retry and hedging settings for one pipeline stage."""
+    timeout: float = 30.0           # per-attempt timeout in seconds
+    deadline: float = 90.0          # total budget for the call incl. retries
+    max_retries: int = 2
+    backoff_base: float = 0.5
+    backoff_max: float = 8.0
+    hedge: bool = True
+    hedge_quantile: float = 0.95
+    hedge_min_samples: int = 20
+    hedge_default_delay: float = 10.0
+    max_hedges: int = 1
+    typical_latency: float = 5.0    # latency estimate until samples exist
+
+
+DEFAULT_POLICIES: Dict[str, CallPolicy] = {
+    "generator": CallPolicy(timeout=30.0, deadline=90.0),
+    "critic": CallPolicy(timeout=20.0, deadline=60.0),
+    "refiner": CallPolicy(timeout=20.0, deadline=60.0),
+    "flashcard": CallPolicy(timeout=20.0, deadline=60.0),
+}
+
+
+class StageStats:
+    """Counters and a rolling latency window for a single stage."""
+
+    WINDOW = 200
+
+    def __init__(self):
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.attempts = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.latencies: Deque[float] = deque(maxlen=self.WINDOW)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        idx = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[idx]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "latency_p50": self.quantile(0.5),
+            "latency_p95": self.quantile(0.95),
+        }
+
+
+class _Attempt:
+    """One request on the hedge pool; its clock starts when a thread picks it up."""
+
+    def __init__(self, budget: Callable[[float], float]):
+        self.budget = budget            # start time -> seconds the attempt may take
+        self.started = threading.Event()
+        self.started_at: Optional[float] = None
+        self.future: Optional[Future] = None
+
+
+class ResilientCaller:
+    """
+    Runs upstream LLM calls with per-stage timeouts, bounded retries and hedging.
+
+    The wrapped function receives the timeout (seconds) it should pass on to the
+    SDK so that a hung connection is abandoned instead of holding a worker thread.
+    """
+
+    def __init__(
+        self,
+        policies: Optional[Dict[str, CallPolicy]] = None,
+        hedge_workers: Optional[int] = None,
+        limiter: Optional[RateLimiter] = None,
+        controller: Optional[AdaptiveConcurrency] = None
+    ):
+        self.policies: Dict[str, CallPolicy] = dict(DEFAULT_POLICIES)
+        if policies:
+            self.policies.update(policies)
+        self.limiter = limiter or rate_limiter
+        self.controller = controller or concurrency_controller
+        self._stats: Dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+        if hedge_workers is None:
+            # Room for every concurrent call plus all of its hedges, so an
+            # attempt never waits for a thread held by another call
+            hedge_workers = LLM_MAX_CONCURRENT_CALLS * (1 + max(
+                (p.max_hedges for p in self.policies.values() if p.hedge), default=0))
+        self.hedge_workers = hedge_workers
+        self._hedge_executor = ThreadPoolExecutor(
+            max_workers=hedge_workers, thread_name_prefix="llm-hedge")
+
+    def get_policy(self, stage: str) -> CallPolicy:
+        # "critic.fast" falls back to the "critic" policy
+        return (self.policies.get(stage)
+                or self.policies.get(stage.split(".")[0])
+                or CallPolicy())
+
+    def _stage_stats(self, stage: str) -> StageStats:
+        with self._lock:
+            stats = self._stats.get(stage)
+            if stats is None:
+                stats = self._stats[stage] = StageStats()
+            return stats
+
+    def expected_latency(self, stage: str) -> float:
+        """Median latency of recent successful calls, or the policy's prior."""
+        with self._lock:
+            stats = self._stats.get(stage)
+            p50 = stats.quantile(0.5) if stats is not None else None
+        return p50 if p50 is not None else self.get_policy(stage).typical_latency
+
+    def _bump(self, stats: StageStats, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(stats, counter, getattr(stats, counter) + amount)
+
+    def _hedge_delay(self, stats: StageStats, policy: CallPolicy) -> float:
+        with self._lock:
+            if len(stats.latencies) < policy.hedge_min_samples:
+                return policy.hedge_default_delay
+            return stats.quantile(policy.hedge_quantile)
+
+    def _backoff(self, attempt: int, policy: CallPolicy) -> float:
+        # Full jitter exponential backoff
+        cap = min(policy.backoff_max, policy.backoff_base * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    def call(
+        self,
+        stage: str,
+        fn: Callable[[float], Any],
+        deadline: Optional[float] = None,
+        tokens: int = 1,
+        model: Optional[str] = None,
+        policy: Optional[CallPolicy] = None
+    ) -> Any:
+        """
+        Call fn(timeout) under the stage policy.
+
+        Args:
+            stage: Policy/metrics key, e.g. "critic"
+            fn: Callable issuing the upstream request with the given timeout
+            deadline: Optional absolute time.time() after which no attempt is made
+            tokens: Estimated tokens per attempt, charged to the rate limiter
+            model: Model name, recorded on the trace span
+            policy: Overrides the stage policy for this call (stats are still per stage)
+
+        Returns:
+            Whatever fn returns for the first successful attempt
+
+        Raises:
+            TimeoutError: `deadline` passed (or cut the last attempt short)
+                before any attempt succeeded, chained to the last upstream error
+        """
+        with tracer.span(f"llm.{stage}", stage=stage, model=model, tokens_estimated=tokens):
+            return self._call(stage, fn, deadline, tokens, policy or self.get_policy(stage))
+
+    def _call(
+        self,
+        stage: str,
+        fn: Callable[[float], Any],
+        deadline: Optional[float],
+        tokens: int,
+        policy: CallPolicy
+    ) -> Any:
+        stats = self._stage_stats(stage)
+        self._bump(stats, "calls")
+
+        call_deadline = time.time() + policy.deadline
+        if deadline is not None:
+            call_deadline = min(call_deadline, deadline)
+
+        # Every attempt, hedges included, is charged to the shared budget
+        def limited(timeout: float) -> Any:
+            with tracer.span("llm.attempt", timeout=round(timeout, 3)) as span:
+                queued = time.time()
+                self.limiter.acquire(tokens, call_deadline)
+                span.set(rate_limit_wait_ms=round(
+                    (time.time() - queued) * 1000, 3))
+                result = fn(timeout)
+                usage = getattr(result, "usage", None)
+                if usage is not None:
+                    # Chat completions vs. Responses API field names
+                    span.set(
+                        prompt_tokens=getattr(usage, "prompt_tokens", None)
+                        or getattr(usage, "input_tokens", None),
+                        completion_tokens=getattr(usage, "completion_tokens", None)
+                        or getattr(usage, "output_tokens", None))
+                return result
+
+        last_error: Optional[BaseException] = None
+        # Whether the last attempt's timeout was shortened by the caller's deadline
+        cut_short = False
+        for attempt in range(policy.max_retries + 1):
+            remaining = call_deadline - time.time()
+            if remaining <= 0:
+                break
+            if attempt > 0:
+                self._bump(stats, "retries")
+
+            timeout = min(policy.timeout, remaining)
+            cut_short = deadline is not None and deadline <= call_deadline and timeout < policy.timeout
+            started = time.time()
+            try:
+                if policy.hedge:
+                    result, started = self._call_hedged(limited, timeout, call_deadline, stats, policy)
+                else:
+                    self._bump(stats, "attempts")
+                    result = limited(timeout)
+            except transient_errors() as e:
+                import openai
+                last_error = e
+                if isinstance(e, openai.RateLimitError):
+                    self.controller.on_rate_limited()
+                if isinstance(e, (openai.APITimeoutError, TimeoutError)):
+                    self._bump(stats, "timeouts")
+                sleep_for = min(self._backoff(attempt, policy),
+                                max(0.0, call_deadline - time.time()))
+                time.sleep(sleep_for)
+                continue
+            except Exception:
+                self._bump(stats, "failures")
+                raise
+
+            latency = time.time() - started
+            with self._lock:
+                stats.latencies.append(latency)
+                stats.successes += 1
+            self.controller.on_success(latency)
+            return result
+
+        self._bump(stats, "failures")
+        if last_error is not None and deadline is not None and (cut_short or time.time() >= deadline):
+            # The caller's budget ran out, whatever the last attempt failed
+            # with; callers that degrade on their deadline catch TimeoutError
+            raise TimeoutError(f"Deadline exceeded during {stage} call") from last_error
+        if last_error is not None:
+            raise last_error
+        raise TimeoutError(f"Deadline exceeded before {stage} call could run")
+
+    def _submit(self, fn: Callable[[float], Any], budget: Callable[[float], float]) -> _Attempt:
+        attempt = _Attempt(budget)
+
+        def run() -> Any:
+            attempt.started_at = time.time()
+            attempt.started.set()
+            timeout = attempt.budget(attempt.started_at)
+            if timeout <= 0:
+                raise TimeoutError("Upstream call timed out")
+            return fn(timeout)
+
+        # Attempts run on pool threads; copy the context so their spans nest here
+        attempt.future = self._hedge_executor.submit(contextvars.copy_context().run, run)
+        return attempt
+
+    def _call_hedged(
+        self,
+        fn: Callable[[float], Any],
+        timeout: float,
+        call_deadline: float,
+        stats: StageStats,
+        policy: CallPolicy
+    ) -> Tuple[Any, float]:
+        """
+        Send the request, and a duplicate if it is slower than the stage p95.
+
+        The timeout and hedge delay count from when the request starts
+        executing, not from when it was queued for a pool thread; time spent
+        queued is bounded by the call deadline alone.
+
+        Returns:
+            The first successful result and the time its attempt started
+        """
+        self._bump(stats, "attempts")
+        primary = self._submit(
+            fn, lambda started_at: min(timeout, call_deadline - started_at))
+        attempts = {primary.future: primary}
+        pending = {primary.future}
+        hedges = 0
+
+        try:
+            while True:
+                now = time.time()
+                if now >= call_deadline:
+                    raise TimeoutError("Upstream call timed out")
+                if primary.started_at is None:
+                    # Queued behind other calls: the timeout has not started yet
+                    primary.started.wait(call_deadline - now)
+                    continue
+
+                elapsed = now - primary.started_at
+                remaining = min(timeout - elapsed, call_deadline - now)
+                if remaining <= 0:
+                    raise TimeoutError("Upstream call timed out")
+
+                wait_for = remaining
+                if hedges < policy.max_hedges:
+                    wait_for = min(remaining, max(
+                        0.0, self._hedge_delay(stats, policy) - elapsed))
+
+                done, pending = wait(pending, timeout=wait_for,
+                                     return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is not primary.future:
+                            self._bump(stats, "hedge_wins")
+                        return future.result(), attempts[future].started_at
+                if done and not pending:
+                    # Every in-flight attempt failed; surface the most recent error
+                    raise next(iter(done)).exception()
+
+                if not done and hedges < policy.max_hedges:
+                    hedges += 1
+                    self._bump(stats, "hedges")
+                    self._bump(stats, "attempts")
+                    # A hedge shares the primary's window rather than extending it
+                    ends_at = primary.started_at + timeout
+                    hedge = self._submit(
+                        fn, lambda started_at: min(ends_at, call_deadline) - started_at)
+                    attempts[hedge.future] = hedge
+                    pending.add(hedge.future)
+        finally:
+            for other in pending:
+                other.cancel()
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-stage counters suitable for a metrics endpoint."""
+        with self._lock:
+            stages = list(self._stats.items())
+        return {stage: stats.to_dict() for stage, stats in stages}
+
+
+# Global caller shared by all agents
+llm_caller = ResilientCaller()
@@ -1,3 +1,7 @@
+import hashlib
+import json
+import logging
+import os
 import threading
 import time
 import uuid
@@ -6,6 +10,12 @@ from enum import Enum
 from typing import Dict, List, Optional, Callable, Any
 from concurrent.futures import ThreadPoolExecutor
 
+from ...tracing import tracer
+from .journal import TaskJournal
+from .ratelimit import AdaptiveConcurrency, TASK_POOL_SIZE, concurrency_controller
+
+logger = logging.getLogger(__name__)
+
 
 class TaskStatus(Enum):
     """Task execution status."""
@@ -44,6 +54,12 @@ class SummarizationTask:
     user_id: int = 0
     dialogue_csv_path: str = "../../data/dialogues.csv"
     flashcards_csv_path: str = "../../data/flashcards.csv"
+    latency_budget: Optional[float] = None
+    dedup_key: Optional[str] = None
+    # Trace of the request that created the task, so its spans join it
+    trace_id: Optional[str] = None
+    parent_span_id: Optional[str] = None
+    checkpoint: Dict[str, Any] = field(default_factory=dict)
     status: TaskStatus = TaskStatus.PENDING
     progress: List[TaskProgress] = field(default_factory=list)
     result: Optional[str] = None
@@ -51,11 +67,16 @@ class SummarizationTask:
     created_at: float = field(default_factory=time.time)
     started_at: Optional[float] = None
     completed_at: Optional[float] = None
+    # Set when the task was rebuilt from the journal after a restart
+    recovered_at: Optional[float] = None
+    # Bumped on every observable change; backs the status ETag
+    version: int = 0
 
     def add_progress(self, stage: TaskStage, message: str = ""):
         """Add a progress update to the task."""
         progress = TaskProgress(stage=stage, message=message)
         self.progress.append(progress)
+        self.version += 1
 
     def get_current_stage(self) -> TaskStage:
         """Get the current stage of the task."""
@@ -76,18 +97,40 @@ class TaskManager:
     using ThreadPoolExecutor for concurrent processing.
     """
 
-    def __init__(self, max_workers: int = 2, task_retention_seconds: int = 3600):
+    def __init__(
+        self,
+        max_workers: int = TASK_POOL_SIZE,
+        task_retention_seconds: int = 3600,
+        concurrency: Optional[AdaptiveConcurrency] = None,
+        journal: Optional[TaskJournal] = None
+    ):
         """
         Initialize the task manager.
 
         Args:
-            max_workers: Maximum number of concurrent summarization tasks
+            max_workers: Thread pool size, the upper bound on concurrent tasks
             task_retention_seconds: How long to keep completed tasks in memory
+            concurrency: Adaptive controller deciding how many tasks actually run
+            journal: Write-ahead journal used to recover tasks after a restart
         """
         self._tasks: Dict[str, SummarizationTask] = {}
+        # Single-flight bookkeeping: identical in-flight submissions share a task
+        self._inflight: Dict[str, str] = {}   # dedup key -> primary task_id
+        self._aliases: Dict[str, str] = {}    # duplicate task_id -> primary task_id
+        self._coalesced_count = 0
         self._lock = threading.RLock()
+        # Versions restart with the process; the epoch keeps old ETags from matching
+        self._epoch = uuid.uuid4().hex[:8]
+        # Signalled whenever a task gains progress or changes status
+        self._changed = threading.Condition(self._lock)
+        self.max_workers = max_workers
         self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._concurrency = concurrency or concurrency_controller
         self.task_retention_seconds = task_retention_seconds
+        self._journal = journal
+
+        if self._journal is not None:
+            self._recover()
 
         # Start cleanup thread
         self._cleanup_thread = threading.Thread(
@@ -99,7 +142,8 @@ class TaskManager:
         dialogue: List[Dict],
         user_id: int = 0,
         dialogue_csv_path: str = "../../data/dialogues.csv",
-        flashcards_csv_path: str = "../../data/flashcards.csv"
+        flashcards_csv_path: str = "../../data/flashcards.csv",
+        latency_budget: Optional[float] = None
     ) -> str:
         """
         Create a new summarization task and start execution.
@@ -109,37 +153,209 @@ class TaskManager:
             user_id: User identifier
             dialogue_csv_path: Path to dialogue CSV file
             flashcards_csv_path: Path to flashcards CSV file
+            latency_budget: Seconds from the start of execution after which refinement stops early
 
         Returns:
             task_id: Unique identifier for the created task
         """
         task_id = str(uuid.uuid4())
+        dedup_key = self._dedup_key(
+            dialogue, user_id, dialogue_csv_path, flashcards_csv_path)
+        parent = tracer.current()
 
         task = SummarizationTask(
             task_id=task_id,
             dialogue=dialogue,
             user_id=user_id,
             dialogue_csv_path=dialogue_csv_path,
-            flashcards_csv_path=flashcards_csv_path
+            flashcards_csv_path=flashcards_csv_path,
+            latency_budget=latency_budget,
+            dedup_key=dedup_key,
+            trace_id=parent.trace_id if parent else None,
+            parent_span_id=parent.span_id if parent else None
         )
 
         with self._lock:
+            primary_id = self._inflight.get(dedup_key)
+            if primary_id is not None:
+                # Attach to the in-flight computation instead of rerunning it
+                self._aliases[task_id] = primary_id
+                self._coalesced_count += 1
+                now = time.time()
+                tracer.record("task.coalesced", now, now,
+                              task_id=task_id, primary_task_id=primary_id)
+                self._write_journal(
+                    {"type": "alias", "task_id": task_id, "primary": primary_id})
+                return task_id
+
+            self._inflight[dedup_key] = task_id
             self._tasks[task_id] = task
+            self._write_journal(self._created_event(task))
 
         # Submit task for background execution
         self._executor.submit(self._execute_task, task_id)
 
         return task_id
 
+    def _write_journal(self, event: Dict[str, Any]) -> None:
+        """Append to the journal; callers hold self._lock so compaction sees every event."""
+        if self._journal is None:
+            return
+        try:
+            self._journal.append(event)
+        except OSError:
+            # Losing durability must not fail the task itself
+            logger.exception("Failed to write task journal event")
+
+    @staticmethod
+    def _created_event(task: SummarizationTask) -> Dict[str, Any]:
+        return {
+            "type": "created",
+            "task_id": task.task_id,
+            "task": {
+                "dialogue": task.dialogue,
+                "user_id": task.user_id,
+                "dialogue_csv_path": task.dialogue_csv_path,
+                "flashcards_csv_path": task.flashcards_csv_path,
+                "latency_budget": task.latency_budget,
+                "dedup_key": task.dedup_key,
+                "trace_id": task.trace_id,
+                "parent_span_id": task.parent_span_id,
+                "created_at": task.created_at,
+            },
+        }
+
+    def _task_events(self, task: SummarizationTask) -> List[Dict[str, Any]]:
+        """Minimal event sequence that replays to the task's current state."""
+        events = [self._created_event(task)]
+        events.extend(
+            {"type": "alias", "task_id": alias, "primary": task.task_id}
+            for alias, primary_id in self._aliases.items() if primary_id == task.task_id)
+        events.extend(
+            {"type": "progress", "task_id": task.task_id, "progress": {
+                "stage": p.stage.value, "message": p.message, "timestamp": p.timestamp}}
+            for p in task.progress)
+        if task.checkpoint:
+            events.append({"type": "checkpoint", "task_id": task.task_id,
+                           "checkpoint": task.checkpoint})
+        events.append(self._status_event(task))
+        return events
+
+    @staticmethod
+    def _status_event(task: SummarizationTask) -> Dict[str, Any]:
+        return {
+            "type": "status",
+            "task_id": task.task_id,
+            "status": task.status.value,
+            "result": task.result,
+            "error": task.error,
+            "started_at": task.started_at,
+            "completed_at": task.completed_at,
+        }
+
+    def _record_progress(self, task: SummarizationTask, stage: TaskStage, message: str = "") -> None:
+        with self._lock:
+            task.add_progress(stage, message)
+            progress = task.progress[-1]
+            self._write_journal({"type": "progress", "task_id": task.task_id, "progress": {
+                "stage": progress.stage.value, "message": progress.message, "timestamp": progress.timestamp}})
+            self._changed.notify_all()
+
+    def _recover(self) -> None:
+        """Rebuild tasks from the journal and resume the unfinished ones."""
+        states = self._journal.replay()
+        cutoff_time = time.time() - self.task_retention_seconds
+        to_resume: List[str] = []
+
+        with self._lock:
+            for task_id, state in states.items():
+                status = TaskStatus(state["status"])
+                finished = status in [TaskStatus.COMPLETED, TaskStatus.FAILED]
+                if finished and (state.get("completed_at") or 0) < cutoff_time:
+                    continue
+
+                task = SummarizationTask(task_id=task_id, **state["task"])
+                task.progress = [
+                    TaskProgress(stage=TaskStage(p["stage"]),
+                                 message=p["message"], timestamp=p["timestamp"])
+                    for p in state["progress"]
+                ]
+                task.checkpoint = state["checkpoint"]
+                task.result = state.get("result")
+                task.error = state.get("error")
+                task.started_at = state.get("started_at")
+                task.completed_at = state.get("completed_at")
+                task.status = status if finished else TaskStatus.PENDING
+                if not finished:
+                    task.recovered_at = time.time()
+
+                self._tasks[task_id] = task
+                for alias in state["aliases"]:
+                    self._aliases[alias] = task_id
+                if not finished:
+                    self._inflight[task.dedup_key] = task_id
+                    to_resume.append(task_id)
+
+            # Compact: drop expired tasks and redundant events
+            self._journal.rewrite(
+                event for task in self._tasks.values() for event in self._task_events(task))
+
+        for task_id in to_resume:
+            self._record_progress(
+                self._tasks[task_id], TaskStage.INITIALIZING,
+                "Recovered after restart; resuming from last checkpoint with a fresh latency budget")
+            self._executor.submit(self._execute_task, task_id)
+
+    @staticmethod
+    def _dedup_key(dialogue: List[Dict], user_id: int, dialogue_csv_path: str, flashcards_csv_path: str) -> str:
+        payload = json.dumps(
+            [dialogue, user_id, dialogue_csv_path, flashcards_csv_path],
+            sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
     def get_task(self, task_id: str) -> Optional[SummarizationTask]:
-        """Get a task by ID."""
+        """Get a task by ID, following coalesced duplicates to their primary."""
         with self._lock:
-            return self._tasks.get(task_id)
+            return self._tasks.get(self._aliases.get(task_id, task_id))
 
-    def get_task_status(self, task_id: str) -> Optional[Dict]:
+    def get_metrics(self) -> Dict[str, Any]:
+        """Task counts and coalescing statistics."""
+        with self._lock:
+            by_status: Dict[str, int] = {}
+            for task in self._tasks.values():
+                by_status[task.status.value] = by_status.get(
+                    task.status.value, 0) + 1
+            return {
+                "tasks": len(self._tasks),
+                "by_status": by_status,
+                "in_flight": len(self._inflight),
+                "coalesced_tasks": self._coalesced_count,
+                "aliases": len(self._aliases),
+                "pool_size": self.max_workers,
+                "concurrency": self._concurrency.get_stats(),
+            }
+
+    def get_task_version(self, task_id: str) -> Optional[str]:
+        """
+        Opaque version token for a task's status, without building it.
+
+        The token changes whenever the status, result or progress changes, so
+        callers can answer conditional requests before serializing anything.
+        """
+        task = self.get_task(task_id)
+        if not task:
+            return None
+        return f"{self._epoch}.{task.version}"
+
+    def get_task_status(self, task_id: str, since: int = 0) -> Optional[Dict]:
         """
         Get the current status and progress of a task.
 
+        Args:
+            task_id: Task identifier
+            since: Number of progress entries the caller already has; only
+                later entries are returned
+
         Returns:
             Dictionary with task status, progress, and results
         """
@@ -147,26 +363,33 @@ class TaskManager:
         if not task:
             return None
 
-        return {
-            "task_id": task.task_id,
-            "status": task.status.value,
-            "current_stage": task.get_current_stage().value,
-            "progress_count": task.get_stage_progress_count(),
-            "total_stages": len(TaskStage),
-            "result": task.result,
-            "error": task.error,
-            "created_at": task.created_at,
-            "started_at": task.started_at,
-            "completed_at": task.completed_at,
-            "progress": [
-                {
-                    "stage": p.stage.value,
-                    "message": p.message,
-                    "timestamp": p.timestamp
-                }
-                for p in task.progress
-            ]
-        }
+        with self._lock:
+            status = {
+                "task_id": task_id,
+                "status": task.status.value,
+                "current_stage": task.get_current_stage().value,
+                "progress_count": task.get_stage_progress_count(),
+                "total_stages": len(TaskStage),
+                "result": task.result,
+                "error": task.error,
+                "created_at": task.created_at,
+                "started_at": task.started_at,
+                "completed_at": task.completed_at,
+                "version": f"{self._epoch}.{task.version}",
+                "progress": [
+                    {
+                        "stage": p.stage.value,
+                        "message": p.message,
+                        "timestamp": p.timestamp
+                    }
+                    for p in task.progress[since:]
+                ]
+            }
+        if since:
+            status["progress_since"] = since
+        if task_id != task.task_id:
+            status["coalesced_into"] = task.task_id
+        return status
 
     def wait_for_completion(self, task_id: str, timeout: float = 300) -> Optional[Dict]:
         """
@@ -179,19 +402,24 @@ class TaskManager:
         Returns:
             Final task status or None if task not found
         """
-        start_time = time.time()
+        deadline = time.time() + timeout
+
+        with self._changed:
+            while True:
+                task = self.get_task(task_id)
+                if not task:
+                    return None
 
-        while time.time() - start_time < timeout:
-            task = self.get_task(task_id)
-            if not task:
-                return None
+                if task.status in [TaskStatus.COMPLETED, TaskStatus.FAILED]:
+                    break
 
-            if task.status in [TaskStatus.COMPLETED, TaskStatus.FAILED]:
-                return self.get_task_status(task_id)
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
 
-            time.sleep(0.5)  # Poll every 500ms
+                # Park without polling until the task reports a change
+                self._changed.wait(remaining)
 
-        # Timeout reached
         return self.get_task_status(task_id)
 
     def _execute_task(self, task_id: str):
@@ -200,20 +428,52 @@ class TaskManager:
         if not task:
             return
 
+        # Tasks created outside a request trace under their own id
+        trace_id = task.trace_id or task.task_id
+        # Executor backlog counts as queueing too; a recovered task has been
+        # queued only since the restart, not through the downtime
+        queued = task.recovered_at or task.created_at
+
+        # Wait for a slot in the adaptive window; the task stays pending meanwhile
+        self._concurrency.acquire()
+        try:
+            tracer.record("task.queue_wait", queued, time.time(), trace_id,
+                          task.parent_span_id, task_id=task.task_id)
+            with tracer.span("task.run", trace_id, task.parent_span_id,
+                             task_id=task.task_id, user_id=task.user_id) as span:
+                self._run_task(task)
+                span.set(status=task.status.value)
+        finally:
+            self._concurrency.release()
+
+    def _run_task(self, task: SummarizationTask):
         try:
             with self._lock:
                 task.status = TaskStatus.RUNNING
                 task.started_at = time.time()
-                task.add_progress(TaskStage.INITIALIZING,
-                                  "Starting summarization process")
+                self._write_journal(self._status_event(task))
+                self._record_progress(task, TaskStage.INITIALIZING,
+                                      "Starting summarization process")
 
             # Import the summarization function here to avoid circular imports
             from .cli import summarize_dialogue_async
 
             # Create progress callback
             def progress_callback(stage: TaskStage, message: str = ""):
+                self._record_progress(task, stage, message)
+
+            # summarize_dialogue_async merges updates into task.checkpoint itself
+            def checkpoint_callback(update: Dict[str, Any]):
                 with self._lock:
-                    task.add_progress(stage, message)
+                    self._write_journal(
+                        {"type": "checkpoint", "task_id": task.task_id, "checkpoint": update})
+
+            # The budget counts from when this run started, so neither time
+            # queued behind other tasks nor downtime before a recovered task
+            # resumes eats into it
+            deadline = None
+            if task.latency_budget is not None:
+                deadline = task.started_at + task.latency_budget
 
             # Execute the actual summarization
             result = summarize_dialogue_async(
@@ -221,21 +481,33 @@ class TaskManager:
                 task.user_id,
                 task.dialogue_csv_path,
                 task.flashcards_csv_path,
-                progress_callback
+                progress_callback,
+                deadline,
+                task.checkpoint,
+                checkpoint_callback
             )
 
             with self._lock:
                 task.status = TaskStatus.COMPLETED
                 task.result = result
                 task.completed_at = time.time()
-                task.add_progress(TaskStage.COMPLETED,
-                                  f"Summary completed: {result}")
+                self._record_progress(task, TaskStage.COMPLETED,
+                                      f"Summary completed: {result}")
+                self._write_journal(self._status_event(task))
 
         except Exception as e:
             with self._lock:
                 task.status = TaskStatus.FAILED
                 task.error = str(e)
                 task.completed_at = time.time()
+                task.version += 1
+                self._write_journal(self._status_event(task))
+                self._changed.notify_all()
+
+        finally:
+            with self._lock:
+                if self._inflight.get(task.dedup_key) == task.task_id:
+                    del self._inflight[task.dedup_key]
 
     def _cleanup_old_tasks(self):
         """Background thread to clean up old completed tasks."""
@@ -255,6 +527,16 @@ class TaskManager:
                     for task_id in task_ids_to_remove:
                         del self._tasks[task_id]
 
+                    removed = set(task_ids_to_remove)
+                    for alias, primary_id in list(self._aliases.items()):
+                        if primary_id in removed:
+                            del self._aliases[alias]
+
+                    if removed and self._journal is not None:
+                        self._journal.rewrite(
+                            event for task in self._tasks.values()
+                            for event in self._task_events(task))
+
                 time.sleep(300)  # Clean up every 5 minutes
 
             except Exception:
@@ -264,7 +546,65 @@ class TaskManager:
     def shutdown(self):
         """Shutdown the task manager and cleanup resources."""
         self._executor.shutdown(wait=True)
+        if self._journal is not None:
+            self._journal.close()
+
+
+def _default_journal() -> Optional[TaskJournal]:
+    base_dir = os.path.abspath(os.path.join(
+        os.path.dirname(__file__), "..", "..", "..", "..", ".."))
+    path = os.getenv("TASK_JOURNAL_PATH", os.path.join(
+        base_dir, "data", "task_journal.jsonl"))
+    if not path:
+        return None
+    # Each worker process owns a slot of its own; see TaskJournal.claim
+    return TaskJournal.claim(path, fsync=os.getenv("TASK_JOURNAL_FSYNC", "0") == "1")
+
+
+_task_manager: Optional[TaskManager] = None
+_task_manager_pid: Optional[int] = None
+_task_manager_lock = threading.Lock()
+
+
+def get_task_manager() -> TaskManager:
+    """
+    Process-wide task manager, created on first use.
+
+    Construction starts the executor and cleanup thread and replays the
+    journal, so it must happen in the process that serves requests: with
+    gunicorn preload_app the master imports the app and each worker gets its
+    own manager after fork instead of inheriting dead threads.
+    """
+    global _task_manager, _task_manager_pid
+    pid = os.getpid()
+    if _task_manager is None or _task_manager_pid != pid:
+        with _task_manager_lock:
+            if _task_manager is None or _task_manager_pid != pid:
+                _task_manager = TaskManager(journal=_default_journal())
+                _task_manager_pid = pid
+    return _task_manager
+
+
+def shutdown_task_manager() -> None:
+    """Shut down this process's manager if one was ever started."""
+    if _task_manager is not None and _task_manager_pid == os.getpid():
+        _task_manager.shutdown()
+
+
+def _reset_after_fork() -> None:
+    # The parent's lock may have been held mid-fork; threads did not survive
+    global _task_manager, _task_manager_pid, _task_manager_lock
+    _task_manager_lock = threading.Lock()
+    _task_manager = None
+    _task_manager_pid = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
 
 
-# Global task manager instance
-task_manager = TaskManager()
+def __getattr__(name: str):
+    # Backwards compatible `from .task_manager import task_manager`
+    if name == "task_manager":
+        return get_task_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,96 @@
+from __future__ import annotations
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List
+
+# One profile at a time per process; concurrent runs would skew each other
+profile_lock = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(duration: float, interval: float = 0.01) -> Dict[str, int]:
+    """
+    Sample every other thread's Python stack for `duration` seconds.
+
+    Returns:
+        {collapsed stack: samples}, where a collapsed stack is the thread
+        name followed by frames root-first, separated by ";" (the input
+        format of flamegraph.pl and speedscope)
+    """
+    own = threading.get_ident()
+    names = {}
+    counts: Counter = Counter()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        frames = sys._current_frames()
+        if len(names) != len(frames):
+            names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in frames.items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return dict(counts)
+
+
+def collapsed(counts: Dict[str, int]) -> str:
+    return "".join(f"{stack} {n}\n" for stack, n in
+                   sorted(counts.items(), key=lambda kv: -kv[1]))
+
+
+def allocation_diff(duration: float, top: int = 25, frames: int = 1) -> Dict[str, Any]:
+    """
+    Compare tracemalloc snapshots taken `duration` seconds apart.
+
+    Tracing is switched on only for the measurement window (unless it was
+    already running), so the allocator carries no overhead otherwise.
+    """
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(frames)
+    try:
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ]
+        before = tracemalloc.take_snapshot().filter_traces(filters)
+        time.sleep(duration)
+        after = tracemalloc.take_snapshot().filter_traces(filters)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+
+    key_type = "traceback" if frames > 1 else "lineno"
+    stats = after.compare_to(before, key_type)[:top]
+    rows: List[Dict[str, Any]] = [
+        {
+            "location": [f"{f.filename}:{f.lineno}" for f in stat.traceback],
+            "size_diff": stat.size_diff,
+            "size": stat.size,
+            "count_diff": stat.count_diff,
+            "count": stat.count,
+        }
+        for stat in stats
+    ]
+    return {
+        "seconds": duration,
+        "traced_current": current,
+        "traced_peak": peak,
+        # When true, only allocations made during the window were seen
+        "tracing_started_for_window": started_here,
+        "top": rows,
+    }
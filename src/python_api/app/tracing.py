@@ -0,0 +1,235 @@
+from __future__ import annotations
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+@dataclass
+class Span:
+    """One timed operation within a trace."""
+    trace_id: str
+    name: str
+    span_id: str = field(default_factory=_new_id)
+    parent_id: Optional[str] = None
+    start: float = field(default_factory=time.time)
+    end: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self.end is None:
+            return None
+        return round((self.end - self.start) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class SpanCollector:
+    """
+    In-process store of finished spans, grouped by trace, with optional
+    JSON-lines export for offline analysis.
+
+    Only the most recent max_traces traces are kept in memory. Any span
+    carrying a task_id attribute also makes its trace reachable by that id.
+    """
+
+    def __init__(self, max_traces: int = 200, export_path: Optional[str] = None):
+        self.max_traces = max_traces
+        self.export_path = export_path
+        self._traces: "OrderedDict[str, List[Span]]" = OrderedDict()
+        self._by_task: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        if export_path:
+            os.makedirs(os.path.dirname(
+                os.path.abspath(export_path)), exist_ok=True)
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = []
+            spans.append(span)
+            self._traces.move_to_end(span.trace_id)
+            task_id = span.attributes.get("task_id")
+            if task_id:
+                self._by_task[task_id] = span.trace_id
+            while len(self._traces) > self.max_traces:
+                evicted, _ = self._traces.popitem(last=False)
+                self._by_task = {t: tr for t, tr in self._by_task.items()
+                                 if tr != evicted}
+
+            if self.export_path:
+                try:
+                    with open(self.export_path, "a", encoding="utf-8") as fh:
+                        fh.write(json.dumps(span.to_dict(),
+                                 ensure_ascii=False, default=str) + "\n")
+                except OSError:
+                    logger.exception("Failed to export span")
+
+    def get_trace(self, trace_or_task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Spans of one trace with a per-name latency breakdown.
+
+        Returns:
+            {"trace_id", "duration_ms", "spans", "breakdown"} or None
+        """
+        with self._lock:
+            trace_id = self._by_task.get(trace_or_task_id, trace_or_task_id)
+            spans = list(self._traces.get(trace_id, ()))
+        if not spans:
+            return None
+
+        spans.sort(key=lambda s: s.start)
+        breakdown: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"count": 0, "total_ms": 0.0})
+        for span in spans:
+            entry = breakdown[span.name]
+            entry["count"] += 1
+            entry["total_ms"] = round(
+                entry["total_ms"] + (span.duration_ms or 0.0), 3)
+        end = max(s.end or s.start for s in spans)
+        return {
+            "trace_id": trace_id,
+            "duration_ms": round((end - spans[0].start) * 1000, 3),
+            "spans": [s.to_dict() for s in spans],
+            "breakdown": dict(breakdown),
+        }
+
+    def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Newest traces first, summarized by their root span."""
+        with self._lock:
+            traces = list(self._traces.items())[-limit:][::-1]
+        summaries = []
+        for trace_id, spans in traces:
+            root = min(spans, key=lambda s: s.start)
+            summaries.append({
+                "trace_id": trace_id,
+                "root": root.name,
+                "start": root.start,
+                "spans": len(spans),
+            })
+        return summaries
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "current_span", default=None)
+
+
+class Tracer:
+    """
+    Creates spans that nest through contextvars.
+
+    A span started while another is current becomes its child. Work handed
+    to another thread keeps its parent either by running in a copied context
+    (contextvars.copy_context().run) or by passing trace_id/parent_id
+    explicitly, as the task manager does for queued tasks.
+    """
+
+    def __init__(self, collector: SpanCollector):
+        self.collector = collector
+
+    @staticmethod
+    def current() -> Optional[Span]:
+        return _current_span.get()
+
+    def start_span(
+        self,
+        name: str,
+        trace_id: Optional[str] = None,
+        parent_id: Optional[str] = None,
+        **attributes: Any
+    ) -> Tuple[Span, contextvars.Token]:
+        """Open a span and make it current; pair with end_span()."""
+        parent = _current_span.get()
+        if trace_id is None and parent is not None:
+            trace_id = parent.trace_id
+            parent_id = parent.span_id
+        span = Span(trace_id=trace_id or _new_id(), name=name,
+                    parent_id=parent_id, attributes=attributes)
+        return span, _current_span.set(span)
+
+    def end_span(self, span: Span, token: contextvars.Token, error: Optional[BaseException] = None) -> None:
+        span.end = time.time()
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Ended from a different context (e.g. a response streamed later)
+            pass
+        self.collector.export(span)
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        trace_id: Optional[str] = None,
+        parent_id: Optional[str] = None,
+        **attributes: Any
+    ) -> Iterator[Span]:
+        span, token = self.start_span(name, trace_id, parent_id, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, token, e)
+            raise
+        self.end_span(span, token)
+
+    def record(
+        self,
+        name: str,
+        start: float,
+        end: float,
+        trace_id: Optional[str] = None,
+        parent_id: Optional[str] = None,
+        **attributes: Any
+    ) -> Span:
+        """Export a span measured after the fact, e.g. time spent queued."""
+        parent = _current_span.get()
+        if trace_id is None and parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        span = Span(trace_id=trace_id or _new_id(), name=name, parent_id=parent_id,
+                    start=start, end=end, attributes=attributes)
+        self.collector.export(span)
+        return span
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+
+# Global tracer; set TRACE_EXPORT_PATH to also append every span to a JSON-lines file
+tracer = Tracer(SpanCollector(
+    max_traces=int(os.getenv("TRACE_MAX_TRACES", "200")),
+    export_path=os.getenv("TRACE_EXPORT_PATH") or None,
+))
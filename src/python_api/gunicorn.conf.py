@@ -1,6 +1,34 @@
+import os
 import multiprocessing
+import time
 
-bind = "0.0.0.0:8081"
-workers = 1
-threads = 1
-timeout = 60
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8081")
+
+# gthread parks each long-poll on its own lightweight thread while the worker
+# keeps heartbeating the arbiter, so /wait-summary no longer trips `timeout`
+# and /health and /flashcards stay responsive. "gevent" also works if installed.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+
+# Tasks live in process memory, so keep a single worker unless tasks are
+# shared across processes.
+workers = int(os.getenv("GUNICORN_WORKERS", "1"))
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Import the app once in the master and fork workers from it. Importing the
+# app is cheap (heavy SDKs load lazily) and starts no threads, so forking is
+# safe; each worker then loads openai/pydantic/numpy and starts its own task
+# manager in post_fork, before it accepts requests.
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+
+def post_fork(server, worker):
+    from app import warm_up
+
+    started = time.perf_counter()
+    warm_up()
+    server.log.info("Worker %s warmed up in %.0f ms", worker.pid,
+                    (time.perf_counter() - started) * 1000)
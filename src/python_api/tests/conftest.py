@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing the app needs a key; no test talks to OpenAI
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ["TASK_JOURNAL_PATH"] = ""
+
+
+@pytest.fixture(autouse=True)
+def _workdir(tmp_path, monkeypatch):
+    # Agents log to ./logs; keep that out of the source tree
+    monkeypatch.chdir(tmp_path)
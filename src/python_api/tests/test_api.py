@@ -0,0 +1,54 @@
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.delenv("APP_TOKEN", raising=False)
+    return app_module.create_app().test_client()
+
+
+@pytest.mark.parametrize("limit", ["abc", "1.5", ""])
+def test_traces_rejects_a_non_integer_limit(client, limit):
+    response = client.get(f"/api/v1/traces?limit={limit}")
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "BadRequest"
+
+
+def test_traces_clamps_the_limit(client):
+    assert client.get("/api/v1/traces?limit=100000").status_code == 200
+
+
+@pytest.fixture
+def admin_client(monkeypatch):
+    monkeypatch.setenv("PROFILING_ENABLED", "1")
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    client = app_module.create_app().test_client()
+    client.environ_base["HTTP_X_ADMIN_TOKEN"] = "secret"
+    return client
+
+
+@pytest.mark.parametrize("query", [
+    "cpu?seconds=abc",
+    "cpu?seconds=nan",
+    "cpu?interval_ms=fast",
+    "cpu?interval_ms=inf",
+    "memory?seconds=",
+    "memory?top=ten",
+    "memory?frames=2.5",
+])
+def test_profiling_rejects_malformed_parameters(admin_client, query):
+    response = admin_client.get(f"/api/v1/admin/profile/{query}")
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "BadRequest"
+
+
+def test_profiling_clamps_parameters(admin_client):
+    response = admin_client.get("/api/v1/admin/profile/cpu?seconds=-5&interval_ms=0")
+    assert response.status_code == 200
+    response = admin_client.get("/api/v1/admin/profile/memory?seconds=0&top=100000&frames=-1")
+    assert response.status_code == 200
+    report = response.get_json()
+    assert report["seconds"] == pytest.approx(0.1, abs=0.05)
+    assert all(len(row["location"]) == 1 for row in report["top"])
@@ -0,0 +1,108 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.domain.summarization.batching import BatchBackend, BatchItemError, BatchRequest, MicroBatcher
+from app.domain.summarization.resilience import CallPolicy, ResilientCaller
+from app.domain.summarization.singleflight import SingleFlight
+
+
+def test_single_flight_runs_concurrent_calls_once():
+    flight = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def fn():
+        runs.append(1)
+        release.wait(5)
+        return "card"
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(flight.do, "markov_chain", fn) for _ in range(4)]
+        while flight.get_stats()["coalesced"] < 3:
+            time.sleep(0.01)
+        release.set()
+        assert [f.result() for f in futures] == ["card"] * 4
+    assert len(runs) == 1
+    assert flight.get_stats() == {"executions": 1, "coalesced": 3, "in_flight": 0}
+
+
+def test_single_flight_shares_the_error_then_runs_again():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise ValueError("upstream down")
+
+    with ThreadPoolExecutor(2) as pool:
+        futures = [pool.submit(flight.do, "k", failing) for _ in range(2)]
+        while flight.get_stats()["coalesced"] < 1:
+            time.sleep(0.01)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+    assert flight.do("k", lambda: "ok") == "ok"
+
+
+class FakeBackend(BatchBackend):
+    """Echoes each input; "bad" inputs get no output, "boom" fails the call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def request(self, requests, timeout):
+        users = [r.user for r in requests]
+        self.calls.append(users)
+        if "boom" in users:
+            raise RuntimeError("upstream rejected the batch")
+        return users
+
+    def split(self, response, requests):
+        return [BatchItemError("no output") if user == "bad" else [user.upper()]
+                for user in response]
+
+
+def _batcher(backend):
+    caller = ResilientCaller({"gen.batch": CallPolicy(max_retries=0, hedge=False)}, hedge_workers=1)
+    return MicroBatcher(backend, window_ms=100, max_batch=8, caller=caller)
+
+
+def _run_together(batcher, users):
+    requests = [BatchRequest(stage="gen", client=None, model="m", system="s", user=u, schema=dict)
+                for u in users]
+    with ThreadPoolExecutor(len(requests)) as pool:
+        return list(pool.map(batcher.run, requests))
+
+
+def test_micro_batch_packs_concurrent_requests_into_one_call():
+    backend = FakeBackend()
+    batcher = _batcher(backend)
+    assert _run_together(batcher, ["a", "b", "c"]) == [["A"], ["B"], ["C"]]
+    assert len(backend.calls) == 1
+    assert batcher.get_stats()["batched_requests"] == 3
+
+
+def test_micro_batch_falls_back_per_item():
+    backend = FakeBackend()
+    batcher = _batcher(backend)
+    # Only the request without a valid output is sent again on its own
+    assert _run_together(batcher, ["a", "bad"]) == [["A"], None]
+    assert batcher.get_stats()["item_failures"] == 1
+
+
+def test_micro_batch_failure_sends_every_request_alone():
+    backend = FakeBackend()
+    batcher = _batcher(backend)
+    assert _run_together(batcher, ["a", "boom"]) == [None, None]
+    assert batcher.get_stats()["batch_failures"] == 1
+
+
+def test_a_lone_request_is_not_batched():
+    backend = FakeBackend()
+    batcher = _batcher(backend)
+    assert _run_together(batcher, ["a"]) == [None]
+    assert backend.calls == []
@@ -0,0 +1,54 @@
+import pytest
+
+from app.domain.flashcard.concepts import ConceptRegistry, concept_key, spelling_similarity
+
+KNOWN = [
+    "markov_chain", "eigenvector", "gradient_descent", "maximum_likelihood",
+    "backpropagation", "correlation", "variance", "bayesian_inference",
+    "l1_regularization", "type_i_error", "entropy",
+]
+
+
+@pytest.fixture
+def registry():
+    registry = ConceptRegistry()
+    for concept in KNOWN:
+        registry.add(concept)
+    return registry
+
+
+@pytest.mark.parametrize("typo, expected", [
+    ("markov_chian", "markov_chain"),
+    ("eigen_vector", "eigenvector"),
+    ("gradient_decsent", "gradient_descent"),
+    ("maximum_likelyhood", "maximum_likelihood"),
+    ("back_propogation", "backpropagation"),
+    ("corelation", "correlation"),
+    ("Markov chians", "markov_chain"),
+])
+def test_typos_match_their_concept(registry, typo, expected):
+    match = registry.match(typo)
+    assert match is not None and match[0] == expected
+    assert match[1] >= registry.threshold
+
+
+@pytest.mark.parametrize("concept", [
+    "l2_regularization",
+    "type_ii_error",
+    "covariance",
+    "bayesian_interference",
+    "enthalpy",
+])
+def test_different_concepts_do_not_match(registry, concept):
+    assert registry.match(concept) is None
+
+
+def test_canonical_needs_an_exact_key(registry):
+    assert registry.canonical("Markov chains") == "markov_chain"
+    assert registry.canonical("markov_chian") is None
+
+
+def test_spelling_similarity():
+    assert spelling_similarity("eigen_vector", "eigenvector") == 1.0
+    assert spelling_similarity(concept_key("gradient_decsent"), "descent_gradient") == pytest.approx(1 - 1 / 15)
+    assert spelling_similarity("l1_norm", "l2_norm") == 0.0
@@ -0,0 +1,73 @@
+import csv
+import multiprocessing
+
+from app.domain.history.index import CsvOffsetIndex
+
+
+def _row(i, user=1):
+    return {"concept": f"c{i}", "question": "q", "user_id": user, "timestamp": 1000 + i}
+
+
+def _sidecar_offsets(index):
+    with open(index.idx_path, encoding="utf-8", newline="") as fh:
+        fh.readline()
+        return [int(entry[0]) for entry in csv.reader(fh)]
+
+
+def test_two_indexes_on_one_csv_persist_each_row_once(tmp_path):
+    path = str(tmp_path / "history.csv")
+    writer, reader = CsvOffsetIndex(path), CsvOffsetIndex(path)
+
+    for i in range(3):
+        writer.append_row(_row(i))
+        # The reader scans the same appended bytes the writer already indexed
+        assert len(reader) == i + 1
+    writer.append_rows([_row(3), _row(4)])
+    assert len(reader) == 5
+
+    offsets = _sidecar_offsets(writer)
+    assert offsets == sorted(set(offsets)) and len(offsets) == 5
+    fresh = CsvOffsetIndex(path)
+    assert len(fresh) == 5
+    assert fresh.page(1, limit=10)[0] == [4, 3, 2, 1, 0]
+
+
+def _append_from_process(path, start, count):
+    index = CsvOffsetIndex(path)
+    for i in range(start, start + count):
+        index.append_row(_row(i, user=i % 2))
+        len(index)
+
+
+def test_concurrent_processes_leave_a_clean_sidecar(tmp_path):
+    path = str(tmp_path / "history.csv")
+    CsvOffsetIndex(path).append_row(_row(0))
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=_append_from_process, args=(path, 1 + 20 * n, 20)) for n in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    fresh = CsvOffsetIndex(path)
+    assert len(fresh) == 61
+    assert fresh.count(0) + fresh.count(1) == 61
+    assert len(set(_sidecar_offsets(fresh))) == len(_sidecar_offsets(fresh)) == 61
+    assert {row["concept"] for row in fresh.read_range(0, 61)} == {f"c{i}" for i in range(61)}
+
+
+def test_load_skips_duplicated_sidecar_entries(tmp_path):
+    path = str(tmp_path / "history.csv")
+    index = CsvOffsetIndex(path)
+    index.append_rows([_row(i) for i in range(3)])
+    # A sidecar written by several processes before entries were deduplicated
+    with open(index.idx_path, encoding="utf-8") as fh:
+        meta, *entries = fh.readlines()
+    with open(index.idx_path, "w", encoding="utf-8") as fh:
+        fh.writelines([meta] + entries + entries[1:])
+
+    fresh = CsvOffsetIndex(path)
+    assert len(fresh) == 3
+    assert fresh.page(1, limit=10)[0] == [2, 1, 0]
+    assert len(_sidecar_offsets(fresh)) == 3
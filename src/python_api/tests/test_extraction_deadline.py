@@ -0,0 +1,98 @@
+import time
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from app.domain.summarization.extraction.schemas import CriticOutput, RefinerOutput
+from app.domain.summarization.extraction.workflow import MultiAgentLatentExtractor
+from app.domain.summarization.resilience import CallPolicy, ResilientCaller
+
+DIALOGUE = [{"role": "student", "message": "Why is E[f(X)] >= f(E[X]) for convex f?"}]
+
+
+def _timeout_error():
+    # The request is only kept for error reporting
+    return openai.APITimeoutError(request=None)
+
+
+class FakeClient:
+    """Answers the generator, critics and refiner; `hang` names the stage that times out."""
+
+    def __init__(self, critic_scores, hang):
+        self.critic_scores = critic_scores
+        self.hang = hang
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._generate))
+        self.responses = SimpleNamespace(parse=self._parse)
+
+    def _generate(self, timeout, **kwargs):
+        content = '{"latent": "convex_functions", "argument": "Jensen needs convexity"}'
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    def _parse(self, model, text_format, timeout, **kwargs):
+        stage = "refiner" if text_format is RefinerOutput else f"critic.{model}"
+        if stage == self.hang:
+            # Like the SDK: wait out the attempt timeout, then give up
+            time.sleep(timeout)
+            raise _timeout_error()
+        if text_format is RefinerOutput:
+            return SimpleNamespace(output_parsed=RefinerOutput(latent="expectation"))
+        score = self.critic_scores[model]
+        verdict = "approve" if score >= 3 else "reject"
+        return SimpleNamespace(output_parsed=CriticOutput(verdict=verdict, score=score, critique="ok"))
+
+
+def _extractor(critic_scores, hang):
+    extractor = MultiAgentLatentExtractor(
+        fast_model="fast", strong_model="strong", borderline_scores=(),
+        verify_with_strong=True, max_refiner_loops=3)
+    client = FakeClient(critic_scores, hang)
+    # Retries allowed, quick estimates so a refinement loop is worth starting
+    caller = ResilientCaller({
+        stage: CallPolicy(timeout=30.0, deadline=60.0, max_retries=2, backoff_base=0.01,
+                          hedge=False, typical_latency=0.01)
+        for stage in ("generator", "critic", "refiner")
+    })
+    for agent in (extractor.generator, extractor.critic, extractor.strong_critic, extractor.refiner):
+        agent.client = client
+        agent.caller = caller
+    return extractor
+
+
+@pytest.mark.parametrize("hang, critic_scores, expected", [
+    # A fast acceptance is verified by the strong critic, which times out
+    ("critic.strong", {"fast": 4, "strong": 4}, "convex_functions"),
+    # Refinement starts, and the refiner times out
+    ("refiner", {"fast": 2, "strong": 2}, "convex_functions"),
+    # The refined latent is re-scored by the strong critic, which times out
+    ("critic.strong", {"fast": 2, "strong": 2}, "convex_functions"),
+])
+def test_stage_timing_out_at_the_deadline_keeps_best_so_far(hang, critic_scores, expected):
+    extractor = _extractor(critic_scores, hang)
+
+    latent = extractor.predict_with_progress(DIALOGUE, deadline=time.time() + 0.5)
+
+    assert latent == expected
+    assert extractor.last_stop_reason == "deadline"
+
+
+def test_caller_reports_budget_exhaustion_as_timeout_error():
+    caller = ResilientCaller({"x": CallPolicy(timeout=30.0, max_retries=3, backoff_base=0.01, hedge=False)})
+
+    def hang(timeout):
+        time.sleep(timeout)
+        raise _timeout_error()
+
+    with pytest.raises(TimeoutError) as info:
+        caller.call("x", hang, deadline=time.time() + 0.2)
+    assert isinstance(info.value.__cause__, openai.APITimeoutError)
+
+
+def test_caller_without_deadline_surfaces_upstream_error():
+    caller = ResilientCaller({"x": CallPolicy(timeout=0.05, max_retries=1, backoff_base=0.01, hedge=False)})
+
+    def fail(timeout):
+        raise _timeout_error()
+
+    with pytest.raises(openai.APITimeoutError):
+        caller.call("x", fail)
@@ -0,0 +1,98 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import textwrap
+
+from app.domain.summarization import cli
+from app.domain.summarization.journal import TaskJournal
+from app.domain.summarization.task_manager import TaskManager
+
+# Runs in a separate process that gets SIGKILLed mid-task
+_WORKER = textwrap.dedent("""
+    import json, sys, threading, time
+    from app.domain.summarization import cli
+    from app.domain.summarization.journal import TaskJournal
+    from app.domain.summarization.task_manager import TaskManager
+
+    hung = threading.Event()
+
+    def fake_summarize(dialogue, user_id, dialogue_csv, flashcards_csv,
+                       progress_callback, deadline, checkpoint, checkpoint_callback):
+        if dialogue[0]["message"] == "quick":
+            return "quick summary"
+        checkpoint.update({"latents": ["markov_chain"]})
+        checkpoint_callback({"latents": ["markov_chain"]})
+        hung.set()
+        time.sleep(3600)
+
+    cli.summarize_dialogue_async = fake_summarize
+    manager = TaskManager(journal=TaskJournal.claim(sys.argv[1]))
+    finished = manager.create_task([{"role": "user", "message": "quick"}])
+    manager.wait_for_completion(finished, timeout=10)
+    hung_id = manager.create_task([{"role": "user", "message": "slow"}])
+    alias = manager.create_task([{"role": "user", "message": "slow"}])
+    hung.wait(10)
+    print(json.dumps({"finished": finished, "hung": hung_id, "alias": alias}), flush=True)
+    time.sleep(3600)
+""")
+
+
+def test_tasks_resume_from_their_checkpoint_after_a_crash(tmp_path, monkeypatch):
+    path = str(tmp_path / "journal.jsonl")
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    worker = subprocess.Popen([sys.executable, "-c", _WORKER, path],
+                              stdout=subprocess.PIPE, env=env, text=True)
+    try:
+        ids = json.loads(worker.stdout.readline())
+    finally:
+        worker.send_signal(signal.SIGKILL)
+        worker.wait()
+    # A write torn by the crash
+    with open(path, "a", encoding="utf-8") as fh:
+        fh.write('{"type": "progress", "task_id": "')
+
+    resumed_with = []
+
+    def fake_summarize(dialogue, user_id, dialogue_csv, flashcards_csv,
+                       progress_callback, deadline, checkpoint, checkpoint_callback):
+        resumed_with.append(dict(checkpoint))
+        return "resumed summary"
+
+    monkeypatch.setattr(cli, "summarize_dialogue_async", fake_summarize)
+    manager = TaskManager(journal=TaskJournal.claim(path))
+    try:
+        status = manager.wait_for_completion(ids["alias"], timeout=10)
+        assert status["status"] == "completed"
+        assert status["result"] == "resumed summary"
+        assert status["coalesced_into"] == ids["hung"]
+        assert resumed_with == [{"latents": ["markov_chain"]}]
+        assert any("Recovered after restart" in p["message"] for p in status["progress"])
+
+        # Finished before the crash: served from the journal, not rerun
+        finished = manager.get_task_status(ids["finished"])
+        assert finished["status"] == "completed"
+        assert finished["result"] == "quick summary"
+    finally:
+        manager.shutdown()
+
+    # The compacted journal replays to the same outcome
+    journal = TaskJournal(path)
+    states = journal.replay()
+    journal.close()
+    assert states[ids["hung"]]["result"] == "resumed summary"
+    assert states[ids["hung"]]["aliases"] == [ids["alias"]]
+    assert states[ids["finished"]]["result"] == "quick summary"
+
+
+def test_live_worker_slots_are_not_shared(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    first = TaskJournal.claim(path)
+    second = TaskJournal.claim(path)
+    try:
+        assert first.path == path
+        assert second.path == path + ".1"
+    finally:
+        first.close()
+        second.close()